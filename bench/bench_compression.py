@@ -0,0 +1,83 @@
+"""
+Байты на проводе по эндпоинтам веб-интерфейса: без сжатия, с gzip и повторный
+запрос с If-None-Match. Настоящие обработчики за compression_middleware,
+nodes нод с точками каждые 5 с во временной nodes.db; состояние сервера
+(сессия, пользователь) заводится только в процессе бенчмарка.
+
+    python bench/bench_compression.py [nodes]
+"""
+import asyncio
+import os
+import secrets
+import sys
+import tempfile
+import time
+
+import aiohttp
+from aiohttp import web
+from aiohttp.test_utils import TestServer
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+# core.config требует токен и админа при импорте
+os.environ.setdefault("TG_BOT_TOKEN", "1:bench")
+os.environ.setdefault("TG_ADMIN_ID", "1")
+
+from core import nodes_db, server  # noqa: E402
+
+
+async def _fill(nodes):
+    now = int(time.time())
+    tokens = []
+    for i in range(nodes):
+        token = await nodes_db.create_node(f"node-{i}")
+        for t in range(now - nodes_db.HISTORY_WINDOW, now, 5):
+            nodes_db.queue_metric(token, {"cpu": (t + i) % 97 / 1.3, "ram": 40 + i % 50, "disk": 55.0,
+                                          "net_rx": t * 1375 + i, "net_tx": t * 311 + i}, t)
+        nodes_db.queue_heartbeat(token, f"10.0.{i // 256}.{i % 256}", {"cpu": 12.5, "ram": 43.1, "disk": 55.0})
+        tokens.append(token)
+    await nodes_db.flush_heartbeats()
+    return tokens
+
+
+async def run(nodes):
+    with tempfile.TemporaryDirectory() as tmp:
+        nodes_db.DB_PATH = os.path.join(tmp, "nodes.db")
+        await nodes_db.init_db()
+        tokens = await _fill(nodes)
+
+        session = secrets.token_hex(16)
+        server.ALLOWED_USERS.setdefault(server.ADMIN_USER_ID, "admins")
+        server.SERVER_SESSIONS[session] = {"id": server.ADMIN_USER_ID, "expires": time.time() + 600}
+        app = web.Application(middlewares=[server.compression_middleware])
+        app.router.add_get('/', server.handle_dashboard)
+        app.router.add_get('/settings', server.handle_settings_page)
+        app.router.add_get('/login', server.handle_login_page)
+        app.router.add_get('/api/nodes/list', server.handle_nodes_list_json)
+        app.router.add_get('/api/node/details', server.handle_node_details)
+        test_server = TestServer(app)
+        await test_server.start_server()
+        cases = [("/", True), ("/settings", True), ("/login", False), ("/api/nodes/list", True),
+                 (f"/api/node/details?token={tokens[0]}", True)]
+        print(f"{'endpoint':<18} {'identity':>9} {'gzip':>7} {'saved':>6} {'304':>5}")
+        try:
+            async with aiohttp.ClientSession(auto_decompress=False) as client:
+                for path, auth in cases:
+                    url = test_server.make_url(path)
+                    headers = {"Cookie": f"{server.COOKIE_NAME}={session}"} if auth else {}
+                    sizes = []
+                    for encoding in ("identity", "gzip"):
+                        async with client.get(url, headers={**headers, "Accept-Encoding": encoding}) as resp:
+                            sizes.append(len(await resp.read()))
+                            etag = resp.headers.get("ETag")
+                    async with client.get(url, headers={**headers, "If-None-Match": etag or ""}) as resp:
+                        repeat = f"{len(await resp.read())}" if resp.status == 304 else "-"
+                    name = path.split("?")[0]
+                    print(f"{name:<18} {sizes[0]:>9} {sizes[1]:>7} {1 - sizes[1] / sizes[0]:>6.0%} {repeat:>5}")
+        finally:
+            await test_server.close()
+            await nodes_db.close_db()
+
+
+if __name__ == "__main__":
+    asyncio.run(run(int(sys.argv[1]) if len(sys.argv) > 1 else 50))
@@ -0,0 +1,71 @@
+"""
+Загрузка GeoIP-базы и скорость поиска: lookup_local по случайным IPv4
+и lookup_country на попаданиях в кэш. Без аргумента — синтетическая база
+размером с DB-IP Lite (~300k диапазонов IPv4 и ~200k IPv6) во временном файле.
+
+    python bench/bench_geoip.py [path/to/geoip.csv[.gz]] [lookups]
+"""
+import asyncio
+import os
+import random
+import socket
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+# core.config требует токен и админа при импорте
+os.environ.setdefault("TG_BOT_TOKEN", "1:bench")
+os.environ.setdefault("TG_ADMIN_ID", "1")
+
+from core import geoip  # noqa: E402
+
+
+def _synthetic_db(path):
+    rnd = random.Random(1)
+    codes = [chr(65 + a) + chr(65 + b) for a in range(26) for b in range(26)][:250]
+    with open(path, "w") as f:
+        step = (1 << 32) // 300000
+        for i in range(300000):
+            f.write(f"{i * step},{(i + 1) * step - 1},{rnd.choice(codes)}\n")
+        base = 0x20010000 << 96
+        for i in range(200000):
+            f.write(f"{socket.inet_ntop(socket.AF_INET6, (base + (i << 80)).to_bytes(16, 'big'))},"
+                    f"{socket.inet_ntop(socket.AF_INET6, (base + ((i + 1) << 80) - 1).to_bytes(16, 'big'))},"
+                    f"{rnd.choice(codes)}\n")
+
+
+async def _cached(ips, lookups):
+    hot = ips[:1000]
+    for ip in hot:
+        await geoip.lookup_country(ip)
+    start = time.perf_counter()
+    for i in range(lookups):
+        await geoip.lookup_country(hot[i % 1000])
+    return time.perf_counter() - start
+
+
+def main(path, lookups):
+    with tempfile.TemporaryDirectory() as tmp:
+        if path is None:
+            path = os.path.join(tmp, "geoip.csv")
+            _synthetic_db(path)
+        start = time.perf_counter()
+        geoip.load(path)
+        print(f"load: {time.perf_counter() - start:.2f}s")
+
+    rnd = random.Random(2)
+    ips = [socket.inet_ntoa(rnd.getrandbits(32).to_bytes(4, "big")) for _ in range(lookups)]
+    start = time.perf_counter()
+    for ip in ips:
+        geoip.lookup_local(ip)
+    elapsed = time.perf_counter() - start
+    print(f"lookup_local IPv4: {lookups / elapsed:,.0f} lookups/s")
+
+    elapsed = asyncio.run(_cached(ips, lookups))
+    print(f"lookup_country (cache hits): {lookups / elapsed:,.0f} lookups/s")
+
+
+if __name__ == "__main__":
+    main(sys.argv[1] if len(sys.argv) > 1 else None, int(sys.argv[2]) if len(sys.argv) > 2 else 200000)
@@ -0,0 +1,75 @@
+"""
+Пропускная способность записи heartbeat: соединение на каждый вызов без WAL
+(как было) против общего соединения-писателя и буфера heartbeat_flusher.
+БД — временный файл.
+
+    python bench/bench_heartbeats.py [nodes] [heartbeats] [concurrency]
+"""
+import asyncio
+import json
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+
+import aiosqlite
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+# core.config требует токен и админа при импорте
+os.environ.setdefault("TG_BOT_TOKEN", "1:bench")
+os.environ.setdefault("TG_ADMIN_ID", "1")
+
+from core import nodes_db  # noqa: E402
+
+STATS = {"cpu": 12.5, "ram": 40.0, "disk": 55.0, "net_rx": 1 << 30, "net_tx": 1 << 29}
+
+
+async def _run(label, beat, tokens, heartbeats, concurrency):
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one(i):
+        async with semaphore:
+            await beat(tokens[i % len(tokens)])
+    start = time.perf_counter()
+    await asyncio.gather(*(one(i) for i in range(heartbeats)))
+    await nodes_db.flush_heartbeats()
+    elapsed = time.perf_counter() - start
+    print(f"{label}: {heartbeats / elapsed:,.0f} heartbeats/s")
+
+
+async def main(nodes, heartbeats, concurrency):
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = nodes_db.DB_PATH = os.path.join(tmp, "nodes.db")
+
+        async def connect_per_call(token):
+            # Прежняя схема: новое соединение, запись и fsync на каждый heartbeat
+            async with aiosqlite.connect(db_path, timeout=30) as db:
+                await db.execute("UPDATE nodes SET last_seen = ?, ip = ?, stats = ? WHERE token = ?",
+                                 (time.time(), "127.0.0.1", json.dumps(STATS), token))
+                await db.commit()
+
+        async def pooled(token):
+            await nodes_db.update_node_heartbeat(token, "127.0.0.1", STATS)
+
+        async def buffered(token):
+            nodes_db.queue_heartbeat(token, "127.0.0.1", STATS)
+
+        await nodes_db.init_db()
+        tokens = [await nodes_db.create_node(f"bench-{i}") for i in range(nodes)]
+        await nodes_db.close_db()
+        # Прежняя схема работала без WAL
+        with sqlite3.connect(db_path) as conn:
+            conn.execute("PRAGMA journal_mode=DELETE")
+        await _run("connect per call", connect_per_call, tokens, heartbeats, concurrency)
+        try:
+            await _run("pooled writer, transaction per heartbeat", pooled, tokens, heartbeats, concurrency)
+            await _run("pooled writer, buffered (heartbeat_flusher)", buffered, tokens, heartbeats, concurrency)
+        finally:
+            await nodes_db.close_db()
+
+
+if __name__ == "__main__":
+    args = [int(a) for a in sys.argv[1:4]]
+    asyncio.run(main(*args, *[200, 2000, 50][len(args):]))
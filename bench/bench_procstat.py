@@ -0,0 +1,52 @@
+"""
+Стоимость одного замера procstat против psutil (psutil нужен только здесь,
+на нодах он не ставится).
+
+    python bench/bench_procstat.py [iterations]
+"""
+import os
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import procstat  # noqa: E402
+
+try:
+    import psutil
+except ImportError:
+    sys.exit("psutil is required for this benchmark: pip install psutil")
+
+
+def bench(fn, iterations):
+    fn()
+    start = time.perf_counter()
+    for _i in range(iterations):
+        fn()
+    return (time.perf_counter() - start) / iterations * 1e6
+
+
+def main(iterations):
+    meter = procstat.CpuMeter()
+    cases = [
+        ("cpu per-core", meter.measure, lambda: psutil.cpu_percent(interval=None, percpu=True)),
+        ("memory", procstat.memory, psutil.virtual_memory),
+        ("net per-iface", procstat.net_io, lambda: psutil.net_io_counters(pernic=True)),
+        ("net totals", procstat.net_totals, psutil.net_io_counters),
+        ("disk io", procstat.disk_io, lambda: psutil.disk_io_counters(perdisk=True)),
+        ("loadavg", procstat.load_avg, psutil.getloadavg),
+        ("disk usage", procstat.disk_usage, lambda: psutil.disk_usage("/")),
+    ]
+    print(f"{'metric':<14} {'procstat, us':>13} {'psutil, us':>11} {'speedup':>8}")
+    total_own = total_ps = 0.0
+    for name, own, ps in cases:
+        t_own, t_ps = bench(own, iterations), bench(ps, iterations)
+        total_own += t_own
+        total_ps += t_ps
+        print(f"{name:<14} {t_own:>13.1f} {t_ps:>11.1f} {t_ps / t_own:>7.1f}x")
+    print(f"{'all':<14} {total_own:>13.1f} {total_ps:>11.1f} {total_ps / total_own:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 2000)
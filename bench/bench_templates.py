@@ -0,0 +1,66 @@
+"""
+Время рендера страниц веб-интерфейса: кэш скомпилированных шаблонов
+против старого пути (чтение файла и replace по каждому полю на каждый запрос).
+
+    python bench/bench_templates.py [iterations]
+"""
+import json
+import os
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+# core.config требует токен и админа при импорте
+os.environ.setdefault("TG_BOT_TOKEN", "1:bench")
+os.environ.setdefault("TG_ADMIN_ID", "1")
+
+from core import assets, server  # noqa: E402
+
+
+def bench(fn, iterations):
+    fn()
+    start = time.perf_counter()
+    for _i in range(iterations):
+        fn()
+    return (time.perf_counter() - start) / iterations * 1e6
+
+
+def main(iterations):
+    lang = server.DEFAULT_LANGUAGE
+    user = "<span>User</span>"
+    cases = [
+        ("dashboard", "dashboard.html", server._dashboard_static, None, {
+            "role_badge": user, "user_avatar": user, "user_name": "User", "nodes_count": "12",
+            "active_nodes": "11", "admin_controls_html": user * 20, "node_action_btn": user * 4}),
+        ("settings", "settings.html", server._settings_static, None, {
+            "user_name": "User", "user_avatar": user, "users_data_json": "[]", "nodes_data_json": "[]",
+            "keyboard_config_json": json.dumps(server.KEYBOARD_CONFIG), "val_cpu": "90", "val_ram": "90",
+            "val_disk": "90", "val_traffic": "5", "val_timeout": "30", "check_resources": "checked",
+            "check_logins": "", "check_bans": "", "check_downtime": "checked"}),
+        ("login", "login.html", server._public_page_static, server._inject_i18n_script, {
+            "default_pass_alert": "", "bot_username": "bot"}),
+    ]
+
+    print(f"{'page':<10} {'replace, us':>12} {'cached, us':>11} {'speedup':>8}")
+    for page, name, static_fn, transform, context in cases:
+        # Старый путь: файл читается на каждый запрос, поля подставляются по одному
+        fields = {**static_fn(lang), **context}
+
+        def replace_render():
+            html = assets.rewrite_static_refs(server.load_template(name), server.CACHE_VER)
+            if transform:
+                html = transform(html)
+            for key, value in fields.items():
+                html = html.replace("{" + key + "}", value)
+            return html
+
+        def cached_render():
+            return server.render_template(name, lang, static_fn, context, transform=transform)
+
+        t_old, t_new = bench(replace_render, iterations), bench(cached_render, iterations)
+        print(f"{page:<10} {t_old:>12.1f} {t_new:>11.1f} {t_old / t_new:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 2000)
@@ -7,15 +7,17 @@ from modules import (
 from core.i18n import _, I18nFilter, get_language_keyboard
 from core import i18n
 from core import config, shared_state, auth, utils, keyboards, messaging
-from core import nodes_db, server
+from core import nodes_db, rollups, server, sampler, geoip, digest
 import asyncio
 import logging
 import signal
 import os
 import psutil
+import procstat
 
 if os.path.isdir("/proc_host"):
     psutil.PROCFS_PATH = "/proc_host"
+procstat.set_path_resolver(utils.get_host_path)
 
 from aiogram import Bot, Dispatcher, types, F
 from aiogram.types import KeyboardButton
@@ -257,6 +259,9 @@ async def shutdown(dispatcher: Dispatcher, bot_instance: Bot, web_runner=None):
         await dispatcher.stop_polling()
     except Exception:
         pass
+    # Алерты, поставленные перед остановкой (например, о рестарте), успевают уйти
+    await digest.flush()
+    await messaging.drain_alerts(timeout=5)
     cancelled_tasks = []
     for task in list(background_tasks):
         if task and not task.done():
@@ -264,6 +269,8 @@ async def shutdown(dispatcher: Dispatcher, bot_instance: Bot, web_runner=None):
             cancelled_tasks.append(task)
     if cancelled_tasks:
         await asyncio.gather(*cancelled_tasks, return_exceptions=True)
+    await nodes_db.close_db()
+    await geoip.close()
     if getattr(bot_instance, 'session', None):
         await bot_instance.session.close()
     logging.info("Bot stopped.")
@@ -276,10 +283,21 @@ async def main():
         logging.info(f"Bot starting in mode: {config.INSTALL_MODE.upper()}")
 
         await nodes_db.init_db()
+        background_tasks.add(asyncio.create_task(
+            nodes_db.heartbeat_flusher(), name="HeartbeatFlusher"))
+        background_tasks.add(asyncio.create_task(
+            rollups.rollup_loop(), name="MetricsRollup"))
+        background_tasks.add(asyncio.create_task(
+            sampler.sampler_loop(), name="MetricsSampler"))
+        background_tasks.add(asyncio.create_task(
+            messaging.dispatcher_loop(), name="AlertDispatcher"))
+        background_tasks.add(asyncio.create_task(
+            digest.digest_loop(), name="AlertDigest"))
 
         await asyncio.to_thread(auth.load_users)
         await asyncio.to_thread(utils.load_alerts_config)
         await asyncio.to_thread(i18n.load_user_settings)
+        await asyncio.to_thread(geoip.load)
 
         await auth.refresh_user_names(bot)
         await utils.initial_reboot_check(bot)
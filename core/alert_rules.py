@@ -0,0 +1,303 @@
+import asyncio
+import logging
+import operator
+import re
+import time
+from collections import namedtuple
+
+from . import config, nodes_db, sampler
+from .i18n import _, STRINGS
+from .messaging import send_alert
+from .utils import format_traffic, escape_html
+
+# Правила алертов по ресурсам — строки в config.ALERT_RULES:
+#   "cpu > 90 for 5m clear 80", "disk >= 95", "rx_rate > 100M for 1m on nodes"
+# for — сколько условие должно держаться до срабатывания, clear — порог сброса
+# (по умолчанию тот же), on — agent / nodes / all (по умолчанию all).
+# Пустой список — встроенные правила из CPU/RAM/DISK_THRESHOLD.
+# Правила проверяются раз в config.RESOURCE_CHECK_INTERVAL.
+BUILTIN_HYSTERESIS = 5
+METRICS = ("cpu", "ram", "disk", "rx_rate", "tx_rate", "load")
+RATE_METRICS = ("rx_rate", "tx_rate")
+# Столько алертов одного прохода склеивается в одно сообщение
+MAX_ALERTS_PER_MESSAGE = 10
+AGENT_TARGET = nodes_db.AGENT_METRICS_TOKEN
+
+_OPS = {">": operator.gt, ">=": operator.ge, "<": operator.lt, "<=": operator.le}
+_UNITS = {"": 1, "%": 1, "k": 1024, "m": 1024 ** 2, "g": 1024 ** 3}
+_DURATIONS = {"": 1, "s": 1, "m": 60, "h": 3600, "d": 86400}
+_VALUE_RE = re.compile(r"^(\d+(?:\.\d+)?)([kmg%]?)$", re.IGNORECASE)
+_DURATION_RE = re.compile(r"^(\d+)([smhd]?)$", re.IGNORECASE)
+_RULE_RE = re.compile(r"^\s*(\w+)\s*(>=|<=|>|<)\s*(\S+)(.*)$")
+
+Rule = namedtuple("Rule", "id metric op threshold clear duration scope")
+
+# id правила -> {цель: [active, pending_since, fired_at, notified_at]}
+_STATES = {}
+_STATES_LOADED = False
+# token -> (last_seen, net_rx, net_tx, rx_rate, tx_rate): скорость для нод считается по соседним heartbeat
+_NODE_NET = {}
+
+
+def _parse_value(text):
+    match = _VALUE_RE.match(text)
+    if not match:
+        raise ValueError(f"bad value '{text}'")
+    return float(match.group(1)) * _UNITS[match.group(2).lower()]
+
+
+def parse_rule(text):
+    """Rule из строки; ValueError с пояснением, если строка не разбирается."""
+    match = _RULE_RE.match(text)
+    if not match:
+        raise ValueError("expected '<metric> <op> <value> [for <duration>] [clear <value>] [on <scope>]'")
+    metric, op, value, rest = match.groups()
+    if metric not in METRICS:
+        raise ValueError(f"unknown metric '{metric}', expected one of {', '.join(METRICS)}")
+    threshold = _parse_value(value)
+    clear, duration, scope = threshold, 0, "all"
+    words = rest.split()
+    if len(words) % 2:
+        raise ValueError(f"dangling '{words[-1]}'")
+    for word, arg in zip(words[::2], words[1::2]):
+        word = word.lower()
+        if word == "for":
+            dur = _DURATION_RE.match(arg)
+            if not dur:
+                raise ValueError(f"bad duration '{arg}'")
+            duration = int(dur.group(1)) * _DURATIONS[dur.group(2).lower()]
+        elif word == "clear":
+            clear = _parse_value(arg)
+        elif word == "on" and arg.lower() in ("agent", "nodes", "all"):
+            scope = arg.lower()
+        else:
+            raise ValueError(f"unexpected '{word} {arg}'")
+    if _OPS[op](clear, threshold) and clear != threshold:
+        raise ValueError("clear threshold must be on the other side of the fire threshold")
+    rule_id = f"{metric} {op} {value}" + (f" for {duration}s" if duration else "") + \
+        (f" clear {clear:g}" if clear != threshold else "") + (f" on {scope}" if scope != "all" else "")
+    return Rule(rule_id, metric, op, threshold, clear, duration, scope)
+
+
+def get_rules():
+    """Действующие правила: из config.ALERT_RULES или встроенные по порогам."""
+    texts = config.ALERT_RULES or [
+        f"{metric} >= {threshold:g} clear {max(threshold - BUILTIN_HYSTERESIS, 0):g}"
+        for metric, threshold in (("cpu", config.CPU_THRESHOLD),
+                                  ("ram", config.RAM_THRESHOLD),
+                                  ("disk", config.DISK_THRESHOLD))]
+    rules = []
+    for text in texts:
+        try:
+            rules.append(parse_rule(text))
+        except (ValueError, KeyError) as e:
+            logging.error(f"Alert rule '{text}' ignored: {e}")
+    return rules
+
+
+def _node_rates(token, node):
+    last_seen = node.get("last_seen", 0)
+    stats = node.get("stats") or {}
+    rx, tx = stats.get("net_rx", 0), stats.get("net_tx", 0)
+    prev = _NODE_NET.get(token)
+    if prev is not None and last_seen == prev[0]:
+        return prev[3], prev[4]
+    rx_rate = tx_rate = None
+    if prev is not None and last_seen > prev[0]:
+        dt = last_seen - prev[0]
+        # Счётчики сбрасываются при перезагрузке ноды
+        rx_rate, tx_rate = max(rx - prev[1], 0) / dt, max(tx - prev[2], 0) / dt
+    _NODE_NET[token] = (last_seen, rx, tx, rx_rate, tx_rate)
+    return rx_rate, tx_rate
+
+
+def collect_samples(nodes, snap, now):
+    """
+    Последние значения всех целей по столбцам: (цели, {метрика: [значение или None, ...]}).
+    Цель — (ключ, имя ноды или None для агента). Лежащие ноды не оцениваются — для них есть downtime.
+    """
+    targets = []
+    columns = {metric: [] for metric in METRICS}
+    if snap is not None:
+        targets.append((AGENT_TARGET, None))
+        for metric, value in zip(METRICS, (snap.cpu, snap.ram, snap.disk, snap.rx_rate, snap.tx_rate, snap.load[0])):
+            columns[metric].append(value)
+    for token, node in nodes.items():
+        last_seen = node.get("last_seen", 0)
+        if not last_seen or now - last_seen >= nodes_db.node_offline_timeout(node) or node.get("is_restarting"):
+            continue
+        stats = node.get("stats") or {}
+        targets.append((token, node.get("name", "Unknown")))
+        rx_rate, tx_rate = _node_rates(token, node)
+        for metric, value in zip(METRICS, (stats.get("cpu"), stats.get("ram"), stats.get("disk"), rx_rate, tx_rate, None)):
+            columns[metric].append(value)
+    return targets, columns
+
+
+def evaluate(rules, targets, columns, now):
+    """
+    Один проход по всем правилам и целям. Меняет _STATES; возвращает
+    (события [(вид, правило, цель, значение)], изменённые ключи (правило, цель)).
+    Вид: "fired", "repeat" или "cleared".
+    """
+    events = []
+    changed = []
+    position = {key: i for i, (key, _name) in enumerate(targets)}
+    for rule in rules:
+        values = columns[rule.metric]
+        op = _OPS[rule.op]
+        states = _STATES.setdefault(rule.id, {})
+        # Сравнения целиком по столбцу; дальше разбираются только цели,
+        # где условие выполняется или уже есть состояние — обычно их единицы
+        fire = [v is not None and op(v, rule.threshold) for v in values]
+        candidates = {i for i, f in enumerate(fire) if f}
+        candidates.update(position[key] for key in states if key in position)
+        for i in sorted(candidates):
+            value = values[i]
+            if value is None:
+                continue
+            target = targets[i]
+            if rule.scope != "all" and (target[0] == AGENT_TARGET) != (rule.scope == "agent"):
+                continue
+            key = (rule.id, target[0])
+            state = states.get(target[0])
+            if state is None:
+                state = states[target[0]] = [False, None, None, None]
+            active, pending_since, _fired_at, notified_at = state
+            if not active:
+                if not fire[i]:
+                    # Условие не продержалось for — отсчёт заново
+                    del states[target[0]]
+                    changed.append(key)
+                    continue
+                if pending_since is None:
+                    state[1] = pending_since = now
+                    changed.append(key)
+                if now - pending_since >= rule.duration:
+                    state[:] = [True, pending_since, now, now]
+                    changed.append(key)
+                    events.append(("fired", rule, target, value))
+            elif not op(value, rule.clear):
+                del states[target[0]]
+                changed.append(key)
+                events.append(("cleared", rule, target, value))
+            elif config.RESOURCE_ALERT_COOLDOWN and now - notified_at > config.RESOURCE_ALERT_COOLDOWN:
+                state[3] = now
+                changed.append(key)
+                events.append(("repeat", rule, target, value))
+    return events, changed
+
+
+def _format_value(metric, value, lang):
+    if metric in RATE_METRICS:
+        return format_traffic(value, lang) + "/s"
+    if metric == "load":
+        return f"{value:.2f}"
+    return f"{value:.1f}%"
+
+
+def render_event(lang, event):
+    kind, rule, (key, name), value = event
+    # Для cpu/ram/disk — привычные тексты алертов, для остального — общий шаблон с правилом (и его знаком)
+    if key == AGENT_TARGET:
+        text_key = {"fired": f"alert_{rule.metric}_high", "repeat": f"alert_{rule.metric}_high_repeat",
+                    "cleared": f"alert_{rule.metric}_normal"}[kind]
+    else:
+        text_key = {"fired": f"alert_node_{rule.metric}_high", "repeat": f"alert_node_{rule.metric}_high",
+                    "cleared": f"alert_node_{rule.metric}_normal"}[kind]
+    # Тексты "превышен порог" подходят только правилам на превышение
+    if rule.op in (">", ">=") and text_key in STRINGS["en"]:
+        threshold = rule.clear if kind == "cleared" else rule.threshold
+        if key == AGENT_TARGET:
+            return _(text_key, lang, usage=value, threshold=f"{threshold:g}")
+        return _(text_key, lang, name=name, usage=round(value, 1), threshold=f"{threshold:g}")
+    return _(f"alert_rule_{kind}", lang,
+             target=name if name is not None else _("alert_rule_target_agent", lang),
+             rule=escape_html(rule.id),
+             value=_format_value(rule.metric, value, lang))
+
+
+async def _load_states(rules):
+    global _STATES_LOADED
+    rows = await nodes_db.load_alert_states()
+    rule_ids = {rule.id for rule in rules}
+    # Отсчёт for, начатый до остановки дольше интервала проверки назад, не продолжается:
+    # за время простоя условие никто не проверял
+    fresh_since = time.time() - config.RESOURCE_CHECK_INTERVAL
+    stale = []
+    for row in rows:
+        pending_since = row["pending_since"]
+        if row["rule"] not in rule_ids:
+            # Правило удалили или изменили — его состояние больше не нужно
+            stale.append((row["rule"], row["target"]))
+        elif not row["active"] and (pending_since is None or pending_since < fresh_since):
+            stale.append((row["rule"], row["target"]))
+        else:
+            _STATES.setdefault(row["rule"], {})[row["target"]] = [
+                bool(row["active"]), pending_since, row["fired_at"], row["notified_at"]]
+    await nodes_db.save_alert_states(deletes=stale)
+    _STATES_LOADED = True
+    active = sum(state[0] for states in _STATES.values() for state in states.values())
+    logging.info(f"Alert rules: {len(rules)} rules, {active} active alerts restored.")
+
+
+async def _save_states(keys):
+    upserts, deletes = [], []
+    for rule_id, target in set(keys):
+        state = _STATES.get(rule_id, {}).get(target)
+        if state is None:
+            deletes.append((rule_id, target))
+        else:
+            upserts.append((rule_id, target, int(state[0]), state[1], state[2], state[3]))
+    await nodes_db.save_alert_states(upserts, deletes)
+
+
+def _forget_removed(rules, nodes):
+    """Забывает состояния удалённых нод и правил; возвращает их ключи для удаления из БД."""
+    rule_ids = {rule.id for rule in rules}
+    removed = []
+    for rule_id in list(_STATES):
+        states = _STATES[rule_id]
+        for target in list(states):
+            if rule_id not in rule_ids or (target != AGENT_TARGET and target not in nodes):
+                del states[target]
+                removed.append((rule_id, target))
+        if rule_id not in rule_ids:
+            del _STATES[rule_id]
+    for token in [t for t in _NODE_NET if t not in nodes]:
+        del _NODE_NET[token]
+    return removed
+
+
+async def evaluate_once(bot, now=None):
+    if now is None:
+        now = time.time()
+    rules = get_rules()
+    if not _STATES_LOADED:
+        await _load_states(rules)
+    nodes = await nodes_db.get_all_nodes()
+    changed = _forget_removed(rules, nodes)
+    targets, columns = collect_samples(nodes, sampler.get_snapshot(), now)
+    events, evaluated = evaluate(rules, targets, columns, now)
+    changed.extend(evaluated)
+    # Состояние пишется до отправки: после рестарта алерт не уйдёт повторно
+    await _save_states(changed)
+    for i in range(0, len(events), MAX_ALERTS_PER_MESSAGE):
+        batch = events[i:i + MAX_ALERTS_PER_MESSAGE]
+        await send_alert(bot, lambda lang, batch=batch: "\n\n".join(render_event(lang, e) for e in batch), "resources")
+    return events
+
+
+async def rules_loop(bot):
+    """Фоновая задача: оценка правил раз в RESOURCE_CHECK_INTERVAL."""
+    logging.info("Alert rules started.")
+    await asyncio.sleep(15)
+    try:
+        while True:
+            try:
+                await evaluate_once(bot)
+            except Exception as e:
+                logging.error(f"Alert rules error: {e}", exc_info=True)
+            await asyncio.sleep(config.RESOURCE_CHECK_INTERVAL)
+    except asyncio.CancelledError:
+        logging.info("Alert rules stopped.")
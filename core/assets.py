@@ -0,0 +1,129 @@
+import gzip
+import hashlib
+import logging
+import os
+import re
+
+from aiohttp import web
+
+try:
+    import brotli
+    BROTLI_AVAILABLE = True
+except ImportError:
+    BROTLI_AVAILABLE = False
+
+ASSET_PREFIX = "/assets"
+ASSET_EXTENSIONS = {".js": "application/javascript", ".css": "text/css"}
+# Меньше этого размера сжатие не окупается
+MIN_COMPRESS_SIZE = 512
+IMMUTABLE_CACHE = "public, max-age=31536000, immutable"
+
+# rel_path -> {"url", "hash", "type", "identity", "gzip", "br"}
+MANIFEST = {}
+# fingerprinted rel_path (js/dashboard.<hash>.js) -> запись манифеста
+_BY_URL_PATH = {}
+
+_STATIC_REF_RE = re.compile(r"/static/([\w./-]+)\?v=\{web_version\}")
+_FINGERPRINT_RE = re.compile(r"^(.+)\.[0-9a-f]{12}(\.\w+)$")
+
+
+def _fingerprint(rel_path, digest):
+    base, ext = os.path.splitext(rel_path)
+    return f"{base}.{digest}{ext}"
+
+
+def build_manifest(static_dir):
+    """
+    Хэширует js/css по содержимому и готовит gzip/brotli-варианты в памяти.
+    Вызывается один раз при старте веб-сервера.
+    """
+    MANIFEST.clear()
+    _BY_URL_PATH.clear()
+    raw_total = gz_total = 0
+    for root, _dirs, files in os.walk(static_dir):
+        for filename in sorted(files):
+            ext = os.path.splitext(filename)[1]
+            if ext not in ASSET_EXTENSIONS:
+                continue
+            path = os.path.join(root, filename)
+            rel_path = os.path.relpath(path, static_dir).replace(os.sep, "/")
+            try:
+                with open(path, "rb") as f:
+                    data = f.read()
+            except OSError as e:
+                logging.warning(f"Asset {rel_path} skipped: {e}")
+                continue
+            digest = hashlib.sha256(data).hexdigest()[:12]
+            entry = {
+                "url": f"{ASSET_PREFIX}/{_fingerprint(rel_path, digest)}",
+                "hash": digest,
+                "type": ASSET_EXTENSIONS[ext],
+                "identity": data,
+                "gzip": None,
+                "br": None,
+            }
+            if len(data) >= MIN_COMPRESS_SIZE:
+                gz = gzip.compress(data, compresslevel=9, mtime=0)
+                if len(gz) < len(data):
+                    entry["gzip"] = gz
+                if BROTLI_AVAILABLE:
+                    br = brotli.compress(data, quality=11)
+                    if len(br) < len(data):
+                        entry["br"] = br
+            MANIFEST[rel_path] = entry
+            _BY_URL_PATH[_fingerprint(rel_path, digest)] = entry
+            raw_total += len(data)
+            gz_total += len(entry["gzip"] or data)
+    logging.info(f"Static assets: {len(MANIFEST)} files, {raw_total} B -> {gz_total} B gzip"
+                 f"{', brotli enabled' if BROTLI_AVAILABLE else ''}.")
+    return MANIFEST
+
+
+def asset_url(rel_path, fallback_ver=""):
+    entry = MANIFEST.get(rel_path)
+    if entry:
+        return entry["url"]
+    return f"/static/{rel_path}?v={fallback_ver}"
+
+
+def rewrite_static_refs(html, fallback_ver=""):
+    """/static/<file>?v={web_version} в шаблонах -> адрес с хэшем содержимого."""
+    return _STATIC_REF_RE.sub(lambda m: asset_url(m.group(1), fallback_ver), html)
+
+
+def accepted_encodings(header):
+    accepted = set()
+    for item in header.split(","):
+        name, _sep, params = item.strip().partition(";")
+        params = params.replace(" ", "")
+        if params.startswith("q=") and params[2:] in ("0", "0.0", "0.00", "0.000"):
+            continue
+        accepted.add(name.strip().lower())
+    return accepted
+
+
+async def handle_asset(request):
+    path = request.match_info["path"]
+    entry = _BY_URL_PATH.get(path)
+    cache_control = IMMUTABLE_CACHE
+    if not entry:
+        # Страница из кэша браузера ссылается на хэш до обновления — отдаём текущую версию без кэширования
+        m = _FINGERPRINT_RE.match(path)
+        entry = MANIFEST.get(m.group(1) + m.group(2)) if m else None
+        if not entry:
+            raise web.HTTPNotFound()
+        cache_control = "no-cache"
+    etag = f'"{entry["hash"]}"'
+    headers = {"Cache-Control": cache_control, "ETag": etag, "Vary": "Accept-Encoding"}
+    if request.headers.get("If-None-Match") == etag:
+        return web.Response(status=304, headers=headers)
+
+    accepted = accepted_encodings(request.headers.get("Accept-Encoding", ""))
+    body = entry["identity"]
+    if entry["br"] is not None and "br" in accepted:
+        body = entry["br"]
+        headers["Content-Encoding"] = "br"
+    elif entry["gzip"] is not None and "gzip" in accepted:
+        body = entry["gzip"]
+        headers["Content-Encoding"] = "gzip"
+    return web.Response(body=body, content_type=entry["type"], charset="utf-8", headers=headers)
@@ -25,6 +25,7 @@ NODES_FILE = os.path.join(CONFIG_DIR, "nodes.json")
 REBOOT_FLAG_FILE = os.path.join(CONFIG_DIR, "reboot_flag.txt")
 RESTART_FLAG_FILE = os.path.join(CONFIG_DIR, "restart_flag.txt")
 ALERTS_CONFIG_FILE = os.path.join(CONFIG_DIR, "alerts_config.json")
+LOG_OFFSETS_FILE = os.path.join(CONFIG_DIR, "log_offsets.json")
 USER_SETTINGS_FILE = os.path.join(CONFIG_DIR, "user_settings.json")
 SYSTEM_CONFIG_FILE = os.path.join(CONFIG_DIR, "system_config.json")
 KEYBOARD_CONFIG_FILE = os.path.join(CONFIG_DIR, "keyboard_config.json")
@@ -60,7 +61,27 @@ DEFAULT_CONFIG = {
     "RAM_THRESHOLD": 90.0,
     "DISK_THRESHOLD": 95.0,
     "RESOURCE_ALERT_COOLDOWN": 1800,
-    "NODE_OFFLINE_TIMEOUT": 20
+    "NODE_OFFLINE_TIMEOUT": 20,
+    # Интервал heartbeat, который агент назначает ноде, пока её никто не смотрит (секунды)
+    "NODE_IDLE_INTERVAL": 30,
+    # Хранение метрик по уровням агрегации (секунды)
+    "METRICS_RETENTION_RAW": 86400,
+    "METRICS_RETENTION_1M": 7 * 86400,
+    "METRICS_RETENTION_1H": 90 * 86400,
+    "METRICS_RETENTION_1D": 730 * 86400,
+    # Сжатие и ETag для ответов веб-сервера
+    "WEB_COMPRESSION": True,
+    "WEB_COMPRESSION_MIN_SIZE": 1024,
+    "WEB_ETAGS": True,
+    # Запрос к ip-api.com, если IP нет в локальной GeoIP-базе (или базы нет)
+    "GEOIP_REMOTE_FALLBACK": True,
+    # Однотипные алерты внутри окна склеиваются в дайджест (секунды, 0 — выключено)
+    "ALERT_DIGEST_WINDOW": 60,
+    # Не больше стольких сообщений в час на тип алерта, остальное — в дайджест (0 — без лимита)
+    "ALERT_HOURLY_CAP": 60,
+    # Правила алертов по ресурсам, например "cpu > 90 for 5m clear 80" (см. core/alert_rules.py).
+    # Пустой список — правила из CPU/RAM/DISK_THRESHOLD
+    "ALERT_RULES": []
 }
 
 # Значения по умолчанию для модулей (клавиатуры)
@@ -92,12 +113,27 @@ RAM_THRESHOLD = DEFAULT_CONFIG["RAM_THRESHOLD"]
 DISK_THRESHOLD = DEFAULT_CONFIG["DISK_THRESHOLD"]
 RESOURCE_ALERT_COOLDOWN = DEFAULT_CONFIG["RESOURCE_ALERT_COOLDOWN"]
 NODE_OFFLINE_TIMEOUT = DEFAULT_CONFIG["NODE_OFFLINE_TIMEOUT"]
+NODE_IDLE_INTERVAL = DEFAULT_CONFIG["NODE_IDLE_INTERVAL"]
+METRICS_RETENTION_RAW = DEFAULT_CONFIG["METRICS_RETENTION_RAW"]
+METRICS_RETENTION_1M = DEFAULT_CONFIG["METRICS_RETENTION_1M"]
+METRICS_RETENTION_1H = DEFAULT_CONFIG["METRICS_RETENTION_1H"]
+METRICS_RETENTION_1D = DEFAULT_CONFIG["METRICS_RETENTION_1D"]
+WEB_COMPRESSION = DEFAULT_CONFIG["WEB_COMPRESSION"]
+WEB_COMPRESSION_MIN_SIZE = DEFAULT_CONFIG["WEB_COMPRESSION_MIN_SIZE"]
+WEB_ETAGS = DEFAULT_CONFIG["WEB_ETAGS"]
+GEOIP_REMOTE_FALLBACK = DEFAULT_CONFIG["GEOIP_REMOTE_FALLBACK"]
+ALERT_DIGEST_WINDOW = DEFAULT_CONFIG["ALERT_DIGEST_WINDOW"]
+ALERT_HOURLY_CAP = DEFAULT_CONFIG["ALERT_HOURLY_CAP"]
+ALERT_RULES = list(DEFAULT_CONFIG["ALERT_RULES"])
 
 KEYBOARD_CONFIG = DEFAULT_KEYBOARD_CONFIG.copy()
 
 def load_system_config():
     """Загружает системные настройки."""
     global TRAFFIC_INTERVAL, RESOURCE_CHECK_INTERVAL, CPU_THRESHOLD, RAM_THRESHOLD, DISK_THRESHOLD, RESOURCE_ALERT_COOLDOWN, NODE_OFFLINE_TIMEOUT
+    global NODE_IDLE_INTERVAL, METRICS_RETENTION_RAW, METRICS_RETENTION_1M, METRICS_RETENTION_1H, METRICS_RETENTION_1D
+    global WEB_COMPRESSION, WEB_COMPRESSION_MIN_SIZE, WEB_ETAGS, GEOIP_REMOTE_FALLBACK
+    global ALERT_DIGEST_WINDOW, ALERT_HOURLY_CAP, ALERT_RULES
 
     try:
         if os.path.exists(SYSTEM_CONFIG_FILE):
@@ -110,6 +146,18 @@ def load_system_config():
                 DISK_THRESHOLD = data.get("DISK_THRESHOLD", DEFAULT_CONFIG["DISK_THRESHOLD"])
                 RESOURCE_ALERT_COOLDOWN = data.get("RESOURCE_ALERT_COOLDOWN", DEFAULT_CONFIG["RESOURCE_ALERT_COOLDOWN"])
                 NODE_OFFLINE_TIMEOUT = data.get("NODE_OFFLINE_TIMEOUT", DEFAULT_CONFIG["NODE_OFFLINE_TIMEOUT"])
+                NODE_IDLE_INTERVAL = data.get("NODE_IDLE_INTERVAL", DEFAULT_CONFIG["NODE_IDLE_INTERVAL"])
+                METRICS_RETENTION_RAW = data.get("METRICS_RETENTION_RAW", DEFAULT_CONFIG["METRICS_RETENTION_RAW"])
+                METRICS_RETENTION_1M = data.get("METRICS_RETENTION_1M", DEFAULT_CONFIG["METRICS_RETENTION_1M"])
+                METRICS_RETENTION_1H = data.get("METRICS_RETENTION_1H", DEFAULT_CONFIG["METRICS_RETENTION_1H"])
+                METRICS_RETENTION_1D = data.get("METRICS_RETENTION_1D", DEFAULT_CONFIG["METRICS_RETENTION_1D"])
+                WEB_COMPRESSION = data.get("WEB_COMPRESSION", DEFAULT_CONFIG["WEB_COMPRESSION"])
+                WEB_COMPRESSION_MIN_SIZE = data.get("WEB_COMPRESSION_MIN_SIZE", DEFAULT_CONFIG["WEB_COMPRESSION_MIN_SIZE"])
+                WEB_ETAGS = data.get("WEB_ETAGS", DEFAULT_CONFIG["WEB_ETAGS"])
+                GEOIP_REMOTE_FALLBACK = data.get("GEOIP_REMOTE_FALLBACK", DEFAULT_CONFIG["GEOIP_REMOTE_FALLBACK"])
+                ALERT_DIGEST_WINDOW = data.get("ALERT_DIGEST_WINDOW", DEFAULT_CONFIG["ALERT_DIGEST_WINDOW"])
+                ALERT_HOURLY_CAP = data.get("ALERT_HOURLY_CAP", DEFAULT_CONFIG["ALERT_HOURLY_CAP"])
+                ALERT_RULES = list(data.get("ALERT_RULES", DEFAULT_CONFIG["ALERT_RULES"]))
                 logging.info("System config loaded successfully.")
     except Exception as e:
         logging.error(f"Error loading system config: {e}")
@@ -117,13 +165,28 @@ def load_system_config():
 def save_system_config(new_config: dict):
     """Сохраняет системные настройки."""
     global TRAFFIC_INTERVAL, RESOURCE_CHECK_INTERVAL, CPU_THRESHOLD, RAM_THRESHOLD, DISK_THRESHOLD, RESOURCE_ALERT_COOLDOWN, NODE_OFFLINE_TIMEOUT
+    global NODE_IDLE_INTERVAL, METRICS_RETENTION_RAW, METRICS_RETENTION_1M, METRICS_RETENTION_1H, METRICS_RETENTION_1D
+    global WEB_COMPRESSION, WEB_COMPRESSION_MIN_SIZE, WEB_ETAGS, GEOIP_REMOTE_FALLBACK
+    global ALERT_DIGEST_WINDOW, ALERT_HOURLY_CAP, ALERT_RULES
 
     try:
         if "TRAFFIC_INTERVAL" in new_config: TRAFFIC_INTERVAL = int(new_config["TRAFFIC_INTERVAL"])
         if "NODE_OFFLINE_TIMEOUT" in new_config: NODE_OFFLINE_TIMEOUT = int(new_config["NODE_OFFLINE_TIMEOUT"])
+        if "NODE_IDLE_INTERVAL" in new_config: NODE_IDLE_INTERVAL = int(new_config["NODE_IDLE_INTERVAL"])
         if "CPU_THRESHOLD" in new_config: CPU_THRESHOLD = float(new_config["CPU_THRESHOLD"])
         if "RAM_THRESHOLD" in new_config: RAM_THRESHOLD = float(new_config["RAM_THRESHOLD"])
         if "DISK_THRESHOLD" in new_config: DISK_THRESHOLD = float(new_config["DISK_THRESHOLD"])
+        if "METRICS_RETENTION_RAW" in new_config: METRICS_RETENTION_RAW = int(new_config["METRICS_RETENTION_RAW"])
+        if "METRICS_RETENTION_1M" in new_config: METRICS_RETENTION_1M = int(new_config["METRICS_RETENTION_1M"])
+        if "METRICS_RETENTION_1H" in new_config: METRICS_RETENTION_1H = int(new_config["METRICS_RETENTION_1H"])
+        if "METRICS_RETENTION_1D" in new_config: METRICS_RETENTION_1D = int(new_config["METRICS_RETENTION_1D"])
+        if "WEB_COMPRESSION" in new_config: WEB_COMPRESSION = bool(new_config["WEB_COMPRESSION"])
+        if "WEB_COMPRESSION_MIN_SIZE" in new_config: WEB_COMPRESSION_MIN_SIZE = int(new_config["WEB_COMPRESSION_MIN_SIZE"])
+        if "WEB_ETAGS" in new_config: WEB_ETAGS = bool(new_config["WEB_ETAGS"])
+        if "GEOIP_REMOTE_FALLBACK" in new_config: GEOIP_REMOTE_FALLBACK = bool(new_config["GEOIP_REMOTE_FALLBACK"])
+        if "ALERT_DIGEST_WINDOW" in new_config: ALERT_DIGEST_WINDOW = int(new_config["ALERT_DIGEST_WINDOW"])
+        if "ALERT_HOURLY_CAP" in new_config: ALERT_HOURLY_CAP = int(new_config["ALERT_HOURLY_CAP"])
+        if "ALERT_RULES" in new_config: ALERT_RULES = [str(rule) for rule in new_config["ALERT_RULES"]]
 
         config_to_save = {
             "TRAFFIC_INTERVAL": TRAFFIC_INTERVAL,
@@ -132,7 +195,19 @@ def save_system_config(new_config: dict):
             "RAM_THRESHOLD": RAM_THRESHOLD,
             "DISK_THRESHOLD": DISK_THRESHOLD,
             "RESOURCE_ALERT_COOLDOWN": RESOURCE_ALERT_COOLDOWN,
-            "NODE_OFFLINE_TIMEOUT": NODE_OFFLINE_TIMEOUT
+            "NODE_OFFLINE_TIMEOUT": NODE_OFFLINE_TIMEOUT,
+            "NODE_IDLE_INTERVAL": NODE_IDLE_INTERVAL,
+            "METRICS_RETENTION_RAW": METRICS_RETENTION_RAW,
+            "METRICS_RETENTION_1M": METRICS_RETENTION_1M,
+            "METRICS_RETENTION_1H": METRICS_RETENTION_1H,
+            "METRICS_RETENTION_1D": METRICS_RETENTION_1D,
+            "WEB_COMPRESSION": WEB_COMPRESSION,
+            "WEB_COMPRESSION_MIN_SIZE": WEB_COMPRESSION_MIN_SIZE,
+            "WEB_ETAGS": WEB_ETAGS,
+            "GEOIP_REMOTE_FALLBACK": GEOIP_REMOTE_FALLBACK,
+            "ALERT_DIGEST_WINDOW": ALERT_DIGEST_WINDOW,
+            "ALERT_HOURLY_CAP": ALERT_HOURLY_CAP,
+            "ALERT_RULES": ALERT_RULES
         }
 
         with open(SYSTEM_CONFIG_FILE, "w", encoding="utf-8") as f:
@@ -0,0 +1,121 @@
+import asyncio
+import logging
+import time
+
+from . import config
+from .messaging import send_alert, TokenBucket
+
+# Склейка однотипных событий перед send_alert. Первое событие уходит сразу,
+# следующие в течение ALERT_DIGEST_WINDOW копятся и отправляются одним
+# сообщением-дайджестом. Пока события идут, окно продлевается, но дайджест
+# уходит не позже MAX_WINDOWS окон от начала накопления.
+# Сверх ALERT_HOURLY_CAP сообщений в час на тип алерта события тоже
+# только копятся — под атакой число сообщений в Telegram ограничено.
+TICK = 1
+MAX_WINDOWS = 5
+
+_PENDING = {}
+_CAPS = {}
+DIGEST_STATS = {"events": 0, "messages": 0, "digests": 0}
+
+
+class _Pending:
+    __slots__ = ("bot", "alert_type", "digest_func", "events", "started", "deadline")
+
+    def __init__(self, bot, alert_type, digest_func, now):
+        self.bot = bot
+        self.alert_type = alert_type
+        self.digest_func = digest_func
+        # (функция текста отдельного алерта, параметры события)
+        self.events = []
+        self.started = now
+        self.deadline = now + config.ALERT_DIGEST_WINDOW
+
+
+def _take_cap(alert_type):
+    cap = config.ALERT_HOURLY_CAP
+    if cap <= 0:
+        return True
+    bucket = _CAPS.get(alert_type)
+    if bucket is None or bucket.rate != cap / 3600:
+        # Запас на всплеск — десятиминутная норма
+        bucket = _CAPS[alert_type] = TokenBucket(cap / 3600, max(1, cap // 6))
+    now = time.monotonic()
+    if bucket.wait_time(now) > 0:
+        return False
+    bucket.take(now)
+    return True
+
+
+async def _send(pending, events, now):
+    DIGEST_STATS["messages"] += 1
+    if len(events) == 1:
+        await send_alert(pending.bot, events[0][0], pending.alert_type)
+        return
+    DIGEST_STATS["digests"] += 1
+    params = [p for _f, p in events]
+    seconds = max(1, round(now - pending.started))
+    await send_alert(pending.bot, lambda lang: pending.digest_func(lang, params, seconds), pending.alert_type)
+
+
+async def add_event(bot, kind, alert_type, message_func, params, digest_func):
+    """
+    Событие вида kind: message_func(lang) — текст отдельного алерта,
+    digest_func(lang, [params, ...], seconds) — текст дайджеста.
+    """
+    DIGEST_STATS["events"] += 1
+    if config.ALERT_DIGEST_WINDOW <= 0:
+        await send_alert(bot, message_func, alert_type)
+        return
+    now = time.monotonic()
+    pending = _PENDING.get(kind)
+    if pending is None:
+        pending = _PENDING[kind] = _Pending(bot, alert_type, digest_func, now)
+        if _take_cap(alert_type):
+            await _send(pending, [(message_func, params)], now)
+            pending.started = now
+            return
+    pending.events.append((message_func, params))
+    window = config.ALERT_DIGEST_WINDOW
+    pending.deadline = min(now + window, pending.started + window * MAX_WINDOWS)
+
+
+async def _flush_due(force=False):
+    now = time.monotonic()
+    for kind, pending in list(_PENDING.items()):
+        if not force and now < pending.deadline:
+            continue
+        if not pending.events:
+            # Окно прошло без новых событий — следующее снова уйдёт сразу
+            del _PENDING[kind]
+            continue
+        if not force and not _take_cap(pending.alert_type):
+            continue
+        events, pending.events = pending.events, []
+        try:
+            await _send(pending, events, now)
+        except Exception as e:
+            logging.error(f"Digest send error ({kind}): {e}")
+        pending.started = now
+        pending.deadline = now + config.ALERT_DIGEST_WINDOW
+
+
+def get_stats():
+    """Счётчики и число событий, ждущих дайджеста, по видам."""
+    return {**DIGEST_STATS, "pending": {kind: len(p.events) for kind, p in _PENDING.items()}}
+
+
+async def digest_loop():
+    """Фоновая задача: отправка накопленных дайджестов по истечении окна."""
+    logging.info("Alert digest started.")
+    try:
+        while True:
+            await asyncio.sleep(TICK)
+            await _flush_due()
+    except asyncio.CancelledError:
+        logging.info("Alert digest stopped.")
+
+
+async def flush():
+    """Отправляет всё накопленное без ожидания окна (при остановке бота)."""
+    await _flush_due(force=True)
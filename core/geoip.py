@@ -0,0 +1,276 @@
+import asyncio
+import bisect
+import csv
+import gzip
+import io
+import ipaddress
+import logging
+import os
+import socket
+import time
+from array import array
+from collections import OrderedDict
+
+import aiohttp
+
+from . import config
+
+try:
+    import maxminddb
+    MMDB_AVAILABLE = True
+except ImportError:
+    MMDB_AVAILABLE = False
+
+# Локальная база стран по диапазонам IP. Поддерживаются CSV вида start,end,CC[,Country]
+# (DB-IP Lite country, IP2Location LITE DB1/DB1.IPV6; адреса строками или числами, можно .gz)
+# и .mmdb (GeoLite2/DB-IP, если установлен maxminddb). Первый найденный файл из списка:
+DB_FILES = tuple(os.path.join(config.CONFIG_DIR, name) for name in ("geoip.mmdb", "geoip.csv", "geoip.csv.gz"))
+
+CACHE_SIZE = 4096
+CACHE_TTL = 6 * 3600
+# Неудачные ответы кэшируются короче — база или внешний API могли ошибиться временно
+NEGATIVE_TTL = 600
+# ip-api.com бесплатно разрешает 45 запросов в минуту
+REMOTE_URL = "http://ip-api.com/json/{}?fields=status,countryCode,country"
+REMOTE_RATE_PER_MIN = 40
+REMOTE_TIMEOUT = 2
+
+_V4_MAPPED_BASE = 0xFFFF00000000
+_MISS = object()
+
+# (v4_starts, v4_ends, v4_idx, v6_starts, v6_ends, v6_idx, countries) — заменяется целиком при загрузке
+_INDEX = None
+_MMDB = None
+_SESSION = None
+_REMOTE_TOKENS = float(REMOTE_RATE_PER_MIN)
+_REMOTE_REFILL_AT = 0.0
+_REMOTE_BLOCKED_UNTIL = 0.0
+STATS = {"cache_hits": 0, "local": 0, "remote": 0, "remote_skipped": 0, "unknown": 0}
+
+
+class TTLCache:
+    """LRU с ограничением размера и временем жизни записей."""
+
+    def __init__(self, size, ttl):
+        self.size = size
+        self.ttl = ttl
+        self.data = OrderedDict()
+
+    def get(self, key):
+        item = self.data.get(key)
+        if item is None:
+            return _MISS
+        value, expires = item
+        if expires < time.monotonic():
+            del self.data[key]
+            return _MISS
+        self.data.move_to_end(key)
+        return value
+
+    def set(self, key, value, ttl=None):
+        self.data[key] = (value, time.monotonic() + (self.ttl if ttl is None else ttl))
+        self.data.move_to_end(key)
+        if len(self.data) > self.size:
+            self.data.popitem(last=False)
+
+    def clear(self):
+        self.data.clear()
+
+
+CACHE = TTLCache(CACHE_SIZE, CACHE_TTL)
+
+
+def _parse_ip(value):
+    """(версия, число) для адреса строкой или числом; v4-mapped IPv6 считается IPv4."""
+    if value.isdigit():
+        n = int(value)
+        if n <= 0xFFFFFFFF:
+            return 4, n
+        if _V4_MAPPED_BASE <= n <= _V4_MAPPED_BASE + 0xFFFFFFFF:
+            return 4, n - _V4_MAPPED_BASE
+        return 6, n
+    if ":" in value:
+        n = int.from_bytes(socket.inet_pton(socket.AF_INET6, value), "big")
+        if _V4_MAPPED_BASE <= n <= _V4_MAPPED_BASE + 0xFFFFFFFF:
+            return 4, n - _V4_MAPPED_BASE
+        return 6, n
+    return 4, int.from_bytes(socket.inet_pton(socket.AF_INET, value), "big")
+
+
+def _build_csv_index(path):
+    """
+    Сортированные массивы начал/концов диапазонов и индексов стран.
+    IPv6 индексируется по /64-префиксу: страновые диапазоны не бывают мельче.
+    """
+    v4 = (array('I'), array('I'), array('H'))
+    v6 = (array('Q'), array('Q'), array('H'))
+    countries, country_ids = [], {}
+    opener = gzip.open if path.endswith(".gz") else open
+    with opener(path, "rb") as raw:
+        for row in csv.reader(io.TextIOWrapper(raw, encoding="utf-8", errors="ignore")):
+            if len(row) < 3:
+                continue
+            code = row[2].strip().upper()
+            if len(code) != 2 or not code.isalpha() or code == "ZZ":
+                continue
+            try:
+                version, start = _parse_ip(row[0].strip())
+                _version, end = _parse_ip(row[1].strip())
+            except (OSError, ValueError):
+                continue
+            cid = country_ids.get(code)
+            if cid is None:
+                cid = country_ids[code] = len(countries)
+                countries.append((code, row[3].strip() if len(row) > 3 and row[3].strip() else None))
+            starts, ends, ids = v4 if version == 4 else v6
+            if version == 6:
+                start, end = start >> 64, end >> 64
+            # Соседние диапазоны одной страны склеиваются
+            if starts and ids[-1] == cid and start <= ends[-1] + 1 and start >= starts[-1]:
+                ends[-1] = max(ends[-1], end)
+                continue
+            starts.append(start)
+            ends.append(end)
+            ids.append(cid)
+    for starts, ends, ids in (v4, v6):
+        if any(starts[i] > starts[i + 1] for i in range(len(starts) - 1)):
+            order = sorted(range(len(starts)), key=starts.__getitem__)
+            starts[:] = array(starts.typecode, (starts[i] for i in order))
+            ends[:] = array(ends.typecode, (ends[i] for i in order))
+            ids[:] = array(ids.typecode, (ids[i] for i in order))
+    return v4 + v6 + (countries,)
+
+
+def load(path=None):
+    """Загружает базу (синхронно — вызывать через asyncio.to_thread). Возвращает число диапазонов."""
+    global _INDEX, _MMDB
+    if path is None:
+        path = next((p for p in DB_FILES if os.path.exists(p)), None)
+    if path is None:
+        logging.info("GeoIP: local database not found, "
+                     f"remote fallback {'enabled' if config.GEOIP_REMOTE_FALLBACK else 'disabled'}.")
+        return 0
+    start = time.monotonic()
+    if path.endswith(".mmdb"):
+        if not MMDB_AVAILABLE:
+            logging.warning(f"GeoIP: {path} requires the maxminddb package.")
+            return 0
+        _MMDB = maxminddb.open_database(path)
+        _INDEX = None
+        count = _MMDB.metadata().node_count
+    else:
+        _INDEX = _build_csv_index(path)
+        _MMDB = None
+        count = len(_INDEX[0]) + len(_INDEX[3])
+    CACHE.clear()
+    logging.info(f"GeoIP: loaded {os.path.basename(path)} ({count} entries) in {time.monotonic() - start:.2f}s.")
+    return count
+
+
+def _search(starts, ends, ids, n):
+    i = bisect.bisect_right(starts, n) - 1
+    if i >= 0 and n <= ends[i]:
+        return ids[i]
+    return None
+
+
+def lookup_local(ip):
+    """(код, название или None) из локальной базы; None, если адреса там нет."""
+    index = _INDEX
+    if index is not None:
+        try:
+            version, n = _parse_ip(ip)
+        except (OSError, ValueError):
+            return None
+        if version == 4:
+            cid = _search(index[0], index[1], index[2], n)
+        else:
+            cid = _search(index[3], index[4], index[5], n >> 64)
+        return index[6][cid] if cid is not None else None
+    if _MMDB is not None:
+        try:
+            record = _MMDB.get(ip)
+        except ValueError:
+            return None
+        country = (record or {}).get("country") or (record or {}).get("registered_country")
+        if country and country.get("iso_code"):
+            return country["iso_code"], (country.get("names") or {}).get("en")
+    return None
+
+
+def _take_remote_token():
+    global _REMOTE_TOKENS, _REMOTE_REFILL_AT
+    now = time.monotonic()
+    if now < _REMOTE_BLOCKED_UNTIL:
+        return False
+    _REMOTE_TOKENS = min(REMOTE_RATE_PER_MIN, _REMOTE_TOKENS + (now - _REMOTE_REFILL_AT) * REMOTE_RATE_PER_MIN / 60)
+    _REMOTE_REFILL_AT = now
+    if _REMOTE_TOKENS < 1:
+        return False
+    _REMOTE_TOKENS -= 1
+    return True
+
+
+async def _lookup_remote(query):
+    global _SESSION, _REMOTE_BLOCKED_UNTIL
+    if not _take_remote_token():
+        STATS["remote_skipped"] += 1
+        return _MISS
+    if _SESSION is None or _SESSION.closed:
+        _SESSION = aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=REMOTE_TIMEOUT))
+    try:
+        async with _SESSION.get(REMOTE_URL.format(query)) as response:
+            if response.status == 429:
+                # X-Ttl — секунды до сброса лимита ip-api
+                _REMOTE_BLOCKED_UNTIL = time.monotonic() + int(response.headers.get("X-Ttl", 60))
+                return _MISS
+            if response.status != 200:
+                return _MISS
+            data = await response.json()
+    except Exception as e:
+        logging.warning(f"GeoIP remote lookup failed for {query}: {e}")
+        return _MISS
+    STATS["remote"] += 1
+    code = data.get("countryCode") if data.get("status") == "success" else None
+    if code and len(code) == 2:
+        return code.upper(), data.get("country")
+    return None
+
+
+def _is_public_ip(value):
+    try:
+        return ipaddress.ip_address(value).is_global
+    except ValueError:
+        # Доменное имя — определить может только внешний API
+        return True
+
+
+async def lookup_country(query):
+    """(код, название или None) для IP или домена: кэш -> локальная база -> ip-api.com (если включён)."""
+    query = query.strip()
+    cached = CACHE.get(query)
+    if cached is not _MISS:
+        STATS["cache_hits"] += 1
+        return cached
+    result = lookup_local(query)
+    if result is not None:
+        STATS["local"] += 1
+        CACHE.set(query, result)
+        return result
+    if config.GEOIP_REMOTE_FALLBACK and _is_public_ip(query):
+        result = await _lookup_remote(query)
+        if result is _MISS:
+            # Лимит или ошибка сети — не кэшируем, спросим позже
+            STATS["unknown"] += 1
+            return None
+    if result is None:
+        STATS["unknown"] += 1
+    CACHE.set(query, result, None if result else NEGATIVE_TTL)
+    return result
+
+
+async def close():
+    global _SESSION
+    if _SESSION is not None and not _SESSION.closed:
+        await _SESSION.close()
+    _SESSION = None
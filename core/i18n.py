@@ -141,6 +141,14 @@ STRINGS = {
         "alert_node_disk_normal": "✅ <b>Нода '{name}': Место на диске в норме.</b>\nЗанято: <b>{usage}%</b>",
         "alert_ssh_login_detected": "🔔 <b>Обнаружен вход SSH</b>\n\n👤 Пользователь: <b>{user}</b>\n🌍 IP: <b>{flag} {ip}</b>\n⏰ Время: <b>{time}</b>{tz}",
         "alert_f2b_ban_detected": "🛡️ <b>Fail2Ban забанил IP</b>\n\n🌍 IP: <b>{flag} {ip}</b>\n⏰ Время: <b>{time}</b>{tz}",
+        "alert_f2b_ban_digest": "🛡️ <b>Fail2Ban: забанено IP: {count} за последние {seconds} с</b>\n\n🌍 Топ стран: {countries}\n🔻 Последние: {ips}\n⏰ Время: <b>{time}</b>{tz}",
+        "alert_nodes_down_digest": "🚨 <b>АЛЕРТ: Недоступны ноды ({count})!</b>\n{names}",
+        "alert_nodes_up_digest": "✅ <b>Восстановились ноды ({count}).</b>\n{names}",
+        "alert_digest_more": "и ещё {count}",
+        "alert_rule_fired": "⚠️ <b>{target}: сработало правило</b> <code>{rule}</code>\nЗначение: <b>{value}</b>",
+        "alert_rule_repeat": "‼️ <b>{target}: правило всё ещё срабатывает</b> <code>{rule}</code>\nЗначение: <b>{value}</b>",
+        "alert_rule_cleared": "✅ <b>{target}: в норме</b> <code>{rule}</code>\nЗначение: <b>{value}</b>",
+        "alert_rule_target_agent": "Агент",
         "alert_cpu_high": "⚠️ <b>Превышен порог CPU!</b>\nТекущее использование: <b>{usage:.1f}%</b> (Порог: {threshold}%)",
         "alert_cpu_high_repeat": "‼️ <b>CPU все еще ВЫСОКИЙ!</b>\nТекущее использование: <b>{usage:.1f}%</b> (Порог: {threshold}%)",
         "alert_cpu_normal": "✅ <b>Нагрузка CPU нормализовалась.</b>\nТекущее использование: <b>{usage:.1f}%</b>",
@@ -593,6 +601,14 @@ STRINGS = {
         "alert_node_disk_normal": "✅ <b>Node '{name}': Disk usage normal.</b>\nUsage: <b>{usage}%</b>",
         "alert_ssh_login_detected": "🔔 <b>SSH Login Detected</b>\n\n👤 User: <b>{user}</b>\n🌍 IP: <b>{flag} {ip}</b>\n⏰ Time: <b>{time}</b>{tz}",
         "alert_f2b_ban_detected": "🛡️ <b>Fail2Ban Banned IP</b>\n\n🌍 IP: <b>{flag} {ip}</b>\n⏰ Time: <b>{time}</b>{tz}",
+        "alert_f2b_ban_digest": "🛡️ <b>Fail2Ban: {count} IPs banned in the last {seconds} s</b>\n\n🌍 Top countries: {countries}\n🔻 Latest: {ips}\n⏰ Time: <b>{time}</b>{tz}",
+        "alert_nodes_down_digest": "🚨 <b>ALERT: {count} nodes are DOWN!</b>\n{names}",
+        "alert_nodes_up_digest": "✅ <b>{count} nodes recovered (Up).</b>\n{names}",
+        "alert_digest_more": "and {count} more",
+        "alert_rule_fired": "⚠️ <b>{target}: rule triggered</b> <code>{rule}</code>\nValue: <b>{value}</b>",
+        "alert_rule_repeat": "‼️ <b>{target}: rule still triggered</b> <code>{rule}</code>\nValue: <b>{value}</b>",
+        "alert_rule_cleared": "✅ <b>{target}: back to normal</b> <code>{rule}</code>\nValue: <b>{value}</b>",
+        "alert_rule_target_agent": "Agent",
         "alert_cpu_high": "⚠️ <b>CPU Threshold Exceeded!</b>\nCurrent usage: <b>{usage:.1f}%</b> (Threshold: {threshold}%)",
         "alert_cpu_high_repeat": "‼️ <b>CPU Still HIGH!</b>\nCurrent usage: <b>{usage:.1f}%</b> (Threshold: {threshold}%)",
         "alert_cpu_normal": "✅ <b>CPU load normalized.</b>\nCurrent usage: <b>{usage:.1f}%</b>",
@@ -0,0 +1,302 @@
+import asyncio
+import ctypes
+import ctypes.util
+import json
+import logging
+import os
+import time
+
+from .config import LOG_OFFSETS_FILE
+
+# Чтение логов без внешних `tail`: follow с учётом ротации/усечения и tail -n с конца файла.
+READ_CHUNK = 64 * 1024
+# Без inotify изменения проверяются опросом; с inotify stat всё равно делается раз в SAFETY_POLL
+POLL_INTERVAL = 1.0
+SAFETY_POLL = 30.0
+MISSING_FILE_POLL = 10.0
+CHECKPOINT_INTERVAL = 5.0
+# Сколько пропущенного за время простоя дочитывать после рестарта; остальное — с конца
+MAX_CATCHUP_BYTES = 256 * 1024
+
+IN_MODIFY = 0x00000002
+IN_ATTRIB = 0x00000004
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_NONBLOCK = os.O_NONBLOCK
+IN_CLOEXEC = os.O_CLOEXEC
+_FILE_MASK = IN_MODIFY | IN_ATTRIB | IN_MOVE_SELF | IN_DELETE_SELF
+_DIR_MASK = IN_CREATE | IN_MOVED_TO
+
+_LIBC = None
+_OFFSETS = None
+_OFFSETS_DIRTY = False
+_OFFSETS_SAVED_AT = 0.0
+
+
+def _libc():
+    """libc с inotify или None (не Linux, musl без символов и т.п.) — тогда работает опрос."""
+    global _LIBC
+    if _LIBC is None:
+        try:
+            libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+            libc.inotify_init1.argtypes = [ctypes.c_int]
+            libc.inotify_add_watch.argtypes = [ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32]
+            libc.inotify_rm_watch.argtypes = [ctypes.c_int, ctypes.c_int]
+            _LIBC = libc
+        except (OSError, AttributeError, TypeError):
+            _LIBC = False
+    return _LIBC or None
+
+
+def _load_offsets():
+    global _OFFSETS
+    if _OFFSETS is None:
+        try:
+            with open(LOG_OFFSETS_FILE, "r", encoding="utf-8") as f:
+                _OFFSETS = json.load(f)
+        except (OSError, ValueError):
+            _OFFSETS = {}
+    return _OFFSETS
+
+
+def _save_offsets():
+    global _OFFSETS_DIRTY, _OFFSETS_SAVED_AT
+    tmp = LOG_OFFSETS_FILE + ".tmp"
+    try:
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(_load_offsets(), f)
+        os.replace(tmp, LOG_OFFSETS_FILE)
+    except OSError as e:
+        logging.warning(f"Log offsets not saved: {e}")
+    _OFFSETS_DIRTY = False
+    _OFFSETS_SAVED_AT = time.monotonic()
+
+
+def read_last_lines(path, count, chunk_size=READ_CHUNK):
+    """Последние count строк файла — чтение блоками с конца, как `tail -n`."""
+    if count <= 0:
+        return []
+    with open(path, "rb") as f:
+        pos = f.seek(0, os.SEEK_END)
+        data = b""
+        while pos > 0 and data.count(b"\n") <= count:
+            step = min(chunk_size, pos)
+            pos -= step
+            f.seek(pos)
+            data = f.read(step) + data
+    return data.decode("utf-8", "ignore").splitlines()[-count:]
+
+
+class LogFollower:
+    """
+    Асинхронный `tail -F`: отслеживает ротацию (по inode) и усечение (по размеру),
+    просыпается по inotify, без него — по опросу. С checkpoint_key смещение
+    периодически сохраняется, и строки, записанные пока бот лежал, читаются после рестарта.
+    """
+
+    def __init__(self, path, checkpoint_key=None, max_catchup=MAX_CATCHUP_BYTES):
+        self.path = path
+        self.key = checkpoint_key
+        self.max_catchup = max_catchup
+        self.fd = None
+        self.inode = None
+        self.pos = 0
+        # Смещение конца последней обработанной строки — оно и сохраняется
+        self.offset = 0
+        self._partial = b""
+        self._saved_offset = None
+        self._changed = None
+        self._inotify = None
+        self._file_wd = None
+
+    # --- позиция и ротация ---
+
+    def _open(self, path, offset):
+        fd = os.open(path, os.O_RDONLY | os.O_CLOEXEC)
+        st = os.fstat(fd)
+        if offset > st.st_size:
+            offset = 0
+        if st.st_size - offset > self.max_catchup:
+            offset = self._line_start(fd, st.st_size - self.max_catchup)
+        os.lseek(fd, offset, os.SEEK_SET)
+        self._close_fd()
+        self.fd, self.inode, self.pos, self.offset = fd, st.st_ino, offset, offset
+        self._partial = b""
+        self._watch_file()
+
+    @staticmethod
+    def _line_start(fd, offset):
+        # Первая полная строка после offset, чтобы не начинать с середины
+        chunk = os.pread(fd, READ_CHUNK, offset)
+        nl = chunk.find(b"\n")
+        return offset + nl + 1 if nl >= 0 else offset
+
+    def _open_initial(self):
+        saved = _load_offsets().get(self.key) if self.key else None
+        try:
+            st = os.stat(self.path)
+        except FileNotFoundError:
+            return False
+        if not saved:
+            self._open(self.path, st.st_size)
+        elif saved.get("inode") == st.st_ino:
+            self._open(self.path, saved.get("offset", 0))
+        else:
+            # Файл сменился, пока бот не работал: дочитываем ротированную копию, затем новый с начала
+            rotated = self.path + ".1"
+            try:
+                if os.stat(rotated).st_ino == saved.get("inode"):
+                    self._open(rotated, saved.get("offset", 0))
+                    return True
+            except FileNotFoundError:
+                pass
+            self._open(self.path, 0)
+        return True
+
+    def _state(self):
+        try:
+            st = os.stat(self.path)
+        except FileNotFoundError:
+            return "missing"
+        if st.st_ino != self.inode:
+            return "rotated"
+        if st.st_size < self.pos:
+            return "truncated"
+        return "ok"
+
+    # --- чтение ---
+
+    def _read_lines(self):
+        """Дочитывает всё доступное; возвращает список сырых строк (без \\n)."""
+        lines = []
+        while True:
+            data = os.read(self.fd, READ_CHUNK)
+            if not data:
+                return lines
+            self.pos += len(data)
+            parts = (self._partial + data).split(b"\n")
+            self._partial = parts.pop()
+            lines.extend(parts)
+
+    def _checkpoint(self, force=False):
+        """Во время потока строк пишет на диск не чаще CHECKPOINT_INTERVAL, перед простоем — сразу."""
+        global _OFFSETS_DIRTY
+        if not self.key or self.fd is None:
+            return
+        if self.offset != self._saved_offset:
+            _load_offsets()[self.key] = {"inode": self.inode, "offset": self.offset}
+            self._saved_offset = self.offset
+            _OFFSETS_DIRTY = True
+        if _OFFSETS_DIRTY and (force or time.monotonic() - _OFFSETS_SAVED_AT >= CHECKPOINT_INTERVAL):
+            _save_offsets()
+
+    async def lines(self):
+        """Асинхронный генератор новых строк (str, без пробелов по краям, пустые пропускаются)."""
+        self._changed = asyncio.Event()
+        self._start_inotify()
+        try:
+            while self.fd is None:
+                if self._open_initial():
+                    break
+                await self._wait(MISSING_FILE_POLL)
+            while True:
+                for raw in self._read_lines():
+                    line = raw.decode("utf-8", "ignore").strip()
+                    if line:
+                        yield line
+                    self.offset += len(raw) + 1
+                    self._checkpoint()
+
+                state = self._state()
+                if state == "rotated":
+                    # Старый файл уже дочитан выше; недописанный хвост без \n тоже отдаём
+                    tail = self._partial.decode("utf-8", "ignore").strip()
+                    self._partial = b""
+                    if tail:
+                        yield tail
+                    try:
+                        self._open(self.path, 0)
+                        logging.info(f"Log rotated, following new file: {self.path}")
+                        continue
+                    except FileNotFoundError:
+                        pass
+                elif state == "truncated":
+                    logging.info(f"Log truncated, reading from start: {self.path}")
+                    os.lseek(self.fd, 0, os.SEEK_SET)
+                    self.pos = self.offset = 0
+                    self._partial = b""
+                    continue
+
+                self._checkpoint(force=True)
+                self._changed.clear()
+                if self._inotify is not None:
+                    await self._wait(SAFETY_POLL)
+                else:
+                    await self._wait(MISSING_FILE_POLL if state == "missing" else POLL_INTERVAL)
+        finally:
+            self._checkpoint(force=True)
+            self.close()
+
+    async def _wait(self, timeout):
+        waiter = asyncio.ensure_future(self._changed.wait())
+        try:
+            # asyncio.wait, а не wait_for: последний до 3.12 может потерять отмену задачи
+            await asyncio.wait({waiter}, timeout=timeout)
+        finally:
+            waiter.cancel()
+
+    # --- inotify ---
+
+    def _start_inotify(self):
+        libc = _libc()
+        if libc is None:
+            return
+        fd = libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if fd < 0:
+            logging.warning(f"inotify unavailable ({os.strerror(ctypes.get_errno())}), polling {self.path}")
+            return
+        # Каталог — чтобы заметить создание нового файла после ротации
+        directory = os.path.dirname(os.path.abspath(self.path))
+        if libc.inotify_add_watch(fd, directory.encode(), _DIR_MASK) < 0:
+            os.close(fd)
+            return
+        self._inotify = fd
+        asyncio.get_running_loop().add_reader(fd, self._on_inotify)
+        self._watch_file()
+
+    def _watch_file(self):
+        if self._inotify is None:
+            return
+        libc = _libc()
+        if self._file_wd is not None:
+            libc.inotify_rm_watch(self._inotify, self._file_wd)
+        wd = libc.inotify_add_watch(self._inotify, self.path.encode(), _FILE_MASK)
+        self._file_wd = wd if wd >= 0 else None
+
+    def _on_inotify(self):
+        try:
+            while os.read(self._inotify, 4096):
+                pass
+        except BlockingIOError:
+            pass
+        except OSError:
+            return
+        self._changed.set()
+
+    def _close_fd(self):
+        if self.fd is not None:
+            os.close(self.fd)
+            self.fd = None
+
+    def close(self):
+        self._close_fd()
+        if self._inotify is not None:
+            try:
+                asyncio.get_running_loop().remove_reader(self._inotify)
+            except RuntimeError:
+                pass
+            os.close(self._inotify)
+            self._inotify = None
+            self._file_wd = None
@@ -1,14 +1,66 @@
 import logging
 import asyncio
+import time
 from typing import Union, Callable
 from aiogram import Bot
-from aiogram.exceptions import TelegramBadRequest, TelegramRetryAfter
+from aiogram.exceptions import TelegramBadRequest, TelegramForbiddenError, TelegramRetryAfter
 from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton
 
 from .i18n import _, get_user_lang
 from . import config
 from .shared_state import LAST_MESSAGE_IDS, ALERTS_CONFIG
 
+# Очередь исходящих алертов: send_alert только ставит сообщения в очередь,
+# отправкой занимается dispatcher_loop с учётом лимитов Telegram.
+# ~30 сообщений/с на бота, ~1 сообщение/с в один чат — берём с запасом:
+# в любом окне 1 с уходит не больше GLOBAL_RATE + GLOBAL_BURST сообщений.
+GLOBAL_RATE = 25
+GLOBAL_BURST = 5
+CHAT_RATE = 1
+CHAT_BURST = 2
+MAX_IN_FLIGHT = 8
+MAX_QUEUE_SIZE = 1000
+MAX_ATTEMPTS = 3
+# Меньше — важнее. Неизвестные типы идут с приоритетом DEFAULT_PRIORITY
+ALERT_PRIORITIES = {"downtime": 0, "resources": 1, "logins": 2, "bans": 3}
+DEFAULT_PRIORITY = 2
+
+_QUEUE = []
+_SEQ = 0
+_IN_FLIGHT = 0
+_PAUSED_UNTIL = 0.0
+_WAKEUP = asyncio.Event()
+_IDLE = asyncio.Event()
+_IDLE.set()
+_CHAT_BUCKETS = {}
+QUEUE_STATS = {"queued": 0, "sent": 0, "failed": 0, "dropped": 0, "retry_after": 0}
+
+
+class TokenBucket:
+    """Классический token bucket: rate токенов в секунду, не больше burst."""
+
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+
+    def _refill(self, now):
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, now):
+        """Секунды до появления токена (0 — можно отправлять)."""
+        self._refill(now)
+        return 0.0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+
+    def take(self, now):
+        self._refill(now)
+        self.tokens -= 1
+
+
+_GLOBAL_BUCKET = TokenBucket(GLOBAL_RATE, GLOBAL_BURST)
+
 
 async def delete_previous_message(
         user_id: int,
@@ -40,13 +92,181 @@ async def send_support_message(bot: Bot, user_id: int, lang: str):
             f"Не удалось отправить сообщение о поддержке пользователю {user_id}: {e}")
 
 
+def _enqueue(bot, chat_id, text, alert_type, attempts=0):
+    """Кладёт сообщение в очередь; при переполнении вытесняет наименее важное."""
+    global _SEQ
+    priority = ALERT_PRIORITIES.get(alert_type, DEFAULT_PRIORITY)
+    if len(_QUEUE) >= MAX_QUEUE_SIZE:
+        worst = max(range(len(_QUEUE)), key=lambda i: _QUEUE[i][:2])
+        if _QUEUE[worst][0] <= priority:
+            QUEUE_STATS["dropped"] += 1
+            return False
+        _QUEUE[worst] = _QUEUE[-1]
+        _QUEUE.pop()
+        QUEUE_STATS["dropped"] += 1
+    _SEQ += 1
+    # Повторные попытки сохраняют приоритет, но встают в конец своей очереди
+    _QUEUE.append((priority, _SEQ, chat_id, text, alert_type, attempts, bot))
+    QUEUE_STATS["queued"] += 1
+    _IDLE.clear()
+    _WAKEUP.set()
+    return True
+
+
+def _chat_bucket(chat_id):
+    bucket = _CHAT_BUCKETS.get(chat_id)
+    if bucket is None:
+        bucket = _CHAT_BUCKETS[chat_id] = TokenBucket(CHAT_RATE, CHAT_BURST)
+    return bucket
+
+
+def _pick(now):
+    """Индекс самого важного сообщения, чей чат не упёрся в лимит, и время ожидания остальных."""
+    best = None
+    soonest = None
+    for i, item in enumerate(_QUEUE):
+        if best is not None and item[:2] > _QUEUE[best][:2]:
+            continue
+        wait = _chat_bucket(item[2]).wait_time(now)
+        if wait <= 0:
+            best = i
+        elif soonest is None or wait < soonest:
+            soonest = wait
+    return best, soonest
+
+
+def get_queue_stats():
+    """Глубина очереди (всего и по типам) и счётчики отправки."""
+    by_type = {}
+    for item in _QUEUE:
+        by_type[item[4]] = by_type.get(item[4], 0) + 1
+    return {
+        "depth": len(_QUEUE),
+        "depth_by_type": by_type,
+        "in_flight": _IN_FLIGHT,
+        "paused_for": round(max(0.0, _PAUSED_UNTIL - time.monotonic()), 1),
+        **QUEUE_STATS}
+
+
+async def _wait_wakeup(timeout):
+    waiter = asyncio.ensure_future(_WAKEUP.wait())
+    try:
+        await asyncio.wait({waiter}, timeout=timeout)
+    finally:
+        waiter.cancel()
+
+
+async def _deliver(item, slots):
+    global _IN_FLIGHT, _PAUSED_UNTIL
+    priority, _seq, chat_id, text, alert_type, attempts, bot = item
+    try:
+        await bot.send_message(chat_id, text, parse_mode="HTML")
+        QUEUE_STATS["sent"] += 1
+    except TelegramRetryAfter as e:
+        # Флуд-контроль: ставим на паузу всю очередь, сообщение возвращаем
+        QUEUE_STATS["retry_after"] += 1
+        _PAUSED_UNTIL = max(_PAUSED_UNTIL, time.monotonic() + e.retry_after)
+        logging.warning(
+            f"send_alert: TelegramRetryAfter для {chat_id}: очередь на паузе {e.retry_after}с")
+        _enqueue(bot, chat_id, text, alert_type, attempts)
+    except (TelegramBadRequest, TelegramForbiddenError) as e:
+        QUEUE_STATS["failed"] += 1
+        if "chat not found" in str(e) or "bot was blocked by the user" in str(e):
+            logging.warning(
+                f"Не удалось отправить алерт пользователю {chat_id}: чат не найден или бот заблокирован.")
+        else:
+            logging.error(
+                f"Неизвестная ошибка Telegram при отправке алерта {chat_id}: {e}")
+    except Exception as e:
+        if attempts + 1 < MAX_ATTEMPTS:
+            logging.warning(
+                f"Ошибка при отправке алерта пользователю {chat_id}, повтор: {e}")
+            _enqueue(bot, chat_id, text, alert_type, attempts + 1)
+        else:
+            QUEUE_STATS["failed"] += 1
+            logging.error(
+                f"Ошибка при отправке алерта пользователю {chat_id}: {e}")
+    finally:
+        _IN_FLIGHT -= 1
+        slots.release()
+        if not _QUEUE and not _IN_FLIGHT:
+            _IDLE.set()
+
+
+async def _next_item():
+    """Ждёт, пока самое важное из доступных сообщений можно отправить, и забирает его из очереди."""
+    while True:
+        if not _QUEUE:
+            _WAKEUP.clear()
+            await _wait_wakeup(None)
+            continue
+        now = time.monotonic()
+        if now < _PAUSED_UNTIL:
+            await asyncio.sleep(_PAUSED_UNTIL - now)
+            continue
+        index, soonest = _pick(now)
+        if index is None:
+            # Все ожидающие чаты упёрлись в лимит; новое сообщение может прийти в свободный чат
+            _WAKEUP.clear()
+            await _wait_wakeup(soonest)
+            continue
+        wait = _GLOBAL_BUCKET.wait_time(now)
+        if wait > 0:
+            await asyncio.sleep(wait)
+            continue
+        item = _QUEUE[index]
+        _QUEUE[index] = _QUEUE[-1]
+        _QUEUE.pop()
+        _GLOBAL_BUCKET.take(now)
+        _chat_bucket(item[2]).take(now)
+        return item
+
+
+async def dispatcher_loop():
+    """Фоновая задача: отправляет сообщения из очереди по приоритету в рамках лимитов."""
+    global _IN_FLIGHT
+    logging.info("Alert dispatcher started.")
+    slots = asyncio.Semaphore(MAX_IN_FLIGHT)
+    tasks = set()
+    try:
+        while True:
+            await slots.acquire()
+            try:
+                item = await _next_item()
+            except BaseException:
+                slots.release()
+                raise
+            _IN_FLIGHT += 1
+            task = asyncio.create_task(_deliver(item, slots))
+            tasks.add(task)
+            task.add_done_callback(tasks.discard)
+    except asyncio.CancelledError:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        if _QUEUE:
+            logging.warning(f"Alert dispatcher stopped, {len(_QUEUE)} messages not sent.")
+        else:
+            logging.info("Alert dispatcher stopped.")
+
+
+async def drain_alerts(timeout):
+    """Ждёт отправки очереди (при остановке бота), не дольше timeout секунд."""
+    waiter = asyncio.ensure_future(_IDLE.wait())
+    try:
+        await asyncio.wait({waiter}, timeout=timeout)
+    finally:
+        waiter.cancel()
+    return not _QUEUE and not _IN_FLIGHT
+
+
 async def send_alert(
         bot: Bot, message_or_func: Union[str, Callable[[str], str]], alert_type: str):
+    """Ставит алерт в очередь для всех подписанных пользователей и сразу возвращается."""
     if not alert_type:
         logging.warning("send_alert вызван без указания alert_type")
         return
 
-    sent_count = 0
     users_to_alert = []
 
     for user_id, config_data in ALERTS_CONFIG.items():
@@ -58,9 +278,7 @@ async def send_alert(
                      config.DEFAULT_LANGUAGE, alert_type=alert_type))
         return
 
-    logging.info(_("alert_sending_to_users", config.DEFAULT_LANGUAGE,
-                 alert_type=alert_type, count=len(users_to_alert)))
-
+    queued = 0
     for user_id in users_to_alert:
         try:
             lang = get_user_lang(user_id)
@@ -73,36 +291,12 @@ async def send_alert(
             if not text_to_send:
                 continue
 
-            await bot.send_message(user_id, text_to_send, parse_mode="HTML")
-            sent_count += 1
-            await asyncio.sleep(0.1)
+            if _enqueue(bot, user_id, text_to_send, alert_type):
+                queued += 1
 
-        except TelegramBadRequest as e:
-            if "chat not found" in str(
-                    e) or "bot was blocked by the user" in str(e):
-                logging.warning(
-                    f"Не удалось отправить алерт пользователю {user_id}: чат не найден или бот заблокирован.")
-            else:
-                logging.error(
-                    f"Неизвестная ошибка TelegramBadRequest при отправке алерта {user_id}: {e}")
-        except TelegramRetryAfter as e:
-            logging.warning(
-                f"send_alert: TelegramRetryAfter для {user_id}: Ждем {e.retry_after}с")
-            await asyncio.sleep(e.retry_after)
-            try:
-                if callable(message_or_func):
-                    text_to_send = message_or_func(lang)
-                else:
-                    text_to_send = message_or_func
-
-                await bot.send_message(user_id, text_to_send, parse_mode="HTML")
-                sent_count += 1
-            except Exception as retry_e:
-                logging.error(
-                    f"Ошибка при повторной отправке алерта {user_id} после RetryAfter: {retry_e}")
         except Exception as e:
             logging.error(
-                f"Ошибка при отправке алерта пользователю {user_id}: {e}")
+                f"Ошибка при подготовке алерта пользователю {user_id}: {e}")
 
-    logging.info(_("alert_sent_to_users", config.DEFAULT_LANGUAGE,
-                 alert_type=alert_type, count=sent_count))
+    logging.info(_("alert_sending_to_users", config.DEFAULT_LANGUAGE,
+                 alert_type=alert_type, count=queued))
@@ -1,17 +1,164 @@
 import aiosqlite
+import asyncio
 import json
 import logging
 import secrets
+import sqlite3
 import time
 import os
+from contextlib import asynccontextmanager
 from .config import CONFIG_DIR
+from . import config as current_config
 
 DB_PATH = os.path.join(CONFIG_DIR, "nodes.db")
 LEGACY_JSON_PATH = os.path.join(CONFIG_DIR, "nodes.json")
 
+# Метрики нод хранятся построчно в node_metrics (см. update_node_heartbeat),
+# агрегаты min/avg/max — в таблицах уровней (см. core/rollups.py)
+METRICS_RETENTION = 24 * 3600
+HISTORY_WINDOW = 300
+ROLLUP_TABLES = ("node_metrics_1m", "node_metrics_1h", "node_metrics_1d")
+# Псевдо-токен, под которым в node_metrics пишутся метрики самого агента
+AGENT_METRICS_TOKEN = "agent"
+# Агрегаты семплов ноды за интервал heartbeat (stats["agg"]); у старых нод и агента — NULL
+METRIC_AGG_COLUMNS = ("cpu_min", "cpu_max", "cpu_p95", "ram_min", "ram_max", "ram_p95")
+_METRICS_COLUMNS = ("token", "t", "cpu", "ram", "disk", "rx", "tx") + METRIC_AGG_COLUMNS
+_METRICS_INSERT_SQL = (f"INSERT OR {{}} INTO node_metrics ({', '.join(_METRICS_COLUMNS)}) "
+                       f"VALUES ({', '.join('?' for _ in _METRICS_COLUMNS)})")
+
+# Буфер отложенной записи heartbeat: сбрасывается раз в интервал или по заполнению
+HEARTBEAT_FLUSH_INTERVAL = 1.0
+HEARTBEAT_FLUSH_MAX = 500
+
+# DELETE ... RETURNING появился в SQLite 3.35
+_HAS_RETURNING = sqlite3.sqlite_version_info >= (3, 35, 0)
+# JSON1 встроен начиная с 3.38, в более старых сборках может отсутствовать (проверяется в init_db)
+_HAS_JSON1 = True
+
+# Частичное обновление extra_state одним UPDATE, без чтения и пересборки JSON в Python
+_EXTRA_SET_SQL = (
+    "UPDATE nodes SET extra_state = json_set(COALESCE(NULLIF(extra_state, ''), '{}'), ?, json(?)) "
+    "WHERE token = ?")
+
+# Долгоживущие соединения: один писатель + небольшой пул читателей (WAL)
+READER_POOL_SIZE = 3
+DB_PRAGMAS = (
+    "PRAGMA journal_mode=WAL",
+    "PRAGMA synchronous=NORMAL",
+    "PRAGMA cache_size=-8000",
+    "PRAGMA temp_store=MEMORY",
+    "PRAGMA busy_timeout=5000",
+)
+
+_WRITER = None
+_READERS = None
+_READER_CONNS = []
+_WRITE_LOCK = asyncio.Lock()
+_POOL_LOCK = asyncio.Lock()
+
+_PENDING_HEARTBEATS = {}
+_PENDING_METRICS = []
+_FLUSH_EVENT = asyncio.Event()
+_FLUSH_LOCK = asyncio.Lock()
+
+# Токены нод, для которых в node_tasks есть задачи (чтобы не трогать БД на каждом heartbeat)
+_TASK_TOKENS = set()
+# Long-poll heartbeat: token -> события запаркованных запросов, будятся из update_node_task и watch_node
+_TASK_WAITERS = {}
+
+# Адаптивный интервал heartbeat: пока ноду смотрят или ей шлют команды, она отчитывается
+# со своим интервалом, иначе — не чаще NODE_IDLE_INTERVAL
+NODE_WATCH_TTL = 30
+MAX_NODE_INTERVAL = 300
+# Нода считается оффлайн, если пропустила столько назначенных интервалов (но не раньше NODE_OFFLINE_TIMEOUT)
+OFFLINE_MISSED_INTERVALS = 3
+_WATCHED_UNTIL = {}
+
+# Реестр нод в памяти: загружается из SQLite один раз и дальше обновляется на месте.
+# Каждое изменение увеличивает глобальную версию, нода запоминает версию своего последнего изменения.
+_REGISTRY = {}
+_REGISTRY_VERSION = 0
+_REGISTRY_LOADED = False
+
+
+async def _open_connection():
+    db = await aiosqlite.connect(DB_PATH)
+    db.row_factory = aiosqlite.Row
+    for pragma in DB_PRAGMAS:
+        await db.execute(pragma)
+    return db
+
+
+async def _ensure_pool():
+    global _WRITER, _READERS
+    if _WRITER is not None:
+        return
+    async with _POOL_LOCK:
+        if _WRITER is not None:
+            return
+        writer = await _open_connection()
+        readers = asyncio.Queue()
+        for _ in range(READER_POOL_SIZE):
+            conn = await _open_connection()
+            _READER_CONNS.append(conn)
+            readers.put_nowait(conn)
+        _READERS = readers
+        _WRITER = writer
+
+
+@asynccontextmanager
+async def write_db():
+    """
+    Единственное соединение-писатель nodes.db — общее для всех модулей с таблицами
+    в этой БД (rollups). Коммит по выходу, откат при ошибке.
+    """
+    await _ensure_pool()
+    async with _WRITE_LOCK:
+        try:
+            yield _WRITER
+            await _WRITER.commit()
+        except BaseException:
+            # В том числе CancelledError: иначе недописанная транзакция уйдёт в чужой коммит
+            await _WRITER.rollback()
+            raise
+
+
+@asynccontextmanager
+async def read_db():
+    """Соединение-читатель из пула на время блока."""
+    await _ensure_pool()
+    db = await _READERS.get()
+    try:
+        yield db
+    finally:
+        _READERS.put_nowait(db)
+
+
+async def close_db():
+    global _WRITER, _READERS
+    if _WRITER is not None:
+        try:
+            await flush_heartbeats()
+        except Exception as e:
+            logging.error(f"Final heartbeat flush failed: {e}", exc_info=True)
+    async with _POOL_LOCK:
+        conns = list(_READER_CONNS)
+        if _WRITER is not None:
+            conns.append(_WRITER)
+        _READER_CONNS.clear()
+        _WRITER = None
+        _READERS = None
+    for conn in conns:
+        try:
+            await conn.close()
+        except Exception as e:
+            logging.error(f"Error closing DB connection: {e}")
+    if conns:
+        logging.info("Database connections closed.")
+
 
 async def init_db():
-    async with aiosqlite.connect(DB_PATH) as db:
+    async with write_db() as db:
         await db.execute("""
             CREATE TABLE IF NOT EXISTS nodes (
                 token TEXT PRIMARY KEY,
@@ -25,10 +172,155 @@ async def init_db():
                 extra_state TEXT
             )
         """)
-        await db.commit()
+        await db.execute("""
+            CREATE TABLE IF NOT EXISTS node_metrics (
+                token TEXT NOT NULL,
+                t INTEGER NOT NULL,
+                cpu REAL,
+                ram REAL,
+                disk REAL,
+                rx INTEGER,
+                tx INTEGER,
+                cpu_min REAL, cpu_max REAL, cpu_p95 REAL,
+                ram_min REAL, ram_max REAL, ram_p95 REAL
+            )
+        """)
+        await _add_missing_columns(db, "node_metrics", {col: "REAL" for col in METRIC_AGG_COLUMNS})
+        await db.execute(
+            "CREATE UNIQUE INDEX IF NOT EXISTS idx_node_metrics_token_t ON node_metrics (token, t)")
+        # Агрегация и очистка идут по времени сразу по всем нодам
+        await db.execute("CREATE INDEX IF NOT EXISTS idx_node_metrics_t ON node_metrics (t)")
+        await db.execute("""
+            CREATE TABLE IF NOT EXISTS node_tasks (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                token TEXT NOT NULL,
+                command TEXT NOT NULL,
+                user_id INTEGER,
+                created_at REAL,
+                priority INTEGER DEFAULT 0,
+                expires_at REAL
+            )
+        """)
+        await db.execute(
+            "CREATE INDEX IF NOT EXISTS idx_node_tasks_token ON node_tasks (token)")
+        for table in ROLLUP_TABLES:
+            await db.execute(f"""
+                CREATE TABLE IF NOT EXISTS {table} (
+                    token TEXT NOT NULL,
+                    t INTEGER NOT NULL,
+                    n INTEGER NOT NULL,
+                    cpu_min REAL, cpu_avg REAL, cpu_max REAL,
+                    ram_min REAL, ram_avg REAL, ram_max REAL,
+                    disk_min REAL, disk_avg REAL, disk_max REAL,
+                    rx INTEGER,
+                    tx INTEGER,
+                    PRIMARY KEY (token, t)
+                )
+            """)
+            await db.execute(f"CREATE INDEX IF NOT EXISTS idx_{table}_t ON {table} (t)")
+        await db.execute("""
+            CREATE TABLE IF NOT EXISTS rollup_state (
+                tier TEXT PRIMARY KEY,
+                done_until INTEGER NOT NULL
+            )
+        """)
+        # Состояние правил алертов (core.alert_rules): переживает рестарт
+        await db.execute("""
+            CREATE TABLE IF NOT EXISTS alert_state (
+                rule TEXT NOT NULL,
+                target TEXT NOT NULL,
+                active INTEGER NOT NULL,
+                pending_since REAL,
+                fired_at REAL,
+                notified_at REAL,
+                PRIMARY KEY (rule, target)
+            )
+        """)
 
     logging.info(f"Database initialized at {DB_PATH}")
     await _migrate_from_json_if_needed()
+    await _migrate_history_blobs()
+    await _migrate_task_blobs()
+
+    async with read_db() as db:
+        async with db.execute("SELECT DISTINCT token FROM node_tasks") as cursor:
+            _TASK_TOKENS.update(row['token'] for row in await cursor.fetchall())
+        await _check_json1(db)
+    await _load_registry()
+
+
+async def _add_missing_columns(db, table: str, columns: dict):
+    """Догоняет схему таблицы, созданной старой версией (ALTER TABLE ADD COLUMN)."""
+    async with db.execute(f"PRAGMA table_info({table})") as cursor:
+        existing = {row['name'] for row in await cursor.fetchall()}
+    for name, col_type in columns.items():
+        if name not in existing:
+            await db.execute(f"ALTER TABLE {table} ADD COLUMN {name} {col_type}")
+            logging.info(f"Added column {table}.{name}")
+
+
+async def _check_json1(db):
+    global _HAS_JSON1
+    try:
+        await db.execute("SELECT json_set('{}', '$.a', json('1'))")
+        _HAS_JSON1 = True
+    except sqlite3.OperationalError:
+        _HAS_JSON1 = False
+        logging.warning("SQLite JSON1 is not available, extra_state updates fall back to read-modify-write.")
+
+
+async def _migrate_history_blobs():
+    """Однократный перенос устаревшей JSON-колонки history в таблицу node_metrics."""
+    try:
+        async with write_db() as db:
+            async with db.execute("SELECT token, history FROM nodes WHERE history IS NOT NULL AND history NOT IN ('', '[]')") as cursor:
+                rows = await cursor.fetchall()
+            if not rows:
+                return
+
+            points = []
+            for row in rows:
+                try:
+                    history = json.loads(row['history'])
+                except (TypeError, ValueError):
+                    continue
+                for p in history:
+                    points.append((row['token'], int(p.get("t", 0)), p.get("c", 0), p.get("r", 0), None, p.get("rx", 0), p.get("tx", 0)))
+
+            await db.executemany(
+                "INSERT OR IGNORE INTO node_metrics (token, t, cpu, ram, disk, rx, tx) VALUES (?, ?, ?, ?, ?, ?, ?)", points)
+            await db.execute("UPDATE nodes SET history = NULL")
+        logging.info(f"Migrated {len(points)} history points of {len(rows)} nodes to node_metrics.")
+    except Exception as e:
+        logging.error(f"History migration failed: {e}", exc_info=True)
+
+
+async def _migrate_task_blobs():
+    """Однократный перенос очереди задач из JSON-колонки nodes.tasks в таблицу node_tasks."""
+    try:
+        async with write_db() as db:
+            async with db.execute("SELECT token, tasks FROM nodes WHERE tasks IS NOT NULL AND tasks NOT IN ('', '[]')") as cursor:
+                rows = await cursor.fetchall()
+            if not rows:
+                return
+
+            now = time.time()
+            tasks = []
+            for row in rows:
+                try:
+                    queued = json.loads(row['tasks'])
+                except (TypeError, ValueError):
+                    continue
+                for task in queued:
+                    if task.get("command"):
+                        tasks.append((row['token'], task["command"], task.get("user_id"), now))
+
+            await db.executemany(
+                "INSERT INTO node_tasks (token, command, user_id, created_at) VALUES (?, ?, ?, ?)", tasks)
+            await db.execute("UPDATE nodes SET tasks = NULL")
+        logging.info(f"Migrated {len(tasks)} queued tasks to node_tasks.")
+    except Exception as e:
+        logging.error(f"Task queue migration failed: {e}", exc_info=True)
 
 
 async def _migrate_from_json_if_needed():
@@ -44,7 +336,7 @@ async def _migrate_from_json_if_needed():
             logging.info("nodes.json is empty. Skipping.")
             return
 
-        async with aiosqlite.connect(DB_PATH) as db:
+        async with write_db() as db:
             count = 0
             for token, node in data.items():
                 cursor = await db.execute("SELECT 1 FROM nodes WHERE token = ?", (token,))
@@ -66,7 +358,6 @@ async def _migrate_from_json_if_needed():
                     )
                 )
                 count += 1
-            await db.commit()
 
         os.rename(LEGACY_JSON_PATH, LEGACY_JSON_PATH + ".bak")
         logging.info(
@@ -76,123 +367,465 @@ async def _migrate_from_json_if_needed():
         logging.error(f"CRITICAL: Migration failed: {e}", exc_info=True)
 
 
-def _deserialize_node(row, include_history=True):
+def _deserialize_node(row):
     base = {
         "token": row['token'],
         "name": row['name'],
         "created_at": row['created_at'],
         "last_seen": row['last_seen'],
         "ip": row['ip'],
-        "stats": json.loads(row['stats']) if row['stats'] else {},
-        "tasks": json.loads(row['tasks']) if row['tasks'] else []
+        "stats": json.loads(row['stats']) if row['stats'] else {}
     }
-    if include_history:
-        base["history"] = json.loads(row['history']) if row['history'] else []
-    
     extra = json.loads(row['extra_state']) if row['extra_state'] else {}
     return {**base, **extra}
 
 
-async def get_all_nodes():
+def _touch(node: dict = None):
+    global _REGISTRY_VERSION
+    _REGISTRY_VERSION += 1
+    if node is not None:
+        node["version"] = _REGISTRY_VERSION
+
+
+async def _load_registry():
+    global _REGISTRY_LOADED
     nodes = {}
-    async with aiosqlite.connect(DB_PATH) as db:
-        db.row_factory = aiosqlite.Row
-        # Оптимизация RAM: НЕ выбираем history, так как она может быть большой и не нужна для листинга
-        async with db.execute("SELECT token, name, created_at, last_seen, ip, stats, tasks, extra_state FROM nodes") as cursor:
+    async with read_db() as db:
+        async with db.execute("SELECT token, name, created_at, last_seen, ip, stats, extra_state FROM nodes") as cursor:
             async for row in cursor:
-                nodes[row['token']] = _deserialize_node(row, include_history=False)
-    return nodes
+                node = _deserialize_node(row)
+                _touch(node)
+                nodes[row['token']] = node
+    _REGISTRY.clear()
+    _REGISTRY.update(nodes)
+    _REGISTRY_LOADED = True
+    logging.info(f"Node registry loaded: {len(nodes)} nodes.")
 
 
-async def get_node_by_token(token: str):
-    async with aiosqlite.connect(DB_PATH) as db:
-        db.row_factory = aiosqlite.Row
-        async with db.execute("SELECT * FROM nodes WHERE token = ?", (token,)) as cursor:
-            row = await cursor.fetchone()
-            if row:
-                return _deserialize_node(row, include_history=True)
-    return None
+def get_registry_version() -> int:
+    """Глобальная версия реестра: меняется при любом изменении любой ноды."""
+    return _REGISTRY_VERSION
+
+
+def get_node_version(token: str) -> int:
+    node = _REGISTRY.get(token)
+    return node["version"] if node else 0
+
+
+async def get_all_nodes():
+    if not _REGISTRY_LOADED:
+        await _load_registry()
+    # Поверхностные копии: вызывающий код может менять ключи верхнего уровня, не трогая реестр
+    return {token: dict(node) for token, node in _REGISTRY.items()}
+
+
+async def get_node_by_token(token: str, include_history: bool = False):
+    if not _REGISTRY_LOADED:
+        await _load_registry()
+    node = _REGISTRY.get(token)
+    if not node:
+        return None
+    node = dict(node)
+    if include_history:
+        node["history"] = await get_node_history(token)
+    return node
+
+
+async def get_node_history(token: str, start: float = None, end: float = None, limit: int = None):
+    """Точки метрик ноды за интервал [start, end] (по умолчанию — последние HISTORY_WINDOW секунд)."""
+    if start is None:
+        start = time.time() - HISTORY_WINDOW
+    query = "SELECT t, cpu, ram, disk, rx, tx, cpu_max, ram_max FROM node_metrics WHERE token = ? AND t >= ?"
+    params = [token, int(start)]
+    if end is not None:
+        query += " AND t <= ?"
+        params.append(int(end))
+    if limit:
+        # Последние `limit` точек, но в хронологическом порядке
+        query = f"SELECT * FROM ({query} ORDER BY t DESC LIMIT ?) ORDER BY t"
+        params.append(int(limit))
+    else:
+        query += " ORDER BY t"
+    async with read_db() as db:
+        async with db.execute(query, params) as cursor:
+            rows = await cursor.fetchall()
+    return [metric_point(r) for r in rows]
+
+
+def metric_point(row) -> dict:
+    """Строка node_metrics -> точка истории; пики за интервал есть только у нод с семплированием."""
+    point = {"t": row['t'], "c": row['cpu'], "r": row['ram'], "d": row['disk'], "rx": row['rx'], "tx": row['tx']}
+    if row['cpu_max'] is not None:
+        point["c_max"] = row['cpu_max']
+        point["r_max"] = row['ram_max']
+    return point
+
+
+async def prune_metrics(max_age: int = METRICS_RETENTION, table: str = "node_metrics") -> int:
+    """Удаляет устаревшие точки метрик одним DELETE."""
+    cutoff = int(time.time() - max_age)
+    async with write_db() as db:
+        cursor = await db.execute(f"DELETE FROM {table} WHERE t < ?", (cutoff,))
+        deleted = cursor.rowcount
+    if deleted:
+        logging.info(f"Pruned {deleted} points older than {max_age}s from {table}.")
+    return deleted
 
 
 async def create_node(name: str) -> str:
     token = secrets.token_hex(16)
     now = time.time()
-    async with aiosqlite.connect(DB_PATH) as db:
+    async with write_db() as db:
         await db.execute(
             "INSERT INTO nodes (token, name, created_at, last_seen, ip, stats, history, tasks, extra_state) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
-            (token, name, now, 0, "Unknown", "{}", "[]", "[]", "{}")
+            (token, name, now, 0, "Unknown", "{}", None, None, "{}")
         )
-        await db.commit()
+    node = {"token": token, "name": name, "created_at": now, "last_seen": 0, "ip": "Unknown", "stats": {}}
+    _touch(node)
+    _REGISTRY[token] = node
     logging.info(f"Created new node: {name} (Token: {token[:8]}...)")
     return token
 
 
 async def delete_node(token: str):
-    async with aiosqlite.connect(DB_PATH) as db:
+    async with write_db() as db:
         await db.execute("DELETE FROM nodes WHERE token = ?", (token,))
-        await db.commit()
+        await db.execute("DELETE FROM node_metrics WHERE token = ?", (token,))
+        await db.execute("DELETE FROM node_tasks WHERE token = ?", (token,))
+    _TASK_TOKENS.discard(token)
+    _WATCHED_UNTIL.pop(token, None)
+    _PENDING_HEARTBEATS.pop(token, None)
+    _PENDING_METRICS[:] = [p for p in _PENDING_METRICS if p[0] != token]
+    if _REGISTRY.pop(token, None) is not None:
+        _touch()
     safe_token = token.replace('\r\n', '').replace('\n', '').replace('\r', '')[:8]
     logging.info(f"Node deleted: {safe_token}...")
 
 
+def queue_heartbeat(token: str, ip: str, stats: dict):
+    """Ставит heartbeat в буфер без обращения к БД. Запись делает heartbeat_flusher()."""
+    now = time.time()
+    agg = None
+    if "agg" in stats:
+        # Агрегаты идут только в node_metrics, в строку ноды и реестр — мгновенные значения
+        stats = dict(stats)
+        agg = stats.pop("agg")
+    node = _REGISTRY.get(token)
+    if node is not None:
+        node["last_seen"] = now
+        node["ip"] = ip
+        node["stats"] = stats
+        _touch(node)
+    _PENDING_HEARTBEATS[token] = (now, ip, json.dumps(stats), token)
+    queue_metric(token, stats, now, agg)
+
+
+def _parse_agg(agg, key):
+    """[min, avg, max, p95] из stats["agg"]; мусор от ноды отбрасывается."""
+    try:
+        values = agg[key]
+        if len(values) == 4:
+            return tuple(float(v) for v in values)
+    except (KeyError, TypeError, ValueError):
+        pass
+    return None
+
+
+def _metric_row(token: str, stats: dict, t: float, agg: dict = None) -> tuple:
+    """
+    Строка node_metrics из stats ноды.
+    Если нода прислала агрегаты семплов, cpu/ram точки — среднее за интервал, а не последний замер.
+    """
+    cpu, ram = stats.get("cpu", 0), stats.get("ram", 0)
+    extra = (None,) * len(METRIC_AGG_COLUMNS)
+    if agg:
+        cpu_agg, ram_agg = _parse_agg(agg, "cpu"), _parse_agg(agg, "ram")
+        if cpu_agg and ram_agg:
+            cpu, ram = cpu_agg[1], ram_agg[1]
+            extra = (cpu_agg[0], cpu_agg[2], cpu_agg[3], ram_agg[0], ram_agg[2], ram_agg[3])
+    return (token, int(t), cpu, ram, stats.get("disk", 0), stats.get("net_rx", 0), stats.get("net_tx", 0)) + extra
+
+
+def queue_metric(token: str, stats: dict, t: float = None, agg: dict = None):
+    """Ставит в буфер только точку метрик (без обновления строки ноды)."""
+    if t is None:
+        t = time.time()
+    _PENDING_METRICS.append(_metric_row(token, stats, t, agg))
+    if len(_PENDING_METRICS) >= HEARTBEAT_FLUSH_MAX:
+        _FLUSH_EVENT.set()
+
+
+async def flush_heartbeats() -> int:
+    """Записывает все накопленные heartbeat одной транзакцией (executemany)."""
+    global _PENDING_HEARTBEATS, _PENDING_METRICS
+    async with _FLUSH_LOCK:
+        if not _PENDING_HEARTBEATS and not _PENDING_METRICS:
+            return 0
+        rows, points = _PENDING_HEARTBEATS, _PENDING_METRICS
+        _PENDING_HEARTBEATS, _PENDING_METRICS = {}, []
+        try:
+            async with write_db() as db:
+                await db.executemany(
+                    "UPDATE nodes SET last_seen = ?, ip = ?, stats = ? WHERE token = ?", list(rows.values()))
+                await db.executemany(_METRICS_INSERT_SQL.format("REPLACE"), points)
+        except BaseException:
+            # Возвращаем пачку в буфер, более свежие heartbeat важнее старых
+            for token, row in rows.items():
+                _PENDING_HEARTBEATS.setdefault(token, row)
+            _PENDING_METRICS[:0] = points
+            raise
+        return len(points)
+
+
+async def backfill_metrics(token: str, points: list) -> int:
+    """
+    Дозапись точек, накопленных нодой без связи с агентом: [(t, stats), ...].
+    INSERT OR IGNORE по (token, t) — повторная выгрузка того же спула не создаёт дублей.
+    Возвращает число реально добавленных точек.
+    """
+    rows = []
+    for t, stats in points:
+        stats = dict(stats)
+        agg = stats.pop("agg", None)
+        rows.append(_metric_row(token, stats, t, agg))
+    if not rows:
+        return 0
+    async with write_db() as db:
+        cursor = await db.executemany(_METRICS_INSERT_SQL.format("IGNORE"), rows)
+        return cursor.rowcount
+
+
+async def heartbeat_flusher():
+    while True:
+        try:
+            try:
+                await asyncio.wait_for(_FLUSH_EVENT.wait(), timeout=HEARTBEAT_FLUSH_INTERVAL)
+            except asyncio.TimeoutError:
+                pass
+            _FLUSH_EVENT.clear()
+            await flush_heartbeats()
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logging.error(f"Error in heartbeat_flusher: {e}")
+
+
 async def update_node_heartbeat(token: str, ip: str, stats: dict):
-    async with aiosqlite.connect(DB_PATH) as db:
-        db.row_factory = aiosqlite.Row
-        async with db.execute("SELECT history FROM nodes WHERE token = ?", (token,)) as cursor:
-            row = await cursor.fetchone()
-            if not row:
-                return
-            history = json.loads(row['history']) if row['history'] else []
-
-    point = {
-        "t": int(time.time()),
-        "c": stats.get("cpu", 0),
-        "r": stats.get("ram", 0),
-        "rx": stats.get("net_rx", 0),
-        "tx": stats.get("net_tx", 0)
-    }
-    history.append(point)
-    if len(history) > 60:
-        history = history[-60:]
+    queue_heartbeat(token, ip, stats)
+    await flush_heartbeats()
 
-    async with aiosqlite.connect(DB_PATH) as db:
-        await db.execute(
-            "UPDATE nodes SET last_seen = ?, ip = ?, stats = ?, history = ? WHERE token = ?",
-            (time.time(), ip, json.dumps(stats), json.dumps(history), token)
+
+async def update_node_task(token: str, task: dict, priority: int = 0, ttl: float = None):
+    """Ставит задачу в очередь ноды. Задачи с истекшим ttl будут отброшены при выдаче."""
+    now = time.time()
+    expires_at = now + ttl if ttl else None
+    async with write_db() as db:
+        cursor = await db.execute(
+            "INSERT INTO node_tasks (token, command, user_id, created_at, priority, expires_at) "
+            "SELECT ?, ?, ?, ?, ?, ? WHERE EXISTS (SELECT 1 FROM nodes WHERE token = ?)",
+            (token, task.get("command"), task.get("user_id"), now, priority, expires_at, token)
         )
-        await db.commit()
+        queued = cursor.rowcount
+        if queued:
+            _TASK_TOKENS.add(token)
+    if queued:
+        # Ответ на команду и следующие команды обычно идут следом — держим ноду в быстром режиме
+        _WATCHED_UNTIL[token] = max(_WATCHED_UNTIL.get(token, 0), now + NODE_WATCH_TTL)
+        _wake_waiters(token)
 
 
-async def update_node_task(token: str, task: dict):
-    async with aiosqlite.connect(DB_PATH) as db:
-        db.row_factory = aiosqlite.Row
-        async with db.execute("SELECT tasks FROM nodes WHERE token = ?", (token,)) as cursor:
-            row = await cursor.fetchone()
-            if not row:
-                return
-            tasks = json.loads(row['tasks']) if row['tasks'] else []
+def _wake_waiters(token: str):
+    for event in _TASK_WAITERS.get(token, ()):
+        event.set()
 
-        tasks.append(task)
-        await db.execute("UPDATE nodes SET tasks = ? WHERE token = ?", (json.dumps(tasks), token))
-        await db.commit()
+
+def watch_node(token: str, ttl: float = NODE_WATCH_TTL):
+    """Отмечает, что данные ноды сейчас кому-то нужны (открыта карточка, монитор трафика)."""
+    now = time.time()
+    was_idle = _WATCHED_UNTIL.get(token, 0) <= now
+    _WATCHED_UNTIL[token] = max(_WATCHED_UNTIL.get(token, 0), now + ttl)
+    if was_idle:
+        # Запаркованный long-poll / WS-канал сразу получит быстрый интервал
+        _wake_waiters(token)
+
+
+def is_node_watched(token: str) -> bool:
+    return token in _TASK_TOKENS or _WATCHED_UNTIL.get(token, 0) > time.time()
+
+
+def negotiate_interval(token: str, requested):
+    """
+    Интервал до следующего heartbeat, который агент назначает ноде.
+    requested — собственный интервал ноды из её .env; старые ноды его не присылают (None).
+    """
+    try:
+        base = min(max(int(requested), 1), MAX_NODE_INTERVAL)
+    except (TypeError, ValueError):
+        return None
+    if is_node_watched(token):
+        return base
+    return max(base, min(int(current_config.NODE_IDLE_INTERVAL), MAX_NODE_INTERVAL))
+
+
+async def set_node_interval(token: str, node: dict, interval):
+    """Запоминает назначенный интервал (пишет в БД только при изменении)."""
+    if interval and node.get("interval") != interval:
+        await update_node_extra(token, "interval", interval)
+
+
+def node_offline_timeout(node: dict) -> float:
+    """Таймаут оффлайна с учётом интервала, назначенного ноде в последнем ответе."""
+    return max(current_config.NODE_OFFLINE_TIMEOUT, (node.get("interval") or 0) * OFFLINE_MISSED_INTERVALS)
+
+
+async def wait_for_tasks(token: str, timeout: float) -> bool:
+    """
+    Ждёт появления задачи для ноды не дольше timeout.
+    True — задача есть или нода только что перешла в быстрый режим (см. watch_node).
+    """
+    if token in _TASK_TOKENS:
+        return True
+    event = asyncio.Event()
+    _TASK_WAITERS.setdefault(token, set()).add(event)
+    try:
+        await asyncio.wait_for(event.wait(), timeout)
+        return True
+    except asyncio.TimeoutError:
+        return token in _TASK_TOKENS
+    finally:
+        waiters = _TASK_WAITERS.get(token)
+        if waiters is not None:
+            waiters.discard(event)
+            if not waiters:
+                del _TASK_WAITERS[token]
+
+
+_TASK_COLUMNS = "id, command, user_id, created_at, priority, expires_at"
+
+
+async def claim_node_task_rows(token: str) -> list:
+    """
+    Атомарно забирает все задачи ноды строками node_tasks (все колонки),
+    в порядке выдачи. Просроченные удаляются без выдачи.
+    """
+    if token not in _TASK_TOKENS:
+        return []
+    _TASK_TOKENS.discard(token)
+    try:
+        async with write_db() as db:
+            if _HAS_RETURNING:
+                async with db.execute(f"DELETE FROM node_tasks WHERE token = ? RETURNING {_TASK_COLUMNS}", (token,)) as cursor:
+                    rows = await cursor.fetchall()
+            else:
+                async with db.execute(f"SELECT {_TASK_COLUMNS} FROM node_tasks WHERE token = ?", (token,)) as cursor:
+                    rows = await cursor.fetchall()
+                await db.execute("DELETE FROM node_tasks WHERE token = ?", (token,))
+    except BaseException:
+        _TASK_TOKENS.add(token)
+        raise
+
+    now = time.time()
+    live = [dict(r) for r in rows if not r['expires_at'] or r['expires_at'] > now]
+    if len(live) < len(rows):
+        logging.debug(f"Dropped {len(rows) - len(live)} expired tasks for node {token[:8]}...")
+    live.sort(key=lambda r: (-(r['priority'] or 0), r['id']))
+    return live
+
+
+def task_payload(row: dict) -> dict:
+    """Задача в том виде, в котором она уходит ноде."""
+    return {"command": row['command'], "user_id": row['user_id']}
+
+
+async def claim_node_tasks(token: str) -> list:
+    """Атомарно забирает все задачи ноды. Просроченные удаляются без выдачи."""
+    return [task_payload(r) for r in await claim_node_task_rows(token)]
+
+
+async def requeue_node_tasks(token: str, rows: list):
+    """
+    Возвращает в очередь задачи, забранные claim_node_task_rows, но не доставленные.
+    Строки восстанавливаются как были: id (порядок), приоритет, время создания и срок жизни.
+    """
+    if not rows:
+        return
+    async with write_db() as db:
+        await db.executemany(
+            f"INSERT OR IGNORE INTO node_tasks (token, {_TASK_COLUMNS}) "
+            "SELECT ?, ?, ?, ?, ?, ?, ? WHERE EXISTS (SELECT 1 FROM nodes WHERE token = ?)",
+            [(token, r['id'], r['command'], r['user_id'], r['created_at'], r['priority'], r['expires_at'], token)
+             for r in rows])
+    _TASK_TOKENS.add(token)
+    _wake_waiters(token)
 
 
 async def clear_node_tasks(token: str):
-    async with aiosqlite.connect(DB_PATH) as db:
-        await db.execute("UPDATE nodes SET tasks = '[]' WHERE token = ?", (token,))
-        await db.commit()
+    async with write_db() as db:
+        await db.execute("DELETE FROM node_tasks WHERE token = ?", (token,))
+    _TASK_TOKENS.discard(token)
+
+
+async def prune_expired_tasks() -> int:
+    async with write_db() as db:
+        cursor = await db.execute("DELETE FROM node_tasks WHERE expires_at IS NOT NULL AND expires_at < ?", (time.time(),))
+        return cursor.rowcount
+
+
+def _extra_params(token: str, key: str, value):
+    # Ключ берётся в кавычки, чтобы точки в имени не считались частью пути
+    return (f'$."{key}"', json.dumps(value), token)
+
+
+async def _update_extra_fallback(db, token: str, key: str, value):
+    async with db.execute("SELECT extra_state FROM nodes WHERE token = ?", (token,)) as cursor:
+        row = await cursor.fetchone()
+    if not row:
+        return
+    state = json.loads(row['extra_state']) if row['extra_state'] else {}
+    state[key] = value
+    await db.execute("UPDATE nodes SET extra_state = ? WHERE token = ?", (json.dumps(state), token))
 
 
 async def update_node_extra(token: str, key: str, value):
-    async with aiosqlite.connect(DB_PATH) as db:
-        db.row_factory = aiosqlite.Row
-        async with db.execute("SELECT extra_state FROM nodes WHERE token = ?", (token,)) as cursor:
-            row = await cursor.fetchone()
-            if not row:
-                return
-            state = json.loads(
-                row['extra_state']) if row['extra_state'] else {}
+    await update_nodes_extra([(token, key, value)])
+
 
-        state[key] = value
-        await db.execute("UPDATE nodes SET extra_state = ? WHERE token = ?", (json.dumps(state), token))
-        await db.commit()
\ No newline at end of file
+async def update_nodes_extra(updates):
+    """Применяет пачку обновлений (token, key, value) к extra_state в одной транзакции."""
+    updates = list(updates)
+    if not updates:
+        return
+    async with write_db() as db:
+        if _HAS_JSON1:
+            await db.executemany(_EXTRA_SET_SQL, [_extra_params(token, key, value) for token, key, value in updates])
+        else:
+            for token, key, value in updates:
+                await _update_extra_fallback(db, token, key, value)
+    for token, key, value in updates:
+        node = _REGISTRY.get(token)
+        if node is not None:
+            node[key] = value
+            _touch(node)
+
+
+async def load_alert_states() -> list:
+    """Сохранённые состояния правил алертов (строки alert_state)."""
+    async with read_db() as db:
+        async with db.execute("SELECT rule, target, active, pending_since, fired_at, notified_at FROM alert_state") as cursor:
+            return await cursor.fetchall()
+
+
+async def save_alert_states(upserts=(), deletes=()):
+    """
+    Одной транзакцией: upserts — (rule, target, active, pending_since, fired_at, notified_at),
+    deletes — (rule, target).
+    """
+    if not upserts and not deletes:
+        return
+    async with write_db() as db:
+        if deletes:
+            await db.executemany("DELETE FROM alert_state WHERE rule = ? AND target = ?", deletes)
+        if upserts:
+            await db.executemany(
+                "INSERT OR REPLACE INTO alert_state (rule, target, active, pending_since, fired_at, notified_at) "
+                "VALUES (?, ?, ?, ?, ?, ?)", upserts)
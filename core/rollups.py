@@ -0,0 +1,198 @@
+import asyncio
+import logging
+import time
+
+from . import config
+from .nodes_db import read_db, write_db, prune_metrics, metric_point
+
+# Уровни хранения: (имя, таблица, шаг в секундах, ключ срока хранения в config)
+TIERS = (
+    ("raw", "node_metrics", 0, "METRICS_RETENTION_RAW"),
+    ("1m", "node_metrics_1m", 60, "METRICS_RETENTION_1M"),
+    ("1h", "node_metrics_1h", 3600, "METRICS_RETENTION_1H"),
+    ("1d", "node_metrics_1d", 86400, "METRICS_RETENTION_1D"),
+)
+ROLLUP_INTERVAL = 60
+# Ожидаемый шаг сырых точек (интервал heartbeat) — для оценки числа точек
+RAW_STEP_ESTIMATE = 5
+DEFAULT_MAX_POINTS = 300
+
+# rx/tx — накопительные счётчики, поэтому в агрегат берётся последнее (максимальное) значение.
+# Если нода семплирует чаще heartbeat, min/max берутся из её пиков за интервал
+_ROLLUP_FROM_RAW = """
+    INSERT OR REPLACE INTO {dst} (token, t, n, cpu_min, cpu_avg, cpu_max, ram_min, ram_avg, ram_max,
+                                  disk_min, disk_avg, disk_max, rx, tx)
+    SELECT token, (t / {step}) * {step}, COUNT(*),
+           MIN(COALESCE(cpu_min, cpu)), AVG(cpu), MAX(COALESCE(cpu_max, cpu)),
+           MIN(COALESCE(ram_min, ram)), AVG(ram), MAX(COALESCE(ram_max, ram)),
+           MIN(disk), AVG(disk), MAX(disk), MAX(rx), MAX(tx)
+    FROM node_metrics
+    WHERE t >= ? AND t < ?
+    GROUP BY token, (t / {step})
+"""
+
+_ROLLUP_FROM_TIER = """
+    INSERT OR REPLACE INTO {dst} (token, t, n, cpu_min, cpu_avg, cpu_max, ram_min, ram_avg, ram_max,
+                                  disk_min, disk_avg, disk_max, rx, tx)
+    SELECT token, (t / {step}) * {step}, SUM(n),
+           MIN(cpu_min), SUM(cpu_avg * n) / SUM(n), MAX(cpu_max),
+           MIN(ram_min), SUM(ram_avg * n) / SUM(n), MAX(ram_max),
+           MIN(disk_min), SUM(disk_avg * n) / SUM(n), MAX(disk_max),
+           MAX(rx), MAX(tx)
+    FROM {src}
+    WHERE t >= ? AND t < ?
+    GROUP BY token, (t / {step})
+"""
+
+
+def get_retention(tier_name: str) -> int:
+    for name, _table, _step, key in TIERS:
+        if name == tier_name:
+            return int(getattr(config, key))
+    raise KeyError(tier_name)
+
+
+async def _get_watermark(tier_name: str):
+    async with read_db() as db:
+        async with db.execute("SELECT done_until FROM rollup_state WHERE tier = ?", (tier_name,)) as cursor:
+            row = await cursor.fetchone()
+    return row['done_until'] if row else None
+
+
+async def invalidate_watermark(since: float):
+    """
+    Сдвигает водяные знаки назад, чтобы дозаписанные задним числом точки попали в агрегаты.
+    Знак каждого уровня выравнивается на начало его интервала: иначе пересчёт начнётся
+    с середины интервала и INSERT OR REPLACE затрёт полный агрегат частичным.
+    """
+    async with write_db() as db:
+        for name, _table, step, _key in TIERS[1:]:
+            aligned = (int(since) // step) * step
+            await db.execute(
+                "UPDATE rollup_state SET done_until = ? WHERE tier = ? AND done_until > ?", (aligned, name, aligned))
+
+
+async def rollup_once(now: float = None) -> dict:
+    """
+    Досчитывает агрегаты всех уровней до последнего закрытого интервала.
+    Последний пересчитанный интервал берётся ещё раз, чтобы учесть опоздавшие точки;
+    INSERT OR REPLACE делает повтор идемпотентным.
+    """
+    if now is None:
+        now = time.time()
+    now = int(now)
+    result = {}
+    for i in range(1, len(TIERS)):
+        name, table, step, _key = TIERS[i]
+        src_name, src_table, src_step, _src_key = TIERS[i - 1]
+        # Верхняя граница — конец последнего полностью закрытого интервала
+        # и не дальше, чем досчитан исходный уровень
+        until = (now // step) * step
+        if src_step:
+            src_done = await _get_watermark(src_name)
+            if src_done is None:
+                continue
+            until = min(until, (src_done // step) * step)
+
+        done = await _get_watermark(name)
+        if done is None:
+            # Первый запуск: агрегируем всё, что уже есть в исходном уровне
+            async with read_db() as db:
+                async with db.execute(f"SELECT MIN(t) AS t FROM {src_table}") as cursor:
+                    row = await cursor.fetchone()
+            if row['t'] is None:
+                continue
+            start = row['t'] // step * step
+        else:
+            # Выравнивание — на случай невыровненного знака в старой БД
+            start = (max(done - step, 0) // step) * step
+        if start >= until:
+            result[name] = 0
+            continue
+
+        if src_step:
+            sql = _ROLLUP_FROM_TIER.format(dst=table, src=src_table, step=step)
+        else:
+            sql = _ROLLUP_FROM_RAW.format(dst=table, step=step)
+        async with write_db() as db:
+            cursor = await db.execute(sql, (start, until))
+            result[name] = cursor.rowcount
+            await db.execute(
+                "INSERT OR REPLACE INTO rollup_state (tier, done_until) VALUES (?, ?)", (name, until))
+    return result
+
+
+async def prune_tiers() -> int:
+    deleted = 0
+    for name, table, _step, _key in TIERS:
+        deleted += await prune_metrics(get_retention(name), table)
+    return deleted
+
+
+async def rollup_loop():
+    """Фоновая задача: агрегация и очистка уровней метрик."""
+    logging.info("Metrics rollup task started.")
+    try:
+        while True:
+            try:
+                await rollup_once()
+                await prune_tiers()
+            except Exception as e:
+                logging.error(f"Metrics rollup error: {e}", exc_info=True)
+            await asyncio.sleep(ROLLUP_INTERVAL)
+    except asyncio.CancelledError:
+        logging.info("Metrics rollup task stopped.")
+
+
+def pick_tier(start: float, end: float, max_points: int = DEFAULT_MAX_POINTS, now: float = None):
+    """
+    Выбирает самый детальный уровень, который покрывает [start, end] сроком хранения
+    и укладывается в max_points. Если ни один не укладывается — самый грубый.
+    """
+    if now is None:
+        now = time.time()
+    span = max(end - start, 1)
+    for tier in TIERS[:-1]:
+        name, _table, step, key = tier
+        if now - start > int(getattr(config, key)):
+            continue
+        if span / (step or RAW_STEP_ESTIMATE) <= max_points:
+            return tier
+    return TIERS[-1]
+
+
+async def query_history(token: str, start: float, end: float = None, max_points: int = DEFAULT_MAX_POINTS):
+    """
+    История метрик за интервал с автоматическим выбором уровня агрегации.
+    Формат точек совпадает с nodes_db.get_node_history; у агрегатов добавлены c_max/r_max.
+    """
+    if end is None:
+        end = time.time()
+    max_points = max(int(max_points), 1)
+    name, table, step, _key = pick_tier(start, end, max_points)
+
+    if not step:
+        async with read_db() as db:
+            async with db.execute(
+                    "SELECT t, cpu, ram, disk, rx, tx, cpu_max, ram_max FROM node_metrics "
+                    "WHERE token = ? AND t >= ? AND t <= ? ORDER BY t",
+                    (token, int(start), int(end))) as cursor:
+                rows = await cursor.fetchall()
+        points = [metric_point(r) for r in rows]
+        # Если heartbeat'ы приходили чаще ожидаемого — прореживаем
+        if len(points) > max_points:
+            stride = -(-len(points) // max_points)
+            points = points[::stride]
+        return points
+
+    async with read_db() as db:
+        async with db.execute(
+                f"SELECT t, cpu_avg, cpu_max, ram_avg, ram_max, disk_avg, rx, tx FROM {table} "
+                f"WHERE token = ? AND t >= ? AND t <= ? ORDER BY t",
+                (token, int(start) // step * step, int(end))) as cursor:
+            rows = await cursor.fetchall()
+    return [
+        {"t": r['t'], "c": r['cpu_avg'], "r": r['ram_avg'], "d": r['disk_avg'], "rx": r['rx'], "tx": r['tx'],
+         "c_max": r['cpu_max'], "r_max": r['ram_max']}
+        for r in rows
+    ]
@@ -0,0 +1,107 @@
+import asyncio
+import logging
+import time
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+
+import procstat
+from . import nodes_db
+from .shared_state import AGENT_HISTORY
+
+# Единственный источник метрик агента: замеры идут в отдельном потоке,
+# event loop получает готовый неизменяемый снимок. Алерты, дашборд, selftest
+# и трафик читают SNAPSHOT/AGENT_HISTORY и сами систему не опрашивают;
+# пока свежего снимка нет, обработчики пользователя делают разовый замер (get_or_sample).
+SAMPLE_INTERVAL = 2
+HISTORY_SIZE = 60
+# Снимок старше этого считается недействительным (поток сэмплера завис или ещё не стартовал)
+MAX_SNAPSHOT_AGE = 5 * SAMPLE_INTERVAL
+
+Snapshot = namedtuple("Snapshot", "t cpu cpu_cores ram disk net_rx net_tx rx_rate tx_rate load uptime")
+
+SNAPSHOT = None
+_EXECUTOR = ThreadPoolExecutor(max_workers=1, thread_name_prefix="sampler")
+# Общий с разовыми замерами: CPU считается между соседними замерами любого из них
+_METER = None
+
+
+def get_snapshot(max_age=MAX_SNAPSHOT_AGE):
+    snap = SNAPSHOT
+    if snap is None or time.time() - snap.t > max_age:
+        return None
+    return snap
+
+
+def _meter():
+    global _METER
+    if _METER is None:
+        _METER = procstat.CpuMeter()
+    return _METER
+
+
+async def get_or_sample():
+    """
+    Свежий снимок; если его нет (сэмплер ещё не сделал первый замер или завис) —
+    разовый замер в потоке сэмплера, который тоже публикуется.
+    """
+    snap = get_snapshot()
+    if snap is not None:
+        return snap
+    snap = await asyncio.get_running_loop().run_in_executor(_EXECUTOR, _take, _meter(), SNAPSHOT)
+    _publish(snap)
+    return snap
+
+
+def _take(meter, prev):
+    """Выполняется в потоке сэмплера."""
+    now = time.time()
+    cpu, cores = meter.measure()
+    rx, tx = procstat.net_totals()
+    try:
+        disk = procstat.disk_usage('/')
+    except OSError:
+        disk = prev.disk if prev else 0
+    rx_rate = tx_rate = 0.0
+    if prev and now > prev.t:
+        dt = now - prev.t
+        # Счётчики сбрасываются при перезагрузке интерфейса
+        rx_rate = max(rx - prev.net_rx, 0) / dt
+        tx_rate = max(tx - prev.net_tx, 0) / dt
+    return Snapshot(now, cpu, tuple(cores), procstat.memory()["percent"], disk,
+                    rx, tx, rx_rate, tx_rate, procstat.load_avg(), procstat.uptime())
+
+
+def _publish(snap):
+    global SNAPSHOT
+    SNAPSHOT = snap
+    point = {"t": int(snap.t), "c": snap.cpu, "r": snap.ram, "rx": snap.net_rx, "tx": snap.net_tx}
+    AGENT_HISTORY.append(point)
+    if len(AGENT_HISTORY) > HISTORY_SIZE:
+        AGENT_HISTORY.pop(0)
+    # Долгосрочная история агента — в общих таблицах метрик
+    nodes_db.queue_metric(nodes_db.AGENT_METRICS_TOKEN, {
+        "cpu": snap.cpu, "ram": snap.ram, "disk": snap.disk,
+        "net_rx": snap.net_rx, "net_tx": snap.net_tx}, point["t"])
+
+
+async def sampler_loop():
+    """Фоновая задача: замер раз в SAMPLE_INTERVAL в своём потоке, публикация в event loop."""
+    logging.info("Metrics sampler started.")
+    loop = asyncio.get_running_loop()
+    meter = _meter()
+    try:
+        try:
+            await loop.run_in_executor(_EXECUTOR, meter.measure)
+        except Exception as e:
+            logging.error(f"Metrics sampler error: {e}")
+        next_tick = loop.time()
+        while True:
+            next_tick = max(next_tick + SAMPLE_INTERVAL, loop.time())
+            await asyncio.sleep(next_tick - loop.time())
+            try:
+                # Предыдущий — последний опубликованный, в том числе разовый из get_or_sample
+                _publish(await loop.run_in_executor(_EXECUTOR, _take, meter, SNAPSHOT))
+            except Exception as e:
+                logging.error(f"Metrics sampler error: {e}")
+    except asyncio.CancelledError:
+        logging.info("Metrics sampler stopped.")
@@ -5,17 +5,18 @@ import json
 import secrets
 import asyncio
 import hashlib
+import re
 from argon2 import PasswordHasher, exceptions as argon2_exceptions
 import hmac
 import requests
-from aiohttp import web
+from aiohttp import web, WSMsgType
 from aiogram import Bot
 from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton
 from collections import deque  # Оптимизация памяти
 
-from . import nodes_db
+from . import nodes_db, rollups, assets, sampler, messaging, digest
 from .config import (
-    WEB_SERVER_HOST, WEB_SERVER_PORT, NODE_OFFLINE_TIMEOUT, BASE_DIR,
+    WEB_SERVER_HOST, WEB_SERVER_PORT, BASE_DIR,
     ADMIN_USER_ID, ENABLE_WEB_UI, save_system_config, BOT_LOG_DIR,
     WATCHDOG_LOG_DIR, NODE_LOG_DIR, WEB_AUTH_FILE, ADMIN_USERNAME, TOKEN,
     save_keyboard_config, KEYBOARD_CONFIG
@@ -24,7 +25,7 @@ from . import config as current_config
 from .shared_state import NODE_TRAFFIC_MONITORS, ALLOWED_USERS, USER_NAMES, AUTH_TOKENS, ALERTS_CONFIG, AGENT_HISTORY
 from .i18n import STRINGS, get_user_lang, set_user_lang, get_text as _
 from .config import DEFAULT_LANGUAGE
-from .utils import get_country_flag, save_alerts_config, get_host_path
+from .utils import get_country_flag, save_alerts_config
 from .auth import save_users, get_user_name
 from .keyboards import BTN_CONFIG_MAP
 
@@ -47,6 +48,34 @@ BOT_USERNAME_CACHE = None
 CACHE_VER = str(int(time.time()))
 AGENT_TASK = None
 
+# SSE: один общий расчёт на все открытые вкладки
+STREAM_TASK = None
+STREAM_CLIENTS = set()
+STREAM_LAST = {}
+STREAM_TICK = 1.0
+STREAM_PING_INTERVAL = 15
+# За тик уходит не больше STREAM_EVENTS_PER_TICK сообщений (nodes, nodes_delta, agent_delta);
+# клиент, отставший больше чем на STREAM_BUFFER_TICKS тиков, отключается.
+# Ещё один тик в очереди — снимок для нового клиента (STREAM_LAST и полная история агента)
+STREAM_EVENTS_PER_TICK = 3
+STREAM_BUFFER_TICKS = 30
+STREAM_QUEUE_SIZE = STREAM_EVENTS_PER_TICK * (STREAM_BUFFER_TICKS + 1)
+
+# Long-poll heartbeat: верхняя граница парковки запроса (дополнительно — не больше половины таймаута оффлайна)
+LONGPOLL_MAX_WAIT = 25
+
+# WebSocket-канал нод: token -> открытый ws
+NODE_SOCKETS = {}
+NODE_WS_HELLO_TIMEOUT = 10
+NODE_WS_HEARTBEAT = 30
+NODE_WS_TASK_WAIT = 30
+# Предел размера собранного из частей результата команды
+NODE_WS_MAX_RESULT = 256 * 1024
+# Выгрузка спула метрик, накопленного нодой без связи: не больше стольких точек за запрос
+NODE_BACKFILL_MAX_POINTS = 2000
+# Насколько точка может быть "из будущего" (расхождение часов ноды и агента)
+NODE_BACKFILL_CLOCK_SKEW = 60
+
 def check_rate_limit(ip):
     now = time.time()
     attempts = LOGIN_ATTEMPTS.get(ip, [])
@@ -118,6 +147,61 @@ def load_template(name):
     except FileNotFoundError:
         return "<h1>Template not found</h1>"
 
+# Скомпилированные шаблоны: (name, lang, variant) -> (mtime, parts)
+_TEMPLATE_CACHE = {}
+_PLACEHOLDER_RE = re.compile(r"\{([a-z_][a-z0-9_]*)\}")
+
+def _compile_template(html, static):
+    """
+    Разбивает шаблон на части: чётные — готовый текст (статические плейсхолдеры уже подставлены),
+    нечётные — имена полей, которые заполняются на каждый запрос.
+    """
+    parts = []
+    buf = []
+    pos = 0
+    for m in _PLACEHOLDER_RE.finditer(html):
+        buf.append(html[pos:m.start()])
+        key = m.group(1)
+        if key in static:
+            buf.append(static[key])
+        else:
+            parts.append("".join(buf))
+            parts.append(key)
+            buf = []
+        pos = m.end()
+    buf.append(html[pos:])
+    parts.append("".join(buf))
+    return parts
+
+def render_template(name, lang, static_fn, context, variant=None, transform=None):
+    """
+    Рендер через кэш: static_fn(lang) вызывается только при компиляции,
+    context подставляется за один проход. Неизвестные {поля} остаются как есть.
+    Кэш сбрасывается при изменении mtime файла.
+    """
+    try:
+        mtime = os.stat(os.path.join(TEMPLATE_DIR, name)).st_mtime_ns
+    except FileNotFoundError:
+        return "<h1>Template not found</h1>"
+    key = (name, lang, variant)
+    cached = _TEMPLATE_CACHE.get(key)
+    if cached is None or cached[0] != mtime:
+        html = assets.rewrite_static_refs(load_template(name), CACHE_VER)
+        if transform:
+            html = transform(html)
+        cached = (mtime, _compile_template(html, static_fn(lang)))
+        _TEMPLATE_CACHE[key] = cached
+    parts = list(cached[1])
+    for i in range(1, len(parts), 2):
+        field = parts[i]
+        parts[i] = context.get(field, "{" + field + "}")
+    return "".join(parts)
+
+def _inject_i18n_script(html):
+    if "{i18n_json}" in html:
+        return html
+    return html.replace("</body>", "<script>const I18N = {i18n_json};</script></body>")
+
 def get_current_user(request):
     token = request.cookies.get(COOKIE_NAME)
     if not token or token not in SERVER_SESSIONS:
@@ -177,17 +261,51 @@ async def handle_get_logs(request):
     except Exception as e:
         return web.json_response({"error": str(e)}, status=500)
 
+def _dashboard_static(lang):
+    static = {
+        "web_title": f"{_('web_dashboard_title', lang)} - Web Bot",
+        "web_version": CACHE_VER,
+    }
+    for key in (
+            "web_dashboard_title", "web_agent_stats_title", "web_uptime", "web_cpu", "web_ram", "web_disk",
+            "web_traffic_total", "web_node_mgmt_title", "web_nodes_loading", "web_node_details_title",
+            "web_token_label", "web_copied", "web_resources_chart", "web_network_chart", "web_logs_title",
+            "web_refresh", "web_loading", "web_logs_footer", "web_stats_total", "web_stats_active",
+            "web_hint_cpu_usage", "web_hint_ram_usage", "web_hint_disk_usage", "web_hint_traffic_in",
+            "web_hint_traffic_out", "web_hint_cpu_threshold", "web_hint_ram_threshold", "web_hint_disk_threshold",
+            "web_hint_traffic_interval", "web_hint_node_timeout", "web_add_node_section",
+            "web_node_name_placeholder", "web_create_btn", "web_node_token", "web_node_cmd"):
+        static[key] = _(key, lang)
+
+    i18n_data = {
+        "web_cpu": _("web_cpu", lang),
+        "web_ram": _("web_ram", lang),
+        "web_no_nodes": _("web_no_nodes", lang),
+        "web_loading": _("web_loading", lang),
+        "web_access_denied": _("web_access_denied", lang),
+        "web_error": _("web_error", lang, error=""),
+        "web_conn_error": _("web_conn_error", lang, error=""),
+        "web_log_empty": _("web_log_empty", lang),
+        "modal_title_alert": _("modal_title_alert", lang),
+        "modal_title_confirm": _("modal_title_confirm", lang),
+        "modal_title_prompt": _("modal_title_prompt", lang),
+        "modal_btn_ok": _("modal_btn_ok", lang),
+        "modal_btn_cancel": _("modal_btn_cancel", lang),
+        "web_copied": _("web_copied", lang)
+    }
+    static["i18n_json"] = json.dumps(i18n_data)
+    return static
+
 async def handle_dashboard(request):
     user = get_current_user(request)
     if not user:
         raise web.HTTPFound('/login')
-    html = load_template("dashboard.html")
     user_id = user['id']
     lang = get_user_lang(user_id)
 
     all_nodes = await nodes_db.get_all_nodes()
     nodes_count = len(all_nodes)
-    active_nodes = sum(1 for n in all_nodes.values() if time.time() - n.get("last_seen", 0) < NODE_OFFLINE_TIMEOUT)
+    active_nodes = sum(1 for n in all_nodes.values() if time.time() - n.get("last_seen", 0) < nodes_db.node_offline_timeout(n))
 
     role = user.get('role', 'users')
     role_color = "green" if role == "admins" else "gray"
@@ -213,73 +331,15 @@ async def handle_dashboard(request):
         </div>
         """
 
-    replacements = {
-        "{web_title}": f"{_('web_dashboard_title', lang)} - Web Bot",
-        "{web_dashboard_title}": _("web_dashboard_title", lang),
-        "{role_badge}": role_badge,
-        "{user_avatar}": _get_avatar_html(user),
-        "{user_name}": user.get('first_name', 'User'),
-        "{nodes_count}": str(nodes_count),
-        "{active_nodes}": str(active_nodes),
-        "{web_agent_stats_title}": _("web_agent_stats_title", lang),
-        "{web_uptime}": _("web_uptime", lang),
-        "{web_cpu}": _("web_cpu", lang),
-        "{web_ram}": _("web_ram", lang),
-        "{web_disk}": _("web_disk", lang),
-        "{web_traffic_total}": _("web_traffic_total", lang),
-        "{web_node_mgmt_title}": _("web_node_mgmt_title", lang),
-        "{web_nodes_loading}": _("web_nodes_loading", lang),
-        "{admin_controls_html}": admin_controls_html,
-        "{web_node_details_title}": _("web_node_details_title", lang),
-        "{web_token_label}": _("web_token_label", lang),
-        "{web_copied}": _("web_copied", lang),
-        "{web_resources_chart}": _("web_resources_chart", lang),
-        "{web_network_chart}": _("web_network_chart", lang),
-        "{web_logs_title}": _("web_logs_title", lang),
-        "{web_refresh}": _("web_refresh", lang),
-        "{web_loading}": _("web_loading", lang),
-        "{web_logs_footer}": _("web_logs_footer", lang),
-        "{web_stats_total}": _("web_stats_total", lang),
-        "{web_stats_active}": _("web_stats_active", lang),
-        "{node_action_btn}": node_action_btn,
-        "{web_hint_cpu_usage}": _("web_hint_cpu_usage", lang),
-        "{web_hint_ram_usage}": _("web_hint_ram_usage", lang),
-        "{web_hint_disk_usage}": _("web_hint_disk_usage", lang),
-        "{web_hint_traffic_in}": _("web_hint_traffic_in", lang),
-        "{web_hint_traffic_out}": _("web_hint_traffic_out", lang),
-        "{web_hint_cpu_threshold}": _("web_hint_cpu_threshold", lang),
-        "{web_hint_ram_threshold}": _("web_hint_ram_threshold", lang),
-        "{web_hint_disk_threshold}": _("web_hint_disk_threshold", lang),
-        "{web_hint_traffic_interval}": _("web_hint_traffic_interval", lang),
-        "{web_hint_node_timeout}": _("web_hint_node_timeout", lang),
-        "{web_add_node_section}": _("web_add_node_section", lang),
-        "{web_node_name_placeholder}": _("web_node_name_placeholder", lang),
-        "{web_create_btn}": _("web_create_btn", lang),
-        "{web_node_token}": _("web_node_token", lang),
-        "{web_node_cmd}": _("web_node_cmd", lang),
-        "{web_version}": CACHE_VER,
-    }
-    
-    for k, v in replacements.items():
-        html = html.replace(k, v)
-
-    i18n_data = {
-        "web_cpu": _("web_cpu", lang),
-        "web_ram": _("web_ram", lang),
-        "web_no_nodes": _("web_no_nodes", lang),
-        "web_loading": _("web_loading", lang),
-        "web_access_denied": _("web_access_denied", lang),
-        "web_error": _("web_error", lang, error=""),
-        "web_conn_error": _("web_conn_error", lang, error=""),
-        "web_log_empty": _("web_log_empty", lang),
-        "modal_title_alert": _("modal_title_alert", lang),
-        "modal_title_confirm": _("modal_title_confirm", lang),
-        "modal_title_prompt": _("modal_title_prompt", lang),
-        "modal_btn_ok": _("modal_btn_ok", lang),
-        "modal_btn_cancel": _("modal_btn_cancel", lang),
-        "web_copied": _("web_copied", lang)
-    }
-    html = html.replace("{i18n_json}", json.dumps(i18n_data))
+    html = render_template("dashboard.html", lang, _dashboard_static, {
+        "role_badge": role_badge,
+        "user_avatar": _get_avatar_html(user),
+        "user_name": user.get('first_name', 'User'),
+        "nodes_count": str(nodes_count),
+        "active_nodes": str(active_nodes),
+        "admin_controls_html": admin_controls_html,
+        "node_action_btn": node_action_btn,
+    })
     return web.Response(text=html, content_type='text/html')
 
 async def handle_heartbeat(request):
@@ -292,25 +352,180 @@ async def handle_heartbeat(request):
     if not token or not node:
         return web.json_response({"error": "Auth fail"}, status=401)
     stats = data.get("stats", {})
-    results = data.get("results", [])
-    bot = request.app.get('bot')
-    if bot and results:
-        for res in results:
-            asyncio.create_task(
-                process_node_result_background(bot, res.get("user_id"), res.get("command"), res.get("result"), token, node.get("name", "Node")))
+    _dispatch_node_results(request.app.get('bot'), data.get("results", []), token, node.get("name", "Node"))
     
     if node.get("is_restarting"):
         await nodes_db.update_node_extra(token, "is_restarting", False)
     
     ip = request.transport.get_extra_info('peername')[0]
-    await nodes_db.update_node_heartbeat(token, ip, stats)
-    
-    current_node = await nodes_db.get_node_by_token(token)
-    tasks_to_send = current_node.get("tasks", [])
-    if tasks_to_send:
-        await nodes_db.clear_node_tasks(token)
+    nodes_db.queue_heartbeat(token, ip, stats)
     
-    return web.json_response({"status": "ok", "tasks": tasks_to_send})
+    tasks_to_send = await nodes_db.claim_node_tasks(token)
+    response = {"status": "ok", "tasks": tasks_to_send}
+
+    # Нода с "wait" паркует запрос: ответ уходит сразу при появлении задачи или по таймауту
+    wait = _longpoll_wait(data.get("wait"), node)
+    if wait:
+        response["wait"] = wait
+        if not tasks_to_send and await nodes_db.wait_for_tasks(token, wait):
+            response["tasks"] = await nodes_db.claim_node_tasks(token)
+
+    # Интервал выбирается в момент ответа: за время парковки ноду могли начать смотреть
+    interval = nodes_db.negotiate_interval(token, data.get("interval"))
+    if interval:
+        response["interval"] = interval
+        await nodes_db.set_node_interval(token, node, interval)
+    return web.json_response(response)
+
+def _longpoll_wait(value, node):
+    try:
+        wait = float(value or 0)
+    except (TypeError, ValueError):
+        return 0
+    limit = min(LONGPOLL_MAX_WAIT, nodes_db.node_offline_timeout(node) / 2)
+    return max(0, min(wait, limit))
+
+async def handle_node_backfill(request):
+    """
+    Точки метрик, которые нода не смогла отправить, пока агент был недоступен.
+    Тело (обычно gzip) — {"token", "points": [[t, stats], ...]}; дубли отбрасываются в БД.
+    """
+    try:
+        data = await request.json()
+    except Exception:
+        return web.json_response({"error": "Invalid JSON"}, status=400)
+    token = data.get("token") if isinstance(data, dict) else None
+    node = await nodes_db.get_node_by_token(token) if token else None
+    if not node:
+        return web.json_response({"error": "Auth fail"}, status=401)
+    raw_points = data.get("points")
+    if not isinstance(raw_points, list) or len(raw_points) > NODE_BACKFILL_MAX_POINTS:
+        return web.json_response({"error": "Invalid points"}, status=400)
+
+    now = time.time()
+    oldest = now - current_config.METRICS_RETENTION_RAW
+    points = []
+    for item in raw_points:
+        try:
+            t, stats = int(item[0]), item[1]
+        except (TypeError, ValueError, IndexError, KeyError):
+            continue
+        # Точки старше срока хранения сырых метрик всё равно удалились бы при очистке
+        if isinstance(stats, dict) and oldest <= t <= now + NODE_BACKFILL_CLOCK_SKEW:
+            points.append((t, stats))
+
+    inserted = await nodes_db.backfill_metrics(token, points)
+    if inserted:
+        # Агрегаты за эти интервалы уже посчитаны без новых точек — пересчитываем
+        await rollups.invalidate_watermark(min(t for t, _stats in points))
+        logging.info(f"Backfilled {inserted} metric points for node {node.get('name', token[:8])}.")
+    return web.json_response({"status": "ok", "accepted": len(points), "inserted": inserted})
+
+def _dispatch_node_results(bot, results, token, node_name):
+    if not bot or not results:
+        return
+    for res in results:
+        asyncio.create_task(
+            process_node_result_background(bot, res.get("user_id"), res.get("command"), res.get("result"), token, node_name))
+
+async def _node_ws_sync_interval(ws, token, state):
+    """Сообщает ноде новый интервал отправки stats, если он изменился."""
+    interval = nodes_db.negotiate_interval(token, state.get("requested"))
+    if not interval or interval == state.get("sent"):
+        return
+    state["sent"] = interval
+    await ws.send_json({"type": "interval", "interval": interval})
+    node = await nodes_db.get_node_by_token(token)
+    if node:
+        await nodes_db.set_node_interval(token, node, interval)
+
+async def _node_ws_push_tasks(ws, token, state):
+    """Отправляет задачи ноде сразу после постановки в очередь."""
+    while not ws.closed:
+        if not await nodes_db.wait_for_tasks(token, NODE_WS_TASK_WAIT):
+            await _node_ws_sync_interval(ws, token, state)
+            continue
+        await _node_ws_sync_interval(ws, token, state)
+        # Между claim и отправкой нет других await: задачи либо ушли, либо вернулись в очередь
+        rows = await nodes_db.claim_node_task_rows(token)
+        if not rows:
+            continue
+        try:
+            await ws.send_json({"type": "tasks", "tasks": [nodes_db.task_payload(r) for r in rows]})
+        except BaseException:
+            # Канал оборвался (или сокет закрывается) — задачи заберёт следующий heartbeat
+            await nodes_db.requeue_node_tasks(token, rows)
+            raise
+
+async def handle_node_ws(request):
+    """
+    Постоянный канал ноды. Первое сообщение — {"type": "hello", "token": ..., "interval": ...}.
+    Вверх: stats, result, result_chunk (длинный вывод частями). Вниз: tasks, interval.
+    """
+    ws = web.WebSocketResponse(heartbeat=NODE_WS_HEARTBEAT)
+    await ws.prepare(request)
+    try:
+        hello = await ws.receive_json(timeout=NODE_WS_HELLO_TIMEOUT)
+    except Exception:
+        await ws.close()
+        return ws
+    token = hello.get("token") if isinstance(hello, dict) else None
+    node = await nodes_db.get_node_by_token(token) if token else None
+    if not node or hello.get("type") != "hello":
+        await ws.close(code=4001, message=b"Auth fail")
+        return ws
+
+    previous = NODE_SOCKETS.get(token)
+    if previous is not None:
+        await previous.close(code=4000, message=b"Replaced")
+    NODE_SOCKETS[token] = ws
+    ip = request.transport.get_extra_info('peername')[0]
+    bot = request.app.get('bot')
+    interval_state = {"requested": hello.get("interval"), "sent": None}
+    pusher = asyncio.create_task(_node_ws_push_tasks(ws, token, interval_state))
+    chunks = {}
+    try:
+        async for msg in ws:
+            if msg.type != WSMsgType.TEXT:
+                continue
+            try:
+                data = json.loads(msg.data)
+            except ValueError:
+                continue
+            if not isinstance(data, dict):
+                continue
+            kind = data.get("type")
+            if kind == "stats":
+                node = await nodes_db.get_node_by_token(token)
+                if not node:
+                    break
+                if node.get("is_restarting"):
+                    await nodes_db.update_node_extra(token, "is_restarting", False)
+                nodes_db.queue_heartbeat(token, ip, data.get("stats", {}))
+                await _node_ws_sync_interval(ws, token, interval_state)
+            elif kind == "result":
+                _dispatch_node_results(bot, [data], token, node.get("name", "Node"))
+            elif kind == "result_chunk":
+                part = chunks.setdefault(data.get("id"), {"command": data.get("command"), "user_id": data.get("user_id"), "parts": [], "size": 0})
+                text = str(data.get("data", ""))
+                if part["size"] + len(text) <= NODE_WS_MAX_RESULT:
+                    part["parts"].append(text)
+                    part["size"] += len(text)
+                if data.get("final"):
+                    del chunks[data.get("id")]
+                    part["result"] = "".join(part.pop("parts"))
+                    _dispatch_node_results(bot, [part], token, node.get("name", "Node"))
+    finally:
+        pusher.cancel()
+        # Дожидаемся возврата в очередь задач, которые пушер не успел отправить
+        await asyncio.gather(pusher, return_exceptions=True)
+        if NODE_SOCKETS.get(token) is ws:
+            del NODE_SOCKETS[token]
+    return ws
+
+async def _close_node_sockets(app):
+    for ws in list(NODE_SOCKETS.values()):
+        await ws.close(code=1001, message=b"Server shutdown")
 
 async def process_node_result_background(bot, user_id, cmd, text, token, node_name):
     if not user_id or not text: return
@@ -328,41 +543,139 @@ async def process_node_result_background(bot, user_id, cmd, text, token, node_na
     except Exception as e:
         logging.error(f"Background send error: {e}")
 
+def _parse_history_range(request):
+    """?range=<сек>&points=<N> — история за произвольный период из уровней агрегации."""
+    try:
+        span = int(request.query.get("range", 0))
+        points = int(request.query.get("points", rollups.DEFAULT_MAX_POINTS))
+    except ValueError:
+        return None
+    if span <= 0:
+        return None
+    return time.time() - span, min(max(points, 1), 2000)
+
+def _parse_since(request):
+    """?since=<ts> — вернуть только точки новее ts."""
+    try:
+        return float(request.query["since"])
+    except (KeyError, ValueError):
+        return None
+
+def _make_etag(version):
+    # CACHE_VER меняется при перезапуске, а версии данных начинаются заново
+    return f'"{CACHE_VER}-{version}"'
+
+def _etag_matches(request, etag):
+    header = request.headers.get("If-None-Match")
+    if not header:
+        return False
+    tags = [t.strip() for t in header.split(",")]
+    return "*" in tags or etag in tags or f"W/{etag}" in tags
+
+def _not_modified(etag):
+    return web.Response(status=304, headers={"ETag": etag, "Cache-Control": "no-cache"})
+
+_COMPRESSIBLE_TYPES = ("text/", "application/json", "application/javascript")
+
+@web.middleware
+async def compression_middleware(request, handler):
+    """
+    Слабый ETag + 304 и gzip для готовых ответов (HTML/JSON).
+    Потоковые ответы (SSE, файлы) и уже сжатые (/assets) не трогаются.
+    Настройки читаются на каждый запрос, поэтому применяются без перезапуска.
+    """
+    response = await handler(request)
+    if type(response) is not web.Response or response.status != 200:
+        return response
+    if response.headers.get("Content-Encoding"):
+        return response
+    body = response.body
+    if not isinstance(body, bytes):
+        return response
+
+    if current_config.WEB_ETAGS and request.method in ("GET", "HEAD") and "ETag" not in response.headers:
+        etag = f'W/"{hashlib.blake2b(body, digest_size=12).hexdigest()}"'
+        if _etag_matches(request, etag):
+            return web.Response(status=304, headers={"ETag": etag, "Cache-Control": response.headers.get("Cache-Control", "no-cache")})
+        response.headers["ETag"] = etag
+
+    if (current_config.WEB_COMPRESSION and len(body) >= current_config.WEB_COMPRESSION_MIN_SIZE
+            and response.content_type.startswith(_COMPRESSIBLE_TYPES)):
+        response.headers.add("Vary", "Accept-Encoding")
+        if "gzip" in assets.accepted_encodings(request.headers.get("Accept-Encoding", "")):
+            response.enable_compression(web.ContentCoding.gzip)
+    return response
+
 async def handle_node_details(request):
     if not get_current_user(request):
         return web.json_response({"error": "Unauthorized"}, status=401)
     token = request.query.get("token")
-    node = await nodes_db.get_node_by_token(token)
+    history_range = _parse_history_range(request)
+    since = _parse_since(request)
+    etag = None
+    if not history_range:
+        # Версия ноды меняется при каждом heartbeat и изменении состояния
+        etag = _make_etag(nodes_db.get_node_version(token))
+        if _etag_matches(request, etag):
+            return _not_modified(etag)
+    node = await nodes_db.get_node_by_token(token, include_history=history_range is None and since is None)
     if not node:
         return web.json_response({"error": "Node not found"}, status=404)
-    return web.json_response({
+    nodes_db.watch_node(token)
+    if history_range:
+        history = await rollups.query_history(token, history_range[0], max_points=history_range[1])
+    elif since is not None:
+        history = await nodes_db.get_node_history(token, start=int(since) + 1)
+    else:
+        history = node.get("history", [])
+    data = {
         "name": node.get("name"),
         "ip": node.get("ip"),
         "stats": node.get("stats"),
-        "history": node.get("history", []),
+        "history": history,
         "token": token,
         "last_seen": node.get("last_seen", 0),
         "is_restarting": node.get("is_restarting", False)
-    })
+    }
+    if since is not None and not history_range:
+        data["since"] = since
+    return web.json_response(data, headers={"ETag": etag, "Cache-Control": "no-cache"} if etag else None)
+
+def _build_agent_stats():
+    current_stats = {"cpu": 0, "ram": 0, "disk": 0, "ip": AGENT_IP_CACHE, "net_sent": 0, "net_recv": 0, "boot_time": 0}
+    snap = sampler.get_snapshot()
+    if snap:
+        current_stats.update({"cpu": snap.cpu, "ram": snap.ram, "disk": snap.disk, "net_sent": snap.net_tx,
+                              "net_recv": snap.net_rx, "boot_time": int(snap.t - snap.uptime)})
+    return current_stats
 
 async def handle_agent_stats(request):
     if not get_current_user(request):
         return web.json_response({"error": "Unauthorized"}, status=401)
-    import psutil
-    current_stats = {"cpu": 0, "ram": 0, "disk": 0, "ip": AGENT_IP_CACHE, "net_sent": 0, "net_recv": 0, "boot_time": 0}
-    try:
-        net = psutil.net_io_counters()
-        current_stats.update({"net_sent": net.bytes_sent, "net_recv": net.bytes_recv, "boot_time": psutil.boot_time()})
-    except Exception: pass
-    
-    if AGENT_HISTORY:
-        latest = AGENT_HISTORY[-1]
-        current_stats.update({"cpu": latest["c"], "ram": latest["r"]})
-        try:
-            current_stats["disk"] = psutil.disk_usage(get_host_path('/')).percent
-        except Exception: pass
-        
-    return web.json_response({"stats": current_stats, "history": AGENT_HISTORY})
+    history_range = _parse_history_range(request)
+    since = _parse_since(request)
+    etag = None
+    if not history_range and AGENT_HISTORY:
+        # Данные агента меняются только с новым снимком сэмплера
+        etag = _make_etag(f"a{AGENT_HISTORY[-1]['t']}")
+        if _etag_matches(request, etag):
+            return _not_modified(etag)
+    current_stats = _build_agent_stats()
+    history = AGENT_HISTORY
+    if history_range:
+        history = await rollups.query_history(nodes_db.AGENT_METRICS_TOKEN, history_range[0], max_points=history_range[1])
+    elif since is not None:
+        history = [p for p in AGENT_HISTORY if p["t"] > since]
+    data = {"stats": current_stats, "history": history}
+    if since is not None and not history_range:
+        data["since"] = since
+    return web.json_response(data, headers={"ETag": etag, "Cache-Control": "no-cache"} if etag else None)
+
+async def handle_alerts_queue(request):
+    user = get_current_user(request)
+    if not user or user['role'] != 'admins':
+        return web.json_response({"error": "Admin required"}, status=403)
+    return web.json_response({**messaging.get_queue_stats(), "digest": digest.get_stats()})
 
 async def handle_node_add(request):
     user = get_current_user(request)
@@ -386,6 +699,20 @@ async def handle_node_add(request):
     except Exception as e:
         return web.json_response({"error": str(e)}, status=500)
 
+async def handle_node_watch(request):
+    """Карточка ноды открыта при живом потоке (SSE): держим ноду в быстром режиме heartbeat."""
+    if not get_current_user(request):
+        return web.json_response({"error": "Unauthorized"}, status=401)
+    try:
+        data = await request.json()
+    except Exception:
+        return web.json_response({"error": "Invalid JSON"}, status=400)
+    token = data.get("token") if isinstance(data, dict) else None
+    if not token or not await nodes_db.get_node_by_token(token):
+        return web.json_response({"error": "Node not found"}, status=404)
+    nodes_db.watch_node(token)
+    return web.json_response({"status": "ok"})
+
 async def handle_node_delete(request):
     user = get_current_user(request)
     if not user or user['role'] != 'admins':
@@ -404,7 +731,9 @@ async def handle_nodes_list_json(request):
     user = get_current_user(request)
     if not user:
         return web.json_response({"error": "Unauthorized"}, status=401)
-    
+    return web.json_response({"nodes": await _build_nodes_list()})
+
+async def _build_nodes_list():
     all_nodes = await nodes_db.get_all_nodes()
     nodes_data = []
     now = time.time()
@@ -416,7 +745,7 @@ async def handle_nodes_list_json(request):
         
         if is_restarting:
             status = "restarting"
-        elif now - last_seen < NODE_OFFLINE_TIMEOUT:
+        elif now - last_seen < nodes_db.node_offline_timeout(node):
             status = "online"
             
         stats = node.get("stats", {})
@@ -429,106 +758,140 @@ async def handle_nodes_list_json(request):
             "ram": stats.get("ram", 0), 
             "disk": stats.get("disk", 0)
         })
-        
-    return web.json_response({"nodes": nodes_data})
+    return nodes_data
 
-async def handle_settings_page(request):
-    user = get_current_user(request)
-    if not user:
-        raise web.HTTPFound('/login')
-    html = load_template("settings.html")
-    user_id = user['id']
-    is_admin = user['role'] == 'admins'
-    lang = get_user_lang(user_id)
-    user_alerts = ALERTS_CONFIG.get(user_id, {})
-    
-    users_json = "null"
-    nodes_json = "null"
+def _sse_message(event, data):
+    return f"event: {event}\ndata: {json.dumps(data, separators=(',', ':'))}\n\n".encode()
 
-    if is_admin:
-        ulist = [{"id": uid, "name": USER_NAMES.get(str(uid), f"ID: {uid}"), "role": ALLOWED_USERS[uid].get("group", "users") if isinstance(ALLOWED_USERS[uid], dict) else ALLOWED_USERS[uid]} for uid in ALLOWED_USERS if uid != ADMIN_USER_ID]
-        users_json = json.dumps(ulist)
-        
-        all_nodes = await nodes_db.get_all_nodes()
-        nlist = [{"token": t, "name": n.get("name", "Unknown"), "ip": n.get("ip", "Unknown")} for t, n in all_nodes.items()]
-        nodes_json = json.dumps(nlist)
+def _stream_publish(event, data, keep=False):
+    """Кладёт готовое сообщение в очереди всех клиентов; медленные клиенты отключаются."""
+    message = _sse_message(event, data)
+    if keep:
+        STREAM_LAST[event] = message
+    for queue in list(STREAM_CLIENTS):
+        try:
+            queue.put_nowait(message)
+        except asyncio.QueueFull:
+            _stream_drop(queue)
 
-    keyboard_config_json = json.dumps(KEYBOARD_CONFIG)
+def _stream_drop(queue):
+    STREAM_CLIENTS.discard(queue)
+    while not queue.empty():
+        queue.get_nowait()
+    queue.put_nowait(None)
 
-    replacements = {
-        "{web_title}": f"{_('web_settings_page_title', lang)} - Web Bot",
-        "{user_name}": user.get('first_name'),
-        "{user_avatar}": _get_avatar_html(user),
-        "{users_data_json}": users_json,
-        "{nodes_data_json}": nodes_json,
-        "{keyboard_config_json}": keyboard_config_json,
-        "{val_cpu}": str(current_config.CPU_THRESHOLD),
-        "{val_ram}": str(current_config.RAM_THRESHOLD),
-        "{val_disk}": str(current_config.DISK_THRESHOLD),
-        "{val_traffic}": str(current_config.TRAFFIC_INTERVAL),
-        "{val_timeout}": str(current_config.NODE_OFFLINE_TIMEOUT),
-        "{web_settings_page_title}": _("web_settings_page_title", lang),
-        "{web_back}": _("web_back", lang),
-        "{web_notif_section}": _("web_notif_section", lang),
-        "{notifications_alert_name_res}": _("notifications_alert_name_res", lang),
-        "{notifications_alert_name_logins}": _("notifications_alert_name_logins", lang),
-        "{notifications_alert_name_bans}": _("notifications_alert_name_bans", lang),
-        "{notifications_alert_name_downtime}": _("notifications_alert_name_downtime", lang),
-        "{web_save_btn}": _("web_save_btn", lang),
-        "{web_users_section}": _("web_users_section", lang),
-        "{web_add_user_btn}": _("web_add_user_btn", lang),
-        "{web_user_id}": _("web_user_id", lang),
-        "{web_user_name}": _("web_user_name", lang),
-        "{web_user_role}": _("web_user_role", lang),
-        "{web_user_action}": _("web_user_action", lang),
-        "{web_add_node_section}": _("web_add_node_section", lang),
-        "{web_node_name_placeholder}": _("web_node_name_placeholder", lang),
-        "{web_no_users}": _("web_no_users", lang),
-        "{web_create_btn}": _("web_create_btn", lang),
-        "{web_node_token}": _("web_node_token", lang),
-        "{web_node_cmd}": _("web_node_cmd", lang),
-        "{web_sys_settings_section}": _("web_sys_settings_section", lang),
-        "{web_thresholds_title}": _("web_thresholds_title", lang),
-        "{web_intervals_title}": _("web_intervals_title", lang),
-        "{web_logs_mgmt_title}": _("web_logs_mgmt_title", lang),
-        "{web_cpu_threshold}": _("web_cpu_threshold", lang),
-        "{web_ram_threshold}": _("web_ram_threshold", lang),
-        "{web_disk_threshold}": _("web_disk_threshold", lang),
-        "{web_traffic_interval}": _("web_traffic_interval", lang),
-        "{web_node_timeout}": _("web_node_timeout", lang),
-        "{web_clear_logs_btn}": _("web_clear_logs_btn", lang),
-        "{web_security_section}": _("web_security_section", lang),
-        "{web_change_password_title}": _("web_change_password_title", lang),
-        "{web_current_password}": _("web_current_password", lang),
-        "{web_new_password}": _("web_new_password", lang),
-        "{web_confirm_password}": _("web_confirm_password", lang),
-        "{web_change_btn}": _("web_change_btn", lang),
-        "{web_hint_cpu_threshold}": _("web_hint_cpu_threshold", lang),
-        "{web_hint_ram_threshold}": _("web_hint_ram_threshold", lang),
-        "{web_hint_disk_threshold}": _("web_hint_disk_threshold", lang),
-        "{web_hint_traffic_interval}": _("web_hint_traffic_interval", lang),
-        "{web_hint_node_timeout}": _("web_hint_node_timeout", lang),
-        "{web_keyboard_title}": _("web_keyboard_title", lang),
-        "{web_soon_placeholder}": _("web_soon_placeholder", lang),
-        "{web_node_mgmt_title}": _("web_node_mgmt_title", lang),
-        "{web_kb_desc}": _("web_kb_desc", lang),
-        "{web_kb_btn_config}": _("web_kb_btn_config", lang),
-        "{web_kb_enable_all}": _("web_kb_enable_all", lang),
-        "{web_kb_disable_all}": _("web_kb_disable_all", lang),
-        "{web_kb_modal_title}": _("web_kb_modal_title", lang),
-        "{web_kb_done}": _("web_kb_done", lang),
-        "{web_version}": CACHE_VER,
-    }
+async def stream_broadcaster():
+    """
+    Раз в STREAM_TICK сравнивает версию реестра нод и последний сэмпл агента
+    и рассылает только изменившиеся данные.
+    """
+    last_version = -1
+    last_nodes = None
+    node_versions = {}
+    last_agent_t = None
+    while True:
+        try:
+            if STREAM_CLIENTS:
+                version = nodes_db.get_registry_version()
+                nodes_list = await _build_nodes_list()
+                # Статус может смениться и без новых данных (истёк таймаут), поэтому сравниваем сам список
+                if nodes_list != last_nodes:
+                    last_nodes = nodes_list
+                    _stream_publish("nodes", {"nodes": nodes_list}, keep=True)
+                if version != last_version:
+                    last_version = version
+                    all_nodes = await nodes_db.get_all_nodes()
+                    # Все изменившиеся за тик ноды — одним сообщением, по одной записи на токен
+                    delta = []
+                    for token, node in all_nodes.items():
+                        node_version = node.get("version", 0)
+                        if node_versions.get(token) == node_version:
+                            continue
+                        node_versions[token] = node_version
+                        stats = node.get("stats") or {}
+                        delta.append({
+                            "token": token,
+                            "ip": node.get("ip"),
+                            "stats": stats,
+                            "last_seen": node.get("last_seen", 0),
+                            "is_restarting": node.get("is_restarting", False),
+                            "point": {"t": int(node.get("last_seen", 0)), "c": stats.get("cpu", 0), "r": stats.get("ram", 0),
+                                      "rx": stats.get("net_rx", 0), "tx": stats.get("net_tx", 0)}
+                        })
+                    if delta:
+                        _stream_publish("nodes_delta", {"nodes": delta})
+                    for token in list(node_versions):
+                        if token not in all_nodes:
+                            del node_versions[token]
+                if AGENT_HISTORY and AGENT_HISTORY[-1]["t"] != last_agent_t:
+                    # Только новые точки; полная история уходит клиенту один раз при подключении
+                    if last_agent_t is None:
+                        fresh = AGENT_HISTORY[-1:]
+                    else:
+                        fresh = [p for p in AGENT_HISTORY if p["t"] > last_agent_t]
+                    last_agent_t = AGENT_HISTORY[-1]["t"]
+                    _stream_publish("agent_delta", {"stats": _build_agent_stats(), "history": fresh})
+        except asyncio.CancelledError: raise
+        except Exception as e:
+            logging.error(f"Stream broadcaster error: {e}")
+        await asyncio.sleep(STREAM_TICK)
 
-    modified_html = html
-    for k, v in replacements.items():
-        modified_html = modified_html.replace(k, v)
+async def handle_stream(request):
+    if not get_current_user(request):
+        return web.json_response({"error": "Unauthorized"}, status=401)
+    response = web.StreamResponse(headers={
+        "Content-Type": "text/event-stream",
+        "Cache-Control": "no-cache",
+        "X-Accel-Buffering": "no"
+    })
+    await response.prepare(request)
+    queue = asyncio.Queue(maxsize=STREAM_QUEUE_SIZE)
+    # Новый клиент сразу получает последний снимок, история агента — целиком один раз
+    for message in list(STREAM_LAST.values()):
+        queue.put_nowait(message)
+    if AGENT_HISTORY:
+        queue.put_nowait(_sse_message("agent", {"stats": _build_agent_stats(), "history": AGENT_HISTORY}))
+    STREAM_CLIENTS.add(queue)
+    try:
+        while True:
+            try:
+                message = await asyncio.wait_for(queue.get(), timeout=STREAM_PING_INTERVAL)
+            except asyncio.TimeoutError:
+                message = b": ping\n\n"
+            if message is None:
+                break
+            await response.write(message)
+    except (ConnectionResetError, asyncio.CancelledError):
+        pass
+    finally:
+        STREAM_CLIENTS.discard(queue)
+    return response
+
+async def _close_streams(app):
+    for queue in list(STREAM_CLIENTS):
+        _stream_drop(queue)
+
+def _settings_static(lang):
+    static = {
+        "web_title": f"{_('web_settings_page_title', lang)} - Web Bot",
+        "web_version": CACHE_VER,
+    }
+    for key in (
+            "web_settings_page_title", "web_back", "web_notif_section", "notifications_alert_name_res",
+            "notifications_alert_name_logins", "notifications_alert_name_bans", "notifications_alert_name_downtime",
+            "web_save_btn", "web_users_section", "web_add_user_btn", "web_user_id", "web_user_name",
+            "web_user_role", "web_user_action", "web_add_node_section", "web_node_name_placeholder",
+            "web_no_users", "web_create_btn", "web_node_token", "web_node_cmd", "web_sys_settings_section",
+            "web_thresholds_title", "web_intervals_title", "web_logs_mgmt_title", "web_cpu_threshold",
+            "web_ram_threshold", "web_disk_threshold", "web_traffic_interval", "web_node_timeout",
+            "web_clear_logs_btn", "web_security_section", "web_change_password_title", "web_current_password",
+            "web_new_password", "web_confirm_password", "web_change_btn", "web_hint_cpu_threshold",
+            "web_hint_ram_threshold", "web_hint_disk_threshold", "web_hint_traffic_interval",
+            "web_hint_node_timeout", "web_keyboard_title", "web_soon_placeholder", "web_node_mgmt_title",
+            "web_kb_desc", "web_kb_btn_config", "web_kb_enable_all", "web_kb_disable_all", "web_kb_modal_title",
+            "web_kb_done"):
+        static[key] = _(key, lang)
 
-    for alert in ['resources', 'logins', 'bans', 'downtime']:
-        modified_html = modified_html.replace(f"{{check_{alert}}}", "checked" if user_alerts.get(alert, False) else "")
-    if user_id != ADMIN_USER_ID:
-        modified_html = modified_html.replace('<div class="bg-white/60 dark:bg-white/5 backdrop-blur-md border border-white/40 dark:border-white/10 rounded-2xl p-6 shadow-lg dark:shadow-none" id="securitySection">', '<div class="hidden">')
-    
     i18n_data = {
         "web_saving_btn": _("web_saving_btn", lang), "web_saved_btn": _("web_saved_btn", lang), "web_save_btn": _("web_save_btn", lang), "web_change_btn": _("web_change_btn", lang), "web_error": _("web_error", lang, error=""), "web_conn_error": _("web_conn_error", lang, error=""), "web_confirm_delete_user": _("web_confirm_delete_user", lang), "web_no_users": _("web_no_users", lang), "web_clear_logs_confirm": _("web_clear_logs_confirm", lang), "web_logs_cleared": _("web_logs_cleared", lang), "error_traffic_interval_low": _("error_traffic_interval_low", lang), "error_traffic_interval_high": _("error_traffic_interval_high", lang), "web_logs_clearing": _("web_logs_clearing", lang), "web_logs_cleared_alert": _("web_logs_cleared_alert", lang), "web_pass_changed": _("web_pass_changed", lang), "web_pass_mismatch": _("web_pass_mismatch", lang),
         "web_clear_bot_confirm": _("web_clear_bot_confirm", lang),
@@ -558,8 +921,58 @@ async def handle_settings_page(request):
     for btn_key, conf_key in BTN_CONFIG_MAP.items():
         i18n_data[f"lbl_{conf_key}"] = _(btn_key, lang)
 
-    modified_html = modified_html.replace("{i18n_json}", json.dumps(i18n_data))
-    return web.Response(text=modified_html, content_type='text/html')
+    static["i18n_json"] = json.dumps(i18n_data)
+    return static
+
+_SECURITY_SECTION_OPEN = '<div class="bg-white/60 dark:bg-white/5 backdrop-blur-md border border-white/40 dark:border-white/10 rounded-2xl p-6 shadow-lg dark:shadow-none" id="securitySection">'
+
+def _hide_security_section(html):
+    return html.replace(_SECURITY_SECTION_OPEN, '<div class="hidden">')
+
+async def handle_settings_page(request):
+    user = get_current_user(request)
+    if not user:
+        raise web.HTTPFound('/login')
+    user_id = user['id']
+    is_admin = user['role'] == 'admins'
+    lang = get_user_lang(user_id)
+    user_alerts = ALERTS_CONFIG.get(user_id, {})
+    
+    users_json = "null"
+    nodes_json = "null"
+
+    if is_admin:
+        ulist = [{"id": uid, "name": USER_NAMES.get(str(uid), f"ID: {uid}"), "role": ALLOWED_USERS[uid].get("group", "users") if isinstance(ALLOWED_USERS[uid], dict) else ALLOWED_USERS[uid]} for uid in ALLOWED_USERS if uid != ADMIN_USER_ID]
+        users_json = json.dumps(ulist)
+        
+        all_nodes = await nodes_db.get_all_nodes()
+        nlist = [{"token": t, "name": n.get("name", "Unknown"), "ip": n.get("ip", "Unknown")} for t, n in all_nodes.items()]
+        nodes_json = json.dumps(nlist)
+
+    keyboard_config_json = json.dumps(KEYBOARD_CONFIG)
+
+    context = {
+        "user_name": user.get('first_name'),
+        "user_avatar": _get_avatar_html(user),
+        "users_data_json": users_json,
+        "nodes_data_json": nodes_json,
+        "keyboard_config_json": keyboard_config_json,
+        "val_cpu": str(current_config.CPU_THRESHOLD),
+        "val_ram": str(current_config.RAM_THRESHOLD),
+        "val_disk": str(current_config.DISK_THRESHOLD),
+        "val_traffic": str(current_config.TRAFFIC_INTERVAL),
+        "val_timeout": str(current_config.NODE_OFFLINE_TIMEOUT),
+    }
+    for alert in ['resources', 'logins', 'bans', 'downtime']:
+        context[f"check_{alert}"] = "checked" if user_alerts.get(alert, False) else ""
+
+    # Секция безопасности доступна только главному админу — отдельный вариант шаблона
+    if user_id == ADMIN_USER_ID:
+        html = render_template("settings.html", lang, _settings_static, context)
+    else:
+        html = render_template("settings.html", lang, _settings_static, context,
+                               variant="restricted", transform=_hide_security_section)
+    return web.Response(text=html, content_type='text/html')
 
 async def handle_save_notifications(request):
     user = get_current_user(request)
@@ -693,6 +1106,18 @@ async def handle_set_language(request):
     except Exception as e:
         return web.json_response({"error": str(e)}, status=500)
 
+def _public_page_static(lang):
+    i18n_data = {
+        "web_error": _("web_error", lang, error=""),
+        "web_conn_error": _("web_conn_error", lang, error=""),
+        "modal_title_alert": _("modal_title_alert", lang),
+        "modal_title_confirm": _("modal_title_confirm", lang),
+        "modal_title_prompt": _("modal_title_prompt", lang),
+        "modal_btn_ok": _("modal_btn_ok", lang),
+        "modal_btn_cancel": _("modal_btn_cancel", lang),
+    }
+    return {"error_block": "", "web_version": CACHE_VER, "i18n_json": json.dumps(i18n_data)}
+
 async def handle_login_page(request):
     if get_current_user(request):
         raise web.HTTPFound('/')
@@ -706,28 +1131,13 @@ async def handle_login_page(request):
         except Exception as e:
             logging.error(f"Error fetching bot username: {e}")
             BOT_USERNAME_CACHE = ""
-    html = load_template("login.html")
     alert = ""
     if is_default_password_active(ADMIN_USER_ID):
         alert = f"""<div class="mb-4 p-3 bg-yellow-500/20 border border-yellow-500/50 rounded-xl flex items-start gap-3"><svg xmlns="http://www.w3.org/2000/svg" class="h-6 w-6 text-yellow-500 shrink-0" fill="none" viewBox="0 0 24 24" stroke="currentColor"><path stroke-linecap="round" stroke-linejoin="round" stroke-width="2" d="M12 9v2m0 4h.01m-6.938 4h13.856c1.54 0 2.502-1.667 1.732-3L13.732 4c-.77-1.333-2.694-1.333-3.464 0L3.34 16c-.77 1.333.192 3 1.732 3z" /></svg><span class="text-xs text-yellow-200 font-medium">{_("web_default_pass_alert", DEFAULT_LANGUAGE)}</span></div>"""
-    html = html.replace("{default_pass_alert}", alert).replace("{error_block}", "")
-    html = html.replace("{bot_username}", BOT_USERNAME_CACHE or "")
-    html = html.replace("style.css", f"style.css?v={CACHE_VER}")
-    lang = DEFAULT_LANGUAGE
-    i18n_data = {
-        "web_error": _("web_error", lang, error=""),
-        "web_conn_error": _("web_conn_error", lang, error=""),
-        "modal_title_alert": _("modal_title_alert", lang),
-        "modal_title_confirm": _("modal_title_confirm", lang),
-        "modal_title_prompt": _("modal_title_prompt", lang),
-        "modal_btn_ok": _("modal_btn_ok", lang),
-        "modal_btn_cancel": _("modal_btn_cancel", lang),
-    }
-    if "{i18n_json}" in html:
-        html = html.replace("{i18n_json}", json.dumps(i18n_data))
-    else:
-        script = f'<script>const I18N = {json.dumps(i18n_data)};</script>'
-        html = html.replace("</body>", f"{script}</body>")
+    html = render_template("login.html", DEFAULT_LANGUAGE, _public_page_static, {
+        "default_pass_alert": alert,
+        "bot_username": BOT_USERNAME_CACHE or "",
+    }, transform=_inject_i18n_script)
     return web.Response(text=html, content_type='text/html')
 
 async def handle_login_request(request):
@@ -831,21 +1241,7 @@ async def handle_reset_page_render(request):
     if time.time() - RESET_TOKENS[token]["ts"] > RESET_TOKEN_TTL:
         del RESET_TOKENS[token]
         return web.Response(text="Expired", status=403)
-    html = load_template("reset_password.html").replace("{web_version}", CACHE_VER)
-    lang = DEFAULT_LANGUAGE
-    i18n_data = {
-        "web_error": _("web_error", lang, error=""),
-        "web_conn_error": _("web_conn_error", lang, error=""),
-        "modal_title_alert": _("modal_title_alert", lang),
-        "modal_title_confirm": _("modal_title_confirm", lang),
-        "modal_title_prompt": _("modal_title_prompt", lang),
-        "modal_btn_ok": _("modal_btn_ok", lang),
-        "modal_btn_cancel": _("modal_btn_cancel", lang),
-    }
-    if "{i18n_json}" in html: html = html.replace("{i18n_json}", json.dumps(i18n_data))
-    else:
-        script = f'<script>const I18N = {json.dumps(i18n_data)};</script>'
-        html = html.replace("</body>", f"{script}</body>")
+    html = render_template("reset_password.html", DEFAULT_LANGUAGE, _public_page_static, {}, transform=_inject_i18n_script)
     return web.Response(text=html, content_type='text/html')
 
 async def handle_reset_confirm(request):
@@ -871,20 +1267,26 @@ async def handle_reset_confirm(request):
 async def handle_api_root(request): return web.Response(text="VPS Bot API")
 
 async def cleanup_server():
-    global AGENT_TASK
-    if AGENT_TASK and not AGENT_TASK.done():
-        AGENT_TASK.cancel()
-        try: await AGENT_TASK
-        except asyncio.CancelledError: pass
+    for task in (AGENT_TASK, STREAM_TASK):
+        if task and not task.done():
+            task.cancel()
+            try: await task
+            except asyncio.CancelledError: pass
 
 async def start_web_server(bot_instance: Bot):
-    global AGENT_FLAG, AGENT_TASK
-    app = web.Application()
+    global AGENT_FLAG, AGENT_TASK, STREAM_TASK
+    app = web.Application(middlewares=[compression_middleware])
     app['bot'] = bot_instance
     app.router.add_post('/api/heartbeat', handle_heartbeat)
+    app.router.add_get('/api/node/ws', handle_node_ws)
+    app.router.add_post('/api/node/backfill', handle_node_backfill)
+    app.on_shutdown.append(_close_node_sockets)
     if ENABLE_WEB_UI:
         logging.info("Web UI ENABLED.")
-        if os.path.exists(STATIC_DIR): app.router.add_static('/static', STATIC_DIR)
+        if os.path.exists(STATIC_DIR):
+            assets.build_manifest(STATIC_DIR)
+            app.router.add_get(assets.ASSET_PREFIX + '/{path:.+}', assets.handle_asset)
+            app.router.add_static('/static', STATIC_DIR)
         app.router.add_get('/', handle_dashboard)
         app.router.add_get('/settings', handle_settings_page)
         app.router.add_get('/login', handle_login_page)
@@ -897,8 +1299,11 @@ async def start_web_server(bot_instance: Bot):
         app.router.add_post('/api/auth/telegram', handle_telegram_auth)
         app.router.add_post('/logout', handle_logout)
         app.router.add_get('/api/node/details', handle_node_details)
+        app.router.add_post('/api/node/watch', handle_node_watch)
         app.router.add_get('/api/agent/stats', handle_agent_stats)
         app.router.add_get('/api/nodes/list', handle_nodes_list_json)
+        app.router.add_get('/api/alerts/queue', handle_alerts_queue)
+        app.router.add_get('/api/stream', handle_stream)
         app.router.add_get('/api/logs', handle_get_logs)
         app.router.add_post('/api/settings/save', handle_save_notifications)
         app.router.add_post('/api/settings/language', handle_set_language)
@@ -913,6 +1318,9 @@ async def start_web_server(bot_instance: Bot):
         logging.info("Web UI DISABLED.")
         app.router.add_get('/', handle_api_root)
     AGENT_TASK = asyncio.create_task(agent_monitor())
+    if ENABLE_WEB_UI:
+        app.on_shutdown.append(_close_streams)
+        STREAM_TASK = asyncio.create_task(stream_broadcaster())
     runner = web.AppRunner(app, access_log=None)
     await runner.setup()
     site = web.TCPSite(runner, WEB_SERVER_HOST, WEB_SERVER_PORT)
@@ -925,21 +1333,10 @@ async def start_web_server(bot_instance: Bot):
         return None
 
 async def agent_monitor():
+    """Внешний IP и флаг агента; метрики снимает core.sampler."""
     global AGENT_IP_CACHE, AGENT_FLAG
-    import psutil
     import requests
     try: AGENT_IP_CACHE = await asyncio.to_thread(lambda: requests.get("https://api.ipify.org", timeout=3).text)
     except Exception: pass
     try: AGENT_FLAG = await get_country_flag(AGENT_IP_CACHE)
     except Exception: pass
-    while True:
-        try:
-            cpu = psutil.cpu_percent(interval=None)
-            ram = psutil.virtual_memory().percent
-            net = psutil.net_io_counters()
-            point = {"t": int(time.time()), "c": cpu, "r": ram, "rx": net.bytes_recv, "tx": net.bytes_sent}
-            AGENT_HISTORY.append(point)
-            if len(AGENT_HISTORY) > 60: AGENT_HISTORY.pop(0)
-        except asyncio.CancelledError: raise
-        except Exception: pass
-        await asyncio.sleep(2)
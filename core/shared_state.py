@@ -11,6 +11,4 @@ USER_SETTINGS = {}
 NODES = {}
 NODE_TRAFFIC_MONITORS = {}
 AUTH_TOKENS = {}
-RESOURCE_ALERT_STATE = {"cpu": False, "ram": False, "disk": False}
-LAST_RESOURCE_ALERT_TIME = {"cpu": 0, "ram": 0, "disk": 0}
 AGENT_HISTORY = []
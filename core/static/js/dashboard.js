@@ -6,6 +6,21 @@ let chartAgent = null;
 let agentPollInterval = null;
 let nodesPollInterval = null;
 
+// Живой поток (SSE). Если недоступен — работаем через опрос раз в 3 секунды
+let liveStream = null;
+let currentNodeToken = null;
+let currentNodeHistory = [];
+const NODE_HISTORY_WINDOW = 300;
+// Пока карточка открыта, агент держит ноду в быстром режиме heartbeat (при опросе это делает сам /api/node/details)
+let nodeWatchInterval = null;
+const NODE_WATCH_PING = 15000;
+
+// Опрос догружает только новые точки (?since=) и получает 304, если данные не менялись
+let nodeEtag = null;
+let agentEtag = null;
+let agentHistory = [];
+const AGENT_HISTORY_POINTS = 60;
+
 window.addEventListener('themeChanged', () => {
     updateChartsColors();
 });
@@ -13,16 +28,52 @@ window.addEventListener('themeChanged', () => {
 document.addEventListener("DOMContentLoaded", () => {
     // parsePageEmojis запускается в common.js, здесь не нужно
 
-    if(document.getElementById('chartAgent')) {
-        fetchAgentStats();
+    const hasAgent = !!document.getElementById('chartAgent');
+    const hasNodes = !!document.getElementById('nodesGrid');
+
+    if (hasAgent) fetchAgentStats();
+    if (hasNodes) fetchNodesList();
+
+    if ((hasAgent || hasNodes) && !startLiveStream()) {
+        startPolling();
+    }
+});
+
+function startPolling() {
+    if (document.getElementById('chartAgent') && !agentPollInterval) {
         agentPollInterval = setInterval(fetchAgentStats, 3000);
     }
-    
-    if (document.getElementById('nodesGrid')) {
-        fetchNodesList();
+    if (document.getElementById('nodesGrid') && !nodesPollInterval) {
         nodesPollInterval = setInterval(fetchNodesList, 3000);
     }
-});
+    if (currentNodeToken && !pollInterval) {
+        const token = currentNodeToken;
+        pollInterval = setInterval(() => fetchAndRender(token), 3000);
+    }
+}
+
+function startLiveStream() {
+    if (!window.EventSource) return false;
+    liveStream = new EventSource('/api/stream');
+
+    if (document.getElementById('nodesGrid')) {
+        liveStream.addEventListener('nodes', (e) => applyNodesList(JSON.parse(e.data)));
+        liveStream.addEventListener('nodes_delta', (e) => applyNodesDelta(JSON.parse(e.data)));
+    }
+    if (document.getElementById('chartAgent')) {
+        liveStream.addEventListener('agent', (e) => applyAgentStats(JSON.parse(e.data)));
+        liveStream.addEventListener('agent_delta', (e) => applyAgentDelta(JSON.parse(e.data)));
+    }
+
+    liveStream.onerror = () => {
+        // CONNECTING — браузер переподключится сам; CLOSED — сервер отказал, переходим на опрос
+        if (liveStream.readyState === EventSource.CLOSED) {
+            liveStream = null;
+            startPolling();
+        }
+    };
+    return true;
+}
 
 function escapeHtml(text) {
     if (!text) return text;
@@ -38,36 +89,40 @@ async function fetchNodesList() {
     try {
         const response = await fetch('/api/nodes/list');
         const data = await response.json();
-        renderNodesGrid(data.nodes);
-        
-        const total = data.nodes.length;
-        const activeCount = data.nodes.filter(n => n.status === 'online').length;
-        
-        const totalEl = document.getElementById('statTotalNodes');
-        const activeEl = document.getElementById('statActiveNodes');
-        if (totalEl) totalEl.innerText = total;
-        if (activeEl) activeEl.innerText = activeCount;
-
-        const barEl = document.getElementById('statProgressBar');
-        const percentEl = document.getElementById('statOnlinePercent');
-        
-        if (barEl && percentEl) {
-            let percent = 0;
-            if (total > 0) {
-                percent = Math.round((activeCount / total) * 100);
-            }
-            
-            barEl.style.width = `${percent}%`;
-            percentEl.innerText = `${percent}%`;
-            
-            barEl.className = `h-1.5 rounded-full transition-all duration-1000 ease-out ${percent === 100 ? 'bg-gradient-to-r from-green-400 to-emerald-500' : (percent > 50 ? 'bg-gradient-to-r from-yellow-400 to-orange-500' : 'bg-gradient-to-r from-red-500 to-red-600')}`;
-        }
-            
+        applyNodesList(data);
     } catch (e) {
         console.error("Ошибка обновления списка нод:", e);
     }
 }
 
+function applyNodesList(data) {
+    if (!data.nodes) return;
+    renderNodesGrid(data.nodes);
+    
+    const total = data.nodes.length;
+    const activeCount = data.nodes.filter(n => n.status === 'online').length;
+    
+    const totalEl = document.getElementById('statTotalNodes');
+    const activeEl = document.getElementById('statActiveNodes');
+    if (totalEl) totalEl.innerText = total;
+    if (activeEl) activeEl.innerText = activeCount;
+
+    const barEl = document.getElementById('statProgressBar');
+    const percentEl = document.getElementById('statOnlinePercent');
+    
+    if (barEl && percentEl) {
+        let percent = 0;
+        if (total > 0) {
+            percent = Math.round((activeCount / total) * 100);
+        }
+        
+        barEl.style.width = `${percent}%`;
+        percentEl.innerText = `${percent}%`;
+        
+        barEl.className = `h-1.5 rounded-full transition-all duration-1000 ease-out ${percent === 100 ? 'bg-gradient-to-r from-green-400 to-emerald-500' : (percent > 50 ? 'bg-gradient-to-r from-yellow-400 to-orange-500' : 'bg-gradient-to-r from-red-500 to-red-600')}`;
+    }
+}
+
 function renderNodesGrid(nodes) {
     const container = document.getElementById('nodesGrid');
     if (!container) return;
@@ -131,33 +186,54 @@ function renderNodesGrid(nodes) {
 
 async function fetchAgentStats() {
     try {
-        const response = await fetch('/api/agent/stats');
+        const last = agentHistory[agentHistory.length - 1];
+        const headers = {};
+        if (last && agentEtag) headers['If-None-Match'] = agentEtag;
+        const response = await fetch('/api/agent/stats' + (last ? `?since=${last.t}` : ''), { headers });
+        if (response.status === 304) return;
+        agentEtag = response.headers.get('ETag');
         const data = await response.json();
-        
-        if(data.stats) {
-            document.getElementById('agentCpu').innerText = Math.round(data.stats.cpu) + "%";
-            document.getElementById('agentRam').innerText = Math.round(data.stats.ram) + "%";
-            document.getElementById('agentDisk').innerText = Math.round(data.stats.disk) + "%";
-            document.getElementById('agentIp').innerText = data.stats.ip || "Unknown";
-            
-            if (document.getElementById('trafficRxTotal')) {
-                document.getElementById('trafficRxTotal').innerText = formatBytes(data.stats.net_recv);
-                document.getElementById('trafficTxTotal').innerText = formatBytes(data.stats.net_sent);
-                
-                const uptimeStr = formatUptime(data.stats.boot_time);
-                const uptimeEl = document.getElementById('agentUptime');
-                const uptimeMobileEl = document.getElementById('agentUptimeMobile');
-                
-                if(uptimeEl) uptimeEl.innerText = uptimeStr;
-                if(uptimeMobileEl) uptimeMobileEl.innerText = uptimeStr;
-            }
+        if (data.since !== undefined) {
+            agentHistory = agentHistory.concat(data.history || []).slice(-AGENT_HISTORY_POINTS);
+            data.history = agentHistory;
         }
-        renderAgentChart(data.history);
+        applyAgentStats(data);
     } catch (e) {
         console.error("Agent stats error:", e);
     }
 }
 
+function applyAgentDelta(data) {
+    // Полная история пришла событием 'agent' при подключении, дальше — только новые точки
+    const last = agentHistory[agentHistory.length - 1];
+    const fresh = (data.history || []).filter(p => !last || p.t > last.t);
+    data.history = agentHistory.concat(fresh).slice(-AGENT_HISTORY_POINTS);
+    applyAgentStats(data);
+}
+
+function applyAgentStats(data) {
+    agentHistory = data.history || [];
+    if(data.stats) {
+        document.getElementById('agentCpu').innerText = Math.round(data.stats.cpu) + "%";
+        document.getElementById('agentRam').innerText = Math.round(data.stats.ram) + "%";
+        document.getElementById('agentDisk').innerText = Math.round(data.stats.disk) + "%";
+        document.getElementById('agentIp').innerText = data.stats.ip || "Unknown";
+        
+        if (document.getElementById('trafficRxTotal')) {
+            document.getElementById('trafficRxTotal').innerText = formatBytes(data.stats.net_recv);
+            document.getElementById('trafficTxTotal').innerText = formatBytes(data.stats.net_sent);
+            
+            const uptimeStr = formatUptime(data.stats.boot_time);
+            const uptimeEl = document.getElementById('agentUptime');
+            const uptimeMobileEl = document.getElementById('agentUptimeMobile');
+            
+            if(uptimeEl) uptimeEl.innerText = uptimeStr;
+            if(uptimeMobileEl) uptimeMobileEl.innerText = uptimeStr;
+        }
+    }
+    renderAgentChart(data.history);
+}
+
 function updateChartsColors() {
     const isDark = document.documentElement.classList.contains('dark');
     const gridColor = isDark ? 'rgba(255, 255, 255, 0.05)' : 'rgba(0, 0, 0, 0.05)';
@@ -313,15 +389,42 @@ async function openNodeDetails(token, dotColorClass) {
     if (chartRes) { chartRes.destroy(); chartRes = null; }
     if (chartNet) { chartNet.destroy(); chartNet = null; }
 
+    currentNodeToken = token;
+    currentNodeHistory = [];
+    nodeEtag = null;
     await fetchAndRender(token);
 
     if (pollInterval) clearInterval(pollInterval);
-    pollInterval = setInterval(() => fetchAndRender(token), 3000);
+    pollInterval = null;
+    // При живом потоке обновления приходят событиями 'nodes_delta'
+    if (!liveStream) {
+        pollInterval = setInterval(() => fetchAndRender(token), 3000);
+    } else {
+        stopNodeWatch();
+        nodeWatchInterval = setInterval(() => pingNodeWatch(token), NODE_WATCH_PING);
+    }
+}
+
+function pingNodeWatch(token) {
+    fetch('/api/node/watch', {
+        method: 'POST',
+        headers: {'Content-Type': 'application/json'},
+        body: JSON.stringify({token: token})
+    }).catch(() => {});
+}
+
+function stopNodeWatch() {
+    if (nodeWatchInterval) { clearInterval(nodeWatchInterval); nodeWatchInterval = null; }
 }
 
 async function fetchAndRender(token) {
     try {
-        const response = await fetch(`/api/node/details?token=${token}`);
+        const last = token === currentNodeToken ? currentNodeHistory[currentNodeHistory.length - 1] : null;
+        const headers = {};
+        if (last && nodeEtag) headers['If-None-Match'] = nodeEtag;
+        const response = await fetch(`/api/node/details?token=${token}` + (last ? `&since=${last.t}` : ''), { headers });
+        if (response.status === 304) return;
+        nodeEtag = response.headers.get('ETag');
         const data = await response.json();
         
         if (data.error) {
@@ -338,7 +441,14 @@ async function fetchAndRender(token) {
         const tokenEl = document.getElementById('modalToken');
         if(tokenEl) tokenEl.innerText = data.token || token;
 
-        renderCharts(data.history);
+        let history = data.history || [];
+        if (data.since !== undefined && token === currentNodeToken) {
+            history = currentNodeHistory.concat(history);
+            const lastPoint = history[history.length - 1];
+            if (lastPoint) history = history.filter(h => h.t >= lastPoint.t - NODE_HISTORY_WINDOW);
+        }
+        if (token === currentNodeToken) currentNodeHistory = history;
+        renderCharts(history);
     } catch (e) {
         console.error("Error render node details:", e);
     }
@@ -350,6 +460,30 @@ function closeModal() {
     modal.classList.remove('flex');
     document.body.style.overflow = 'auto';
     if (pollInterval) { clearInterval(pollInterval); pollInterval = null; }
+    stopNodeWatch();
+    currentNodeToken = null;
+    currentNodeHistory = [];
+}
+
+function applyNodesDelta(data) {
+    // Все изменившиеся за тик ноды приходят одним сообщением
+    (data.nodes || []).forEach(applyNodeUpdate);
+}
+
+function applyNodeUpdate(data) {
+    if (!currentNodeToken || data.token !== currentNodeToken) return;
+    const stats = data.stats || {};
+    document.getElementById('modalCpu').innerText = (stats.cpu !== undefined ? stats.cpu : 0) + '%';
+    document.getElementById('modalRam').innerText = (stats.ram !== undefined ? stats.ram : 0) + '%';
+    document.getElementById('modalIp').innerText = data.ip || 'Unknown';
+
+    const point = data.point;
+    const last = currentNodeHistory[currentNodeHistory.length - 1];
+    if (!point || !point.t || (last && point.t <= last.t)) return;
+    currentNodeHistory.push(point);
+    const cutoff = point.t - NODE_HISTORY_WINDOW;
+    while (currentNodeHistory.length && currentNodeHistory[0].t < cutoff) currentNodeHistory.shift();
+    renderCharts(currentNodeHistory);
 }
 
 function renderCharts(history) {
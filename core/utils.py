@@ -5,13 +5,13 @@ import re
 import asyncio
 import urllib.parse
 import time
-import aiohttp
 from datetime import datetime
 from aiogram import Bot
 from aiogram.exceptions import TelegramBadRequest
 
 from . import config
 from . import shared_state
+from . import geoip
 from .i18n import get_text, get_user_lang
 from .config import INSTALL_MODE, DEPLOY_MODE
 from .config import ALERTS_CONFIG_FILE, REBOOT_FLAG_FILE, RESTART_FLAG_FILE
@@ -68,49 +68,38 @@ def save_alerts_config():
         logging.error(f"Ошибка сохранения alerts_config.json: {e}")
 
 
+def _code_to_flag(code: str) -> str:
+    return "".join(chr(ord(char) - 65 + 0x1F1E6) for char in code.upper())
+
+
 async def get_country_flag(ip_or_code: str) -> str:
     if not ip_or_code or ip_or_code in ["localhost", "127.0.0.1", "::1"]:
         return "🏠"
 
     input_str = ip_or_code.strip().upper()
     if len(input_str) == 2 and input_str.isalpha():
-        return "".join(chr(ord(char) - 65 + 0x1F1E6) for char in input_str)
-
-    try:
-        async with aiohttp.ClientSession() as session:
-            async with session.get(f"http://ip-api.com/json/{ip_or_code}?fields=countryCode,status", timeout=2) as response:
-                if response.status == 200:
-                    data = await response.json()
-                    if data.get("status") == "success":
-                        country_code = data.get("countryCode")
-                        if country_code and len(country_code) == 2:
-                            return "".join(chr(ord(char.upper()) - 65 + 0x1F1E6)
-                                           for char in country_code)
-    except Exception as e:
-        logging.warning(f"Error getting flag for {ip_or_code}: {e}")
+        return _code_to_flag(input_str)
 
+    # Локальная база/кэш; ip-api.com — только если включён GEOIP_REMOTE_FALLBACK
+    result = await geoip.lookup_country(ip_or_code)
+    if result:
+        return _code_to_flag(result[0])
     return "❓"
 
 
 async def get_country_details(ip_or_code: str):
-    flag = await get_country_flag(ip_or_code)
-    country_name = None
-    identifier = ip_or_code.strip().upper()
+    identifier = ip_or_code.strip() if ip_or_code else ""
 
     if not identifier or identifier in ["localhost", "127.0.0.1", "::1"]:
         return "🏠", None
 
-    try:
-        async with aiohttp.ClientSession() as session:
-            async with session.get(f"http://ip-api.com/json/{identifier}?fields=country,status", timeout=2) as response:
-                if response.status == 200:
-                    data = await response.json()
-                    if data.get("status") == "success":
-                        country_name = data.get("country")
-    except Exception as e:
-        logging.warning(f"Error getting country details for {identifier}: {e}")
+    if len(identifier) == 2 and identifier.isalpha():
+        return _code_to_flag(identifier), None
 
-    return flag, country_name
+    result = await geoip.lookup_country(identifier)
+    if result:
+        return _code_to_flag(result[0]), result[1]
+    return "❓", None
 
 
 def escape_html(text):
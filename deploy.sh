@@ -315,6 +315,7 @@ services:
       - /proc/stat:/proc_host/stat:ro
       - /proc/meminfo:/proc_host/meminfo:ro
       - /proc/net/dev:/proc_host/net/dev:ro
+      - /proc/diskstats:/proc_host/diskstats:ro
     cap_drop: [ALL]
     cap_add: [NET_RAW]
   bot-root:
@@ -435,7 +436,7 @@ install_node_logic() {
     setup_repo_and_dirs "root"
     msg_info "Настройка venv..."
     if [ ! -d "${VENV_PATH}" ]; then run_with_spinner "Создание venv" ${PYTHON_BIN} -m venv "${VENV_PATH}"; fi
-    run_with_spinner "Установка зависимостей" "${VENV_PATH}/bin/pip" install psutil requests
+    run_with_spinner "Установка зависимостей" "${VENV_PATH}/bin/pip" install aiohttp
     echo ""; msg_info "Подключение:"
     msg_question "Agent URL (http://IP:8080): " AGENT_URL
     msg_question "Token: " NODE_TOKEN
@@ -444,6 +445,9 @@ MODE=node
 AGENT_BASE_URL="${AGENT_URL}"
 AGENT_TOKEN="${NODE_TOKEN}"
 NODE_UPDATE_INTERVAL=5
+NODE_LONGPOLL=0
+NODE_MAX_TASKS=2
+NODE_SAMPLE_INTERVAL=1
 EOF
     sudo chmod 600 "${ENV_FILE}"
     sudo tee "/etc/systemd/system/${NODE_SERVICE_NAME}.service" > /dev/null <<EOF
@@ -344,6 +344,7 @@ services:
       - /proc/stat:/proc_host/stat:ro
       - /proc/meminfo:/proc_host/meminfo:ro
       - /proc/net/dev:/proc_host/net/dev:ro
+      - /proc/diskstats:/proc_host/diskstats:ro
     cap_drop: [ALL]
     cap_add: [NET_RAW]
   bot-root:
@@ -462,7 +463,7 @@ install_node_logic() {
     
     msg_info "Setting up venv..."
     if [ ! -d "${VENV_PATH}" ]; then run_with_spinner "Creating venv" ${PYTHON_BIN} -m venv "${VENV_PATH}"; fi
-    run_with_spinner "Installing deps" "${VENV_PATH}/bin/pip" install psutil requests
+    run_with_spinner "Installing deps" "${VENV_PATH}/bin/pip" install aiohttp
     
     echo ""; msg_info "Connection Setup:"
     msg_question "Agent URL (http://IP:8080): " AGENT_URL
@@ -473,6 +474,9 @@ MODE=node
 AGENT_BASE_URL="${AGENT_URL}"
 AGENT_TOKEN="${NODE_TOKEN}"
 NODE_UPDATE_INTERVAL=5
+NODE_LONGPOLL=0
+NODE_MAX_TASKS=2
+NODE_SAMPLE_INTERVAL=1
 EOF
     sudo chmod 600 "${ENV_FILE}"
 
@@ -12,6 +12,7 @@ from core.auth import is_allowed, send_access_denied_message
 from core.messaging import delete_previous_message
 from core.shared_state import LAST_MESSAGE_IDS
 from core.utils import get_country_flag, get_server_timezone_label, get_host_path
+from core.logfollow import read_last_lines
 
 BUTTON_KEY = "btn_fail2ban"
 
@@ -42,10 +43,7 @@ async def fail2ban_handler(message: types.Message):
         return
 
     try:
-        proc = await asyncio.create_subprocess_shell(f"tail -n 50 {log_file}", stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE)
-        # FIX: _ -> stderr_dummy
-        out, stderr_dummy = await proc.communicate()
-        lines = out.decode('utf-8', 'ignore').split('\n')
+        lines = await asyncio.to_thread(read_last_lines, log_file, 50)
 
         entries = []
         tz = get_server_timezone_label()
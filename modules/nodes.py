@@ -11,15 +11,16 @@ from aiogram.filters import StateFilter
 from core.i18n import _, I18nFilter, get_user_lang
 from core import config
 from core.auth import is_allowed, send_access_denied_message
-from core.messaging import delete_previous_message, send_alert
+from core.messaging import delete_previous_message
 from core.shared_state import LAST_MESSAGE_IDS, NODE_TRAFFIC_MONITORS
-from core import nodes_db
+from core import nodes_db, digest
 from core.keyboards import get_nodes_list_keyboard, get_node_management_keyboard, get_nodes_delete_keyboard, get_back_keyboard
 # --- [ИСПРАВЛЕНИЕ 1] Добавляем импорт format_uptime ---
 from core.utils import format_uptime
 # ------------------------------------------------------
 
 BUTTON_KEY = "btn_nodes"
+TRAFFIC_TASK_TTL_FACTOR = 2
 
 
 class AddNodeStates(StatesGroup):
@@ -49,7 +50,9 @@ def start_background_tasks(bot: Bot) -> list[asyncio.Task]:
     task_traffic = asyncio.create_task(
         node_traffic_scheduler(bot),
         name="NodesTrafficScheduler")
-    return [task_monitor, task_traffic]
+    task_retention = asyncio.create_task(
+        metrics_retention_task(), name="NodesMetricsRetention")
+    return [task_monitor, task_traffic, task_retention]
 
 
 async def _prepare_nodes_data():
@@ -62,7 +65,7 @@ async def _prepare_nodes_data():
         is_restarting = node.get("is_restarting", False)
         if is_restarting:
             icon = "🔵"
-        elif now - last_seen < config.NODE_OFFLINE_TIMEOUT:
+        elif now - last_seen < nodes_db.node_offline_timeout(node):
             icon = "🟢"
         else:
             icon = "🔴"
@@ -117,7 +120,7 @@ async def cq_node_select(callback: types.CallbackQuery):
     if is_restarting:
         await callback.answer(_("node_restarting_alert", lang, name=node.get("name")), show_alert=True)
         return
-    if now - last_seen >= config.NODE_OFFLINE_TIMEOUT:
+    if now - last_seen >= nodes_db.node_offline_timeout(node):
         stats = node.get("stats", {})
         fmt_time = datetime.fromtimestamp(last_seen).strftime(
             '%Y-%m-%d %H:%M:%S') if last_seen > 0 else "Never"
@@ -130,6 +133,8 @@ async def cq_node_select(callback: types.CallbackQuery):
         await callback.message.edit_text(text, reply_markup=get_back_keyboard(lang, "nodes_list_refresh"), parse_mode="HTML")
         return
 
+    # Меню управления открыто — скорее всего, сейчас последуют команды
+    nodes_db.watch_node(token)
     stats = node.get("stats", {})
     
     # --- [ИСПРАВЛЕНИЕ 2] Форматируем uptime ---
@@ -213,11 +218,11 @@ async def cq_node_command(callback: types.CallbackQuery):
             "token": token,
             "message_id": sent_msg.message_id,
             "last_update": 0}
-        await nodes_db.update_node_task(token, {"command": cmd, "user_id": user_id})
+        await nodes_db.update_node_task(token, {"command": cmd, "user_id": user_id}, priority=1, ttl=TRAFFIC_TASK_TTL_FACTOR * config.TRAFFIC_INTERVAL)
         await callback.answer()
         return
 
-    await nodes_db.update_node_task(token, {"command": cmd, "user_id": user_id})
+    await nodes_db.update_node_task(token, {"command": cmd, "user_id": user_id}, priority=1)
 
     cmd_map = {
         "selftest": "btn_selftest",
@@ -274,16 +279,46 @@ async def node_traffic_scheduler(bot: Bot):
                     if user_id in NODE_TRAFFIC_MONITORS:
                         del NODE_TRAFFIC_MONITORS[user_id]
                     continue
-                await nodes_db.update_node_task(token, {"command": "traffic", "user_id": user_id})
+                nodes_db.watch_node(token, ttl=TRAFFIC_TASK_TTL_FACTOR * config.TRAFFIC_INTERVAL)
+                # Устаревший опрос трафика бесполезен: отбрасываем его, если нода его не забрала
+                await nodes_db.update_node_task(token, {"command": "traffic", "user_id": user_id}, ttl=TRAFFIC_TASK_TTL_FACTOR * config.TRAFFIC_INTERVAL)
         except Exception as e:
             logging.error(f"Error in node_traffic_scheduler: {e}")
             await asyncio.sleep(5)
 
 
+async def metrics_retention_task():
+    while True:
+        try:
+            # Сырые метрики чистит core.rollups.rollup_loop согласно METRICS_RETENTION_RAW
+            await nodes_db.prune_expired_tasks()
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logging.error(f"Error in metrics_retention_task: {e}")
+        await asyncio.sleep(3600)
+
+
+def render_nodes_digest(lang, events, seconds):
+    """Падения и восстановления нод за окно — одним сообщением."""
+    parts = []
+    for up, key in ((False, "alert_nodes_down_digest"), (True, "alert_nodes_up_digest")):
+        names = [e["name"] for e in events if e["up"] == up]
+        if not names:
+            continue
+        shown = ", ".join(names[:30])
+        if len(names) > 30:
+            shown += ", " + _("alert_digest_more", lang, count=len(names) - 30)
+        parts.append(_(key, lang, count=len(names), names=shown))
+    return "\n\n".join(parts)
+
+
 async def nodes_monitor(bot: Bot):
     logging.info("Nodes Monitor started.")
     await asyncio.sleep(10)
     while True:
+        # Изменения флагов за цикл пишутся одной транзакцией
+        extra_updates = []
         try:
             now = time.time()
             nodes = await nodes_db.get_all_nodes()
@@ -293,64 +328,36 @@ async def nodes_monitor(bot: Bot):
                 last_seen = node.get("last_seen", 0)
                 is_restarting = node.get("is_restarting", False)
 
-                alerts = node.get("alerts", {
-                    "cpu": {"active": False, "last_time": 0},
-                    "ram": {"active": False, "last_time": 0},
-                    "disk": {"active": False, "last_time": 0}
-                })
                 is_offline_alert_sent = node.get(
                     "is_offline_alert_sent", False)
 
+                # Таймаут зависит от интервала, который агент назначил ноде (см. nodes_db.negotiate_interval)
                 is_dead = (
                     now -
-                    last_seen >= config.NODE_OFFLINE_TIMEOUT) and (
+                    last_seen >= nodes_db.node_offline_timeout(node)) and (
                     last_seen > 0)
 
                 if is_dead and not is_offline_alert_sent and not is_restarting:
-                    await send_alert(bot, lambda lang: _("alert_node_down", lang, name=name, last_seen=datetime.fromtimestamp(last_seen).strftime('%H:%M:%S')), "downtime")
-                    await nodes_db.update_node_extra(token, "is_offline_alert_sent", True)
+                    last_seen_str = datetime.fromtimestamp(last_seen).strftime('%H:%M:%S')
+                    await digest.add_event(bot, "nodes", "downtime",
+                                           lambda lang, name=name, last_seen_str=last_seen_str: _("alert_node_down", lang, name=name, last_seen=last_seen_str),
+                                           {"name": name, "up": False}, render_nodes_digest)
+                    extra_updates.append((token, "is_offline_alert_sent", True))
 
                 elif not is_dead and is_offline_alert_sent:
-                    await send_alert(bot, lambda lang: _("alert_node_up", lang, name=name), "downtime")
-                    await nodes_db.update_node_extra(token, "is_offline_alert_sent", False)
+                    await digest.add_event(bot, "nodes", "downtime",
+                                           lambda lang, name=name: _("alert_node_up", lang, name=name),
+                                           {"name": name, "up": True}, render_nodes_digest)
+                    extra_updates.append((token, "is_offline_alert_sent", False))
 
                 if not is_dead and is_restarting:
-                    await nodes_db.update_node_extra(token, "is_restarting", False)
-
-                if not is_dead and last_seen > 0:
-                    stats = node.get("stats", {})
-
-                    async def check(
-                            metric,
-                            current,
-                            threshold,
-                            key_high,
-                            key_norm):
-                        state = alerts.get(
-                            metric, {"active": False, "last_time": 0})
-                        updated = False
-                        if current >= threshold:
-                            if not state["active"] or (
-                                    now - state["last_time"] > config.RESOURCE_ALERT_COOLDOWN):
-                                await send_alert(bot, lambda lang: _(key_high, lang, name=name, usage=current, threshold=threshold), "resources")
-                                state["active"] = True
-                                state["last_time"] = now
-                                updated = True
-                        elif current < threshold and state["active"]:
-                            await send_alert(bot, lambda lang: _(key_norm, lang, name=name, usage=current), "resources")
-                            state["active"] = False
-                            state["last_time"] = 0
-                            updated = True
-                        alerts[metric] = state
-                        return updated
-
-                    u1 = await check("cpu", stats.get("cpu", 0), config.CPU_THRESHOLD, "alert_node_cpu_high", "alert_node_cpu_normal")
-                    u2 = await check("ram", stats.get("ram", 0), config.RAM_THRESHOLD, "alert_node_ram_high", "alert_node_ram_normal")
-                    u3 = await check("disk", stats.get("disk", 0), config.DISK_THRESHOLD, "alert_node_disk_high", "alert_node_disk_normal")
-
-                    if u1 or u2 or u3:
-                        await nodes_db.update_node_extra(token, "alerts", alerts)
+                    extra_updates.append((token, "is_restarting", False))
+            # Пороги ресурсов нод проверяет core.alert_rules вместе с агентом
 
         except Exception as e:
             logging.error(f"Error in nodes_monitor: {e}", exc_info=True)
+        try:
+            await nodes_db.update_nodes_extra(extra_updates)
+        except Exception as e:
+            logging.error(f"Error saving node states: {e}")
         await asyncio.sleep(20)
\ No newline at end of file
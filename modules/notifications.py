@@ -1,10 +1,9 @@
 import asyncio
 import logging
-import psutil
-import time
 import re
 import os
-import signal
+from collections import Counter
+from contextlib import aclosing
 from datetime import datetime
 from aiogram import F, Dispatcher, types, Bot
 from aiogram.types import KeyboardButton
@@ -13,9 +12,11 @@ from core.i18n import _, I18nFilter, get_user_lang
 from core import config
 from core.auth import is_allowed, send_access_denied_message
 from core.messaging import delete_previous_message, send_alert
-from core.shared_state import LAST_MESSAGE_IDS, ALERTS_CONFIG, RESOURCE_ALERT_STATE, LAST_RESOURCE_ALERT_TIME
+from core.shared_state import LAST_MESSAGE_IDS, ALERTS_CONFIG
 from core.utils import save_alerts_config, get_country_flag, get_server_timezone_label, escape_html, get_host_path
+from core import digest, alert_rules
 from core.keyboards import get_alerts_menu_keyboard
+from core.logfollow import LogFollower
 
 BUTTON_KEY = "btn_notifications"
 
@@ -32,8 +33,8 @@ def register_handlers(dp: Dispatcher):
 def start_background_tasks(bot: Bot) -> list[asyncio.Task]:
     tasks = [
         asyncio.create_task(
-            resource_monitor(bot),
-            name="ResourceMonitor")]
+            alert_rules.rules_loop(bot),
+            name="AlertRules")]
 
     ssh_log = None
     if os.path.exists(get_host_path("/var/log/secure")):
@@ -44,7 +45,7 @@ def start_background_tasks(bot: Bot) -> list[asyncio.Task]:
     if ssh_log:
         tasks.append(
             asyncio.create_task(
-                reliable_tail_log_monitor(
+                log_monitor(
                     bot,
                     ssh_log,
                     "logins",
@@ -53,11 +54,12 @@ def start_background_tasks(bot: Bot) -> list[asyncio.Task]:
 
     tasks.append(
         asyncio.create_task(
-            reliable_tail_log_monitor(
+            log_monitor(
                 bot,
                 get_host_path("/var/log/fail2ban.log"),
                 "bans",
-                parse_f2b_log_line),
+                parse_f2b_log_line,
+                render_f2b_digest),
             name="BansMonitor"))
     return tasks
 
@@ -141,109 +143,41 @@ async def parse_f2b_log_line(line: str) -> dict | None:
     return None
 
 
-async def resource_monitor(bot: Bot):
-    global RESOURCE_ALERT_STATE, LAST_RESOURCE_ALERT_TIME
-    await asyncio.sleep(15)
+def render_f2b_digest(lang, events, seconds):
+    """Один алерт на пачку банов: топ стран по флагам и последние IP."""
+    countries = Counter(e["flag"] for e in events).most_common(5)
+    ips = [e["ip"] for e in events[-5:]]
+    if len(events) > 5:
+        ips.append(_("alert_digest_more", lang, count=len(events) - 5))
+    return _("alert_f2b_ban_digest", lang,
+             count=len(events),
+             seconds=seconds,
+             countries=", ".join(f"{flag} {count}" for flag, count in countries),
+             ips=", ".join(ips),
+             time=events[-1]["time"],
+             tz=events[-1]["tz"])
+
+
+async def log_monitor(bot, path, alert_type, parser, digest_func=None):
+    """
+    Алерты по новым строкам лога; смещение сохраняется, строки за время простоя не теряются.
+    С digest_func всплески событий склеиваются в дайджест (см. core.digest).
+    """
     while True:
+        follower = LogFollower(path, checkpoint_key=alert_type)
         try:
-            cpu = psutil.cpu_percent(interval=1)
-            ram = psutil.virtual_memory().percent
-            try:
-                disk = psutil.disk_usage(get_host_path('/')).percent
-            except Exception:
-                disk = 0
-
-            alerts = []
-            now = time.time()
-
-            def check(metric, val, thresh, key_high, key_rep, key_norm):
-                if val >= thresh:
-                    if not RESOURCE_ALERT_STATE[metric]:
-                        alerts.append(
-                            (key_high, {"usage": val, "threshold": thresh}))
-                        RESOURCE_ALERT_STATE[metric] = True
-                        LAST_RESOURCE_ALERT_TIME[metric] = now
-                    elif now - LAST_RESOURCE_ALERT_TIME[metric] > config.RESOURCE_ALERT_COOLDOWN:
-                        alerts.append(
-                            (key_rep, {"usage": val, "threshold": thresh}))
-                        LAST_RESOURCE_ALERT_TIME[metric] = now
-                elif val < thresh and RESOURCE_ALERT_STATE[metric]:
-                    alerts.append((key_norm, {"usage": val}))
-                    RESOURCE_ALERT_STATE[metric] = False
-                    LAST_RESOURCE_ALERT_TIME[metric] = 0
-
-            check(
-                "cpu",
-                cpu,
-                config.CPU_THRESHOLD,
-                "alert_cpu_high",
-                "alert_cpu_high_repeat",
-                "alert_cpu_normal")
-            check(
-                "ram",
-                ram,
-                config.RAM_THRESHOLD,
-                "alert_ram_high",
-                "alert_ram_high_repeat",
-                "alert_ram_normal")
-            check(
-                "disk",
-                disk,
-                config.DISK_THRESHOLD,
-                "alert_disk_high",
-                "alert_disk_high_repeat",
-                "alert_disk_normal")
-
-            if alerts:
-                await send_alert(bot, lambda lang: "\n\n".join([_(k, lang, **p) for k, p in alerts]), "resources")
+            async with aclosing(follower.lines()) as lines:
+                async for line in lines:
+                    data = await parser(line)
+                    if not data:
+                        continue
+                    message_func = lambda lang, data=data: _(data["key"], lang, **data["params"])
+                    if digest_func:
+                        await digest.add_event(bot, alert_type, alert_type, message_func, data["params"], digest_func)
+                    else:
+                        await send_alert(bot, message_func, alert_type)
         except asyncio.CancelledError:
             raise
         except Exception as e:
-            logging.error(f"ResMonitor error: {e}")
-        await asyncio.sleep(config.RESOURCE_CHECK_INTERVAL)
-
-
-async def reliable_tail_log_monitor(bot, path, alert_type, parser):
-    while True:
-        if not os.path.exists(path):
-            await asyncio.sleep(60)
-            continue
-
-        proc = None
-        try:
-            # ИСПОЛЬЗУЕМ start_new_session=True ДЛЯ СОЗДАНИЯ ГРУППЫ ПРОЦЕССОВ
-            proc = await asyncio.create_subprocess_shell(
-                f"tail -n 0 -f {path}",
-                stdout=asyncio.subprocess.PIPE,
-                stderr=asyncio.subprocess.PIPE,
-                start_new_session=True
-            )
-
-            async for line in proc.stdout:
-                l = line.decode('utf-8', 'ignore').strip()
-                if l:
-                    data = await parser(l)
-                    if data:
-                        await send_alert(bot, lambda lang: _(data["key"], lang, **data["params"]), alert_type)
-
-        except asyncio.CancelledError:
-            # ПРИ ОТМЕНЕ УБИВАЕМ ВСЮ ГРУППУ ПРОЦЕССОВ
-            if proc:
-                try:
-                    os.killpg(os.getpgid(proc.pid), signal.SIGTERM)
-                    try:
-                        await asyncio.wait_for(proc.wait(), timeout=2.0)
-                    except asyncio.TimeoutError:
-                        os.killpg(os.getpgid(proc.pid), signal.SIGKILL)
-                except Exception as e:
-                    logging.error(f"Error killing tail process group: {e}")
-            raise
-
-        except Exception as e:
-            logging.error(f"Tail monitor error ({path}): {e}")
-            if proc:
-                try:
-                    os.killpg(os.getpgid(proc.pid), signal.SIGTERM)
-                except Exception:
-                    pass
+            logging.error(f"Log monitor error ({path}): {e}")
             await asyncio.sleep(10)
\ No newline at end of file
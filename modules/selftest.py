@@ -1,5 +1,4 @@
 import asyncio
-import psutil
 import time
 import re
 import os
@@ -15,6 +14,7 @@ from core.messaging import delete_previous_message
 from core.shared_state import LAST_MESSAGE_IDS
 from core.utils import format_uptime, format_traffic, get_country_flag, get_server_timezone_label, escape_html, get_host_path
 from core.config import INSTALL_MODE
+from core import sampler
 
 BUTTON_KEY = "btn_selftest"
 
@@ -45,17 +45,10 @@ async def selftest_handler(message: types.Message):
     LAST_MESSAGE_IDS.setdefault(user_id, {})[command] = sent_msg.message_id
 
     try:
-        psutil.cpu_percent(interval=None)
-        await asyncio.sleep(0.5)
-        cpu = psutil.cpu_percent(interval=None)
-        mem = psutil.virtual_memory().percent
-        try:
-            disk = psutil.disk_usage(get_host_path('/')).percent
-        except Exception:
-            disk = 0
-        with open(get_host_path("/proc/uptime")) as f:
-            uptime_sec = float(f.readline().split()[0])
-        net = psutil.net_io_counters()
+        snap = await sampler.get_or_sample()
+        cpu, mem, disk = snap.cpu, snap.ram, snap.disk
+        uptime_sec = snap.uptime + time.time() - snap.t
+        rx_total, tx_total = snap.net_rx, snap.net_tx
 
         uptime_str = format_uptime(uptime_sec, lang)
 
@@ -176,10 +169,10 @@ async def selftest_handler(message: types.Message):
             ping=ping_time,
             ip=ext_ip,
             rx=format_traffic(
-                net.bytes_recv,
+                rx_total,
                 lang),
             tx=format_traffic(
-                net.bytes_sent,
+                tx_total,
                 lang))
         await message.bot.edit_message_text(_("selftest_results_header", lang) + body + ssh_info, chat_id=chat_id, message_id=sent_msg.message_id, parse_mode="HTML")
 
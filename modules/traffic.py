@@ -1,6 +1,5 @@
 import asyncio
 import logging
-import psutil
 import time
 from aiogram import F, Dispatcher, types, Bot
 from aiogram.types import KeyboardButton, InlineKeyboardMarkup, InlineKeyboardButton
@@ -13,6 +12,7 @@ from core.auth import is_allowed, send_access_denied_message
 from core.messaging import delete_previous_message
 from core.utils import format_traffic
 from core.keyboards import get_main_reply_keyboard
+from core import sampler
 
 BUTTON_KEY = "btn_traffic"
 MESSAGE_EDIT_THROTTLE = {}
@@ -55,9 +55,8 @@ async def traffic_handler(message: types.Message):
     await delete_previous_message(user_id, list(shared_state.LAST_MESSAGE_IDS.get(user_id, {}).keys()), chat_id, message.bot)
 
     try:
-        counters = await asyncio.to_thread(psutil.net_io_counters)
-        shared_state.TRAFFIC_PREV[user_id] = (
-            counters.bytes_recv, counters.bytes_sent)
+        snap = await sampler.get_or_sample()
+        shared_state.TRAFFIC_PREV[user_id] = (snap.net_rx, snap.net_tx)
 
         stop_button = InlineKeyboardButton(
             text=get_text(
@@ -131,21 +130,18 @@ async def traffic_monitor(bot: Bot):
 
             lang = get_user_lang(user_id)
 
+            snap = sampler.get_snapshot()
+            if snap is None:
+                continue
+
             try:
-                def get_traffic_update():
-                    counters_now = psutil.net_io_counters()
-                    rx_now = counters_now.bytes_recv
-                    tx_now = counters_now.bytes_sent
-                    prev_rx, prev_tx = shared_state.TRAFFIC_PREV.get(
-                        user_id, (rx_now, tx_now))
-                    rx_delta = rx_now - prev_rx if rx_now >= prev_rx else rx_now
-                    tx_delta = tx_now - prev_tx if tx_now >= prev_tx else tx_now
-                    interval = max(effective_interval, 1)
-                    rx_speed = rx_delta * 8 / (1024 * 1024) / interval
-                    tx_speed = tx_delta * 8 / (1024 * 1024) / interval
-                    return rx_now, tx_now, rx_speed, tx_speed
-
-                rx, tx, rx_speed, tx_speed = await asyncio.to_thread(get_traffic_update)
+                rx, tx = snap.net_rx, snap.net_tx
+                prev_rx, prev_tx = shared_state.TRAFFIC_PREV.get(user_id, (rx, tx))
+                rx_delta = rx - prev_rx if rx >= prev_rx else rx
+                tx_delta = tx - prev_tx if tx >= prev_tx else tx
+                interval = max(effective_interval, 1)
+                rx_speed = rx_delta * 8 / (1024 * 1024) / interval
+                tx_speed = tx_delta * 8 / (1024 * 1024) / interval
                 shared_state.TRAFFIC_PREV[user_id] = (rx, tx)
 
                 stop_button = InlineKeyboardButton(
@@ -1,14 +1,18 @@
 import time
 import json
-import psutil
-import requests
+import aiohttp
 import logging
 import os
 import sys
+import signal
 import subprocess
-import shlex
 import random
 import re 
+import asyncio
+import secrets
+import math
+import gzip
+from array import array
 
 # Настройка логирования
 logging.basicConfig(
@@ -24,6 +28,10 @@ logging.basicConfig(
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 ENV_FILE = os.path.join(BASE_DIR, '.env')
 
+# Общий с агентом сборщик метрик лежит в корне установки
+sys.path.insert(0, BASE_DIR)
+import procstat
+
 def load_config():
     config = {}
     if os.path.exists(ENV_FILE):
@@ -39,7 +47,33 @@ def load_config():
 CONF = load_config()
 AGENT_BASE_URL = CONF.get("AGENT_BASE_URL")
 AGENT_TOKEN = CONF.get("AGENT_TOKEN")
+# Собственный (минимальный) интервал ноды; пока ноду никто не смотрит, агент назначает более редкий
 UPDATE_INTERVAL = int(CONF.get("NODE_UPDATE_INTERVAL", 5))
+MAX_INTERVAL = 300
+# Long-poll: heartbeat паркуется на агенте на назначенный интервал и возвращается сразу, как только есть команда
+LONGPOLL = CONF.get("NODE_LONGPOLL", "0").lower() in ("1", "true", "yes", "on")
+# Транспорт: http (heartbeat-запросы) или ws (постоянный канал с откатом на HTTP)
+TRANSPORT = CONF.get("NODE_TRANSPORT", "http").lower()
+WS_MAX_BACKOFF = 60
+# Если агент не знает /api/node/ws — повторная попытка не раньше чем через столько секунд
+WS_UNSUPPORTED_RETRY = 600
+RESULT_CHUNK_SIZE = 8192
+# Сколько команд выполняется одновременно; остальные ждут своей очереди
+MAX_CONCURRENT_TASKS = max(int(CONF.get("NODE_MAX_TASKS", 2)), 1)
+# Таймауты команд в секундах; по истечении команда отменяется вместе с дочерними процессами
+COMMAND_TIMEOUT = 30
+COMMAND_TIMEOUTS = {"speedtest": 60}
+# Частота семплирования CPU/RAM между heartbeat'ами (0 — только мгновенный замер в heartbeat)
+SAMPLE_INTERVAL = float(CONF.get("NODE_SAMPLE_INTERVAL", 1))
+# Ёмкость буфера семплов: при недоступном агенте старые семплы перезаписываются
+SAMPLE_BUFFER_SIZE = 600
+# Спул метрик на время недоступности агента: два файла по половине лимита, старший отбрасывается
+SPOOL_FILE = CONF.get("NODE_SPOOL_FILE", os.path.join(BASE_DIR, "config", "node_spool.jsonl"))
+SPOOL_MAX_BYTES = int(CONF.get("NODE_SPOOL_MAX_BYTES", 1024 * 1024))
+SPOOL_FIELDS = ("cpu", "ram", "disk", "net_rx", "net_tx", "agg")
+SPOOL_BATCH = 500
+# Пауза перед новой попыткой выгрузки, если агент её отклонил (например, старая версия без /api/node/backfill)
+SPOOL_RETRY_DELAY = 60
 
 if not AGENT_BASE_URL or not AGENT_TOKEN:
     logging.error("CRITICAL: AGENT_BASE_URL or AGENT_TOKEN not found in .env")
@@ -49,6 +83,59 @@ if not AGENT_BASE_URL or not AGENT_TOKEN:
 PENDING_RESULTS = []
 LAST_TRAFFIC_STATS = {}
 
+# Создаются в main() внутри event loop
+SESSION = None
+TASK_SEMAPHORE = None
+RESULTS_READY = None
+INTERVAL_CHANGED = None
+# Интервал до следующего heartbeat, назначенный агентом
+NEXT_INTERVAL = UPDATE_INTERVAL
+RUNNING_TASKS = set()
+SPOOL_TASK = None
+SPOOL_PENDING = os.path.exists(SPOOL_FILE) or os.path.exists(SPOOL_FILE + ".1")
+SPOOL_NEXT_TRY = 0
+
+
+class SampleRing:
+    """Кольцевой буфер семплов CPU/RAM на array фиксированного размера."""
+
+    def __init__(self, size):
+        self.size = size
+        self.cpu = array('f', bytes(4 * size))
+        self.ram = array('f', bytes(4 * size))
+        self.pos = 0
+        self.count = 0
+        self.last_cpu = None
+
+    def add(self, cpu, ram):
+        self.cpu[self.pos] = cpu
+        self.ram[self.pos] = ram
+        self.pos = (self.pos + 1) % self.size
+        self.count = min(self.count + 1, self.size)
+        self.last_cpu = cpu
+
+    def _values(self, buf):
+        start = self.pos - self.count
+        if start >= 0:
+            return buf[start:self.pos]
+        return buf[start:] + buf[:self.pos]
+
+    def drain(self):
+        """Агрегаты [min, avg, max, p95] по семплам с прошлого вызова; буфер опустошается."""
+        if not self.count:
+            return None
+        agg = {"n": self.count}
+        for key, buf in (("cpu", self.cpu), ("ram", self.ram)):
+            values = sorted(self._values(buf))
+            p95 = values[math.ceil(0.95 * len(values)) - 1]
+            agg[key] = [round(values[0], 1), round(sum(values) / len(values), 1), round(values[-1], 1), round(p95, 1)]
+        self.count = 0
+        return agg
+
+
+SAMPLES = SampleRing(SAMPLE_BUFFER_SIZE) if SAMPLE_INTERVAL > 0 else None
+CPU_METER = procstat.CpuMeter()
+
 # --- УТИЛИТЫ ДЛЯ ФОРМАТИРОВАНИЯ ---
 def format_uptime_simple(seconds):
     seconds = int(seconds)
@@ -91,34 +178,95 @@ def parse_iperf_speed(output: str, direction: str) -> float:
 
 def get_system_stats():
     try:
-        net = psutil.net_io_counters()
+        rx, tx = procstat.net_totals()
+        # CPU_METER считает от предыдущего вызова, поэтому при семплировании его вызывает только sampler
+        if SAMPLES is not None and SAMPLES.last_cpu is not None:
+            cpu = SAMPLES.last_cpu
+        else:
+            cpu = CPU_METER.percent()
         return {
-            "cpu": psutil.cpu_percent(interval=None),
-            "ram": psutil.virtual_memory().percent,
-            "disk": psutil.disk_usage('/').percent,
-            "net_rx": net.bytes_recv,
-            "net_tx": net.bytes_sent,
-            "uptime": int(time.time() - psutil.boot_time())
+            "cpu": cpu,
+            "ram": procstat.memory()["percent"],
+            "disk": procstat.disk_usage('/'),
+            "net_rx": rx,
+            "net_tx": tx,
+            "uptime": int(procstat.uptime())
         }
     except Exception as e:
         logging.error(f"Error gathering stats: {e}")
         return {}
 
-def get_public_iperf_server():
+def get_heartbeat_stats():
+    """Мгновенные метрики + агрегаты семплов за прошедший интервал."""
+    stats = get_system_stats()
+    if SAMPLES is not None:
+        agg = SAMPLES.drain()
+        if agg:
+            stats["agg"] = agg
+    return stats
+
+async def sampler_loop():
+    loop = asyncio.get_running_loop()
+    next_tick = loop.time()
+    while True:
+        # Шаг без накопления дрейфа; первый замер — через интервал после инициализации CPU_METER
+        next_tick += SAMPLE_INTERVAL
+        await asyncio.sleep(max(next_tick - loop.time(), 0))
+        try:
+            SAMPLES.add(CPU_METER.percent(), procstat.memory()["percent"])
+        except Exception as e:
+            logging.error(f"Sampling error: {e}")
+
+async def run_cmd(args, timeout=None, shell=False, merge_stderr=False):
+    """
+    Асинхронный аналог subprocess.check_output.
+    По таймауту и при отмене задачи процесс (вместе с группой) убивается.
+    """
+    stderr = subprocess.STDOUT if merge_stderr else None
+    if shell:
+        proc = await asyncio.create_subprocess_shell(
+            args, stdout=subprocess.PIPE, stderr=stderr, start_new_session=True)
+    else:
+        proc = await asyncio.create_subprocess_exec(
+            *args, stdout=subprocess.PIPE, stderr=stderr, start_new_session=True)
+    try:
+        out, _ = await asyncio.wait_for(proc.communicate(), timeout)
+    except asyncio.TimeoutError:
+        raise subprocess.TimeoutExpired(args, timeout)
+    finally:
+        if proc.returncode is None:
+            try:
+                os.killpg(proc.pid, signal.SIGKILL)
+            except ProcessLookupError:
+                pass
+            await proc.wait()
+    if proc.returncode:
+        raise subprocess.CalledProcessError(proc.returncode, args, out)
+    return out.decode()
+
+async def get_public_iperf_server():
     """Получает список публичных iperf3 серверов и выбирает случайный."""
     try:
         url = "https://export.iperf3serverlist.net/listed_iperf3_servers.json"
-        response = requests.get(url, timeout=5)
-        if response.status_code == 200:
-            servers = response.json()
-            valid_servers = [s for s in servers if s.get("IP/HOST") and s.get("PORT") and s.get("COUNTRY") != "RU"]
-            if valid_servers:
-                return random.choice(valid_servers)
+        async with SESSION.get(url, timeout=aiohttp.ClientTimeout(total=5)) as response:
+            if response.status == 200:
+                servers = await response.json(content_type=None)
+                valid_servers = [s for s in servers if s.get("IP/HOST") and s.get("PORT") and s.get("COUNTRY") != "RU"]
+                if valid_servers:
+                    return random.choice(valid_servers)
     except Exception as e:
         logging.error(f"Error fetching iperf servers: {e}")
     return None
 
-def execute_command(task):
+def add_result(cmd, user_id, result_text):
+    PENDING_RESULTS.append({
+        "command": cmd,
+        "user_id": user_id,
+        "result": result_text
+    })
+    RESULTS_READY.set()
+
+async def execute_command(task):
     global LAST_TRAFFIC_STATS
     cmd = task.get("command")
     user_id = task.get("user_id")
@@ -127,15 +275,15 @@ def execute_command(task):
     result_text = ""
     try:
         if cmd == "uptime":
-            uptime_sec = int(time.time() - psutil.boot_time())
+            uptime_sec = int(procstat.uptime())
             result_text = f"⏱ Uptime: {format_uptime_simple(uptime_sec)}"
 
         elif cmd == "traffic":
-            net = psutil.net_io_counters()
+            rx, tx = procstat.net_totals()
             now = time.time()
             
-            rx_total = format_bytes_simple(net.bytes_recv)
-            tx_total = format_bytes_simple(net.bytes_sent)
+            rx_total = format_bytes_simple(rx)
+            tx_total = format_bytes_simple(tx)
             
             speed_info = ""
             
@@ -146,13 +294,13 @@ def execute_command(task):
                 
                 dt = now - prev_time
                 if dt > 0:
-                    rx_speed = (net.bytes_recv - prev_rx) * 8 / (1024 * 1024) / dt
-                    tx_speed = (net.bytes_sent - prev_tx) * 8 / (1024 * 1024) / dt
+                    rx_speed = (rx - prev_rx) * 8 / (1024 * 1024) / dt
+                    tx_speed = (tx - prev_tx) * 8 / (1024 * 1024) / dt
                     speed_info = f"\n\n⚡️ <b>Скорость:</b>\n⬇️ {rx_speed:.2f} Mbit/s\n⬆️ {tx_speed:.2f} Mbit/s"
 
             LAST_TRAFFIC_STATS = {
-                'rx': net.bytes_recv,
-                'tx': net.bytes_sent,
+                'rx': rx,
+                'tx': tx,
                 'time': now
             }
             
@@ -160,8 +308,7 @@ def execute_command(task):
 
         elif cmd == "top":
             try:
-                res = subprocess.check_output(
-                    "ps aux --sort=-%cpu | head -n 11", shell=True).decode()
+                res = await run_cmd("ps aux --sort=-%cpu | head -n 11", shell=True)
                 
                 # --- ИСПРАВЛЕНИЕ: Экранирование HTML ---
                 # Заменяем символы <, >, & на безопасные сущности, 
@@ -176,24 +323,19 @@ def execute_command(task):
         elif cmd == "selftest":
             stats = get_system_stats()
             
-            # --- Сбор дополнительной информации ---
-            try:
-                ip_res = subprocess.check_output("curl -4 -s --max-time 2 ifconfig.me", shell=True).decode().strip()
-                ext_ip = ip_res or "N/A"
-            except:
-                ext_ip = "N/A"
-                
-            try:
-                ping_res = subprocess.check_output("ping -c 1 -W 1 8.8.8.8", shell=True).decode()
-                ping_match = re.search(r"time=([\d\.]+) ms", ping_res)
-                ping_status = f"🔗 {ping_match.group(1)} ms" if ping_match else "🔗 ❌ Fail"
-            except:
-                ping_status = "🔗 ❌ Fail"
+            # --- Сбор дополнительной информации (параллельно) ---
+            ip_res, ping_res, kernel = await asyncio.gather(
+                run_cmd("curl -4 -s --max-time 2 ifconfig.me", shell=True),
+                run_cmd("ping -c 1 -W 1 8.8.8.8", shell=True),
+                run_cmd("uname -r", shell=True),
+                return_exceptions=True
+            )
+            ext_ip = "N/A" if isinstance(ip_res, Exception) else (ip_res.strip() or "N/A")
 
-            try:
-                kernel = subprocess.check_output("uname -r", shell=True).decode().strip()
-            except:
-                kernel = "N/A"
+            ping_match = None if isinstance(ping_res, Exception) else re.search(r"time=([\d\.]+) ms", ping_res)
+            ping_status = f"🔗 {ping_match.group(1)} ms" if ping_match else "🔗 ❌ Fail"
+
+            kernel = "N/A" if isinstance(kernel, Exception) else kernel.strip()
             # --------------------------------------
             
             uptime_str = format_uptime_simple(stats.get('uptime', 0))
@@ -217,7 +359,7 @@ def execute_command(task):
             )
 
         elif cmd == "speedtest":
-            server = get_public_iperf_server()
+            server = await get_public_iperf_server()
             if server:
                 host = server.get("IP/HOST")
                 port = server.get("PORT")
@@ -230,8 +372,7 @@ def execute_command(task):
                 # --- RUNNING DOWNLOAD TEST (-R, client receives) ---
                 cmd_dl = ["iperf3", "-c", host, "-p", str(port), "-t", "5", "-4", "-R"]
                 try:
-                    res_dl = subprocess.check_output(
-                        cmd_dl, stderr=subprocess.STDOUT, timeout=20).decode()
+                    res_dl = await run_cmd(cmd_dl, timeout=20, merge_stderr=True)
                     dl_speed = parse_iperf_speed(res_dl, 'receiver')
                 except subprocess.TimeoutExpired:
                     dl_speed = 0.0
@@ -242,8 +383,7 @@ def execute_command(task):
                 # --- RUNNING UPLOAD TEST (default, client sends) ---
                 cmd_ul = ["iperf3", "-c", host, "-p", str(port), "-t", "5", "-4"]
                 try:
-                    res_ul = subprocess.check_output(
-                        cmd_ul, stderr=subprocess.STDOUT, timeout=20).decode()
+                    res_ul = await run_cmd(cmd_ul, timeout=20, merge_stderr=True)
                     ul_speed = parse_iperf_speed(res_ul, 'sender')
                 except subprocess.TimeoutExpired:
                     ul_speed = 0.0
@@ -261,17 +401,17 @@ def execute_command(task):
                                f"iPerf Done.")
             else:
                 try:
-                    res = subprocess.check_output("ping -c 3 8.8.8.8", shell=True).decode()
+                    res = await run_cmd("ping -c 3 8.8.8.8", shell=True)
                     result_text = f"⚠️ iperf3 servers unavailable. Ping check:\n<pre>{res}</pre>"
                 except Exception as e:
                     result_text = f"Network check failed: {e}"
 
         elif cmd == "reboot":
             result_text = "🔄 Reboot command received. Rebooting..."
-            PENDING_RESULTS.append(
-                {"command": cmd, "user_id": user_id, "result": result_text})
-            send_heartbeat()
-            os.system("reboot")
+            add_result(cmd, user_id, result_text)
+            await send_heartbeat()
+            proc = await asyncio.create_subprocess_exec("reboot")
+            await proc.wait()
             return
 
         else:
@@ -284,42 +424,328 @@ def execute_command(task):
         result_text = f"❌ Error: {str(e)}"
 
     if result_text:
-        PENDING_RESULTS.append({
-            "command": cmd,
-            "user_id": user_id,
-            "result": result_text
-        })
+        add_result(cmd, user_id, result_text)
+
+async def run_task(task):
+    cmd = task.get("command")
+    timeout = COMMAND_TIMEOUTS.get(cmd, COMMAND_TIMEOUT)
+    async with TASK_SEMAPHORE:
+        try:
+            await asyncio.wait_for(execute_command(task), timeout)
+        except asyncio.TimeoutError:
+            logging.error(f"Command {cmd} timed out after {timeout}s, cancelled.")
+            add_result(cmd, task.get("user_id"), f"❌ Command timed out after {timeout}s.")
+        except Exception as e:
+            logging.error(f"Task {cmd} failed: {e}")
+
+def schedule_task(task):
+    """Запускает команду в фоне: heartbeat не ждёт её завершения."""
+    job = asyncio.create_task(run_task(task))
+    RUNNING_TASKS.add(job)
+    job.add_done_callback(RUNNING_TASKS.discard)
 
-def send_heartbeat():
+async def send_heartbeat(wait=0):
+    """
+    Отправляет heartbeat. Возвращает True, если агент держал запрос (long-poll),
+    т.е. пауза до следующего heartbeat уже прошла на стороне агента.
+    """
     global PENDING_RESULTS
     url = f"{AGENT_BASE_URL}/api/heartbeat"
+    # Забираем накопленное сразу: результаты, готовые во время запроса, уйдут следующим
+    results, PENDING_RESULTS = PENDING_RESULTS, []
+    RESULTS_READY.clear()
     payload = {
         "token": AGENT_TOKEN,
-        "stats": get_system_stats(),
-        "results": PENDING_RESULTS
+        "stats": get_heartbeat_stats(),
+        "results": results,
+        "interval": UPDATE_INTERVAL
     }
+    if wait:
+        payload["wait"] = wait
+    sent_at = time.time()
 
     try:
-        response = requests.post(url, json=payload, timeout=5)
-        if response.status_code == 200:
-            data = response.json()
-            PENDING_RESULTS = []
-
-            tasks = data.get("tasks", [])
-            for task in tasks:
-                execute_command(task)
-        else:
-            logging.warning(f"Server returned status: {response.status_code}")
+        async with SESSION.post(url, json=payload, timeout=aiohttp.ClientTimeout(total=5 + wait)) as response:
+            if response.status == 200:
+                data = await response.json()
+                tasks = data.get("tasks", [])
+                for task in tasks:
+                    schedule_task(task)
+                set_next_interval(data.get("interval"))
+                maybe_replay_spool()
+                # Старый агент не знает про "wait" и отвечает сразу — тогда спим как обычно
+                return bool(tasks) or data.get("wait", 0) >= 1
+            else:
+                logging.warning(f"Server returned status: {response.status}")
+    except Exception as e:
+        logging.error(f"Connection error: {e!r}")
+    PENDING_RESULTS = results + PENDING_RESULTS
+    spool_stats(payload["stats"], sent_at)
+    # Без связи возвращаемся к своему интервалу, чтобы быстрее заметить возвращение агента
+    set_next_interval(None)
+    return False
+
+def set_next_interval(value):
+    """Применяет интервал из ответа агента; старый агент его не присылает — остаётся свой."""
+    global NEXT_INTERVAL
+    try:
+        interval = min(max(int(value), UPDATE_INTERVAL), MAX_INTERVAL)
+    except (TypeError, ValueError):
+        interval = UPDATE_INTERVAL
+    if interval != NEXT_INTERVAL:
+        logging.info(f"Heartbeat interval: {NEXT_INTERVAL}s -> {interval}s")
+        NEXT_INTERVAL = interval
+        INTERVAL_CHANGED.set()
+
+# --- СПУЛ МЕТРИК ---
+def spool_stats(stats, t):
+    """Сохраняет точку метрик, которую не удалось отправить, в спул (JSON-строка на точку)."""
+    global SPOOL_PENDING
+    if not stats:
+        return
+    line = json.dumps([int(t), {k: stats[k] for k in SPOOL_FIELDS if k in stats}], separators=(",", ":")) + "\n"
+    replaying = SPOOL_TASK is not None and not SPOOL_TASK.done()
+    try:
+        os.makedirs(os.path.dirname(SPOOL_FILE), exist_ok=True)
+        # Во время выгрузки файлы не ротируются, чтобы не затереть выгружаемый
+        if not replaying and os.path.exists(SPOOL_FILE) and os.path.getsize(SPOOL_FILE) + len(line) > SPOOL_MAX_BYTES // 2:
+            os.replace(SPOOL_FILE, SPOOL_FILE + ".1")
+        with open(SPOOL_FILE, "a") as f:
+            f.write(line)
+        SPOOL_PENDING = True
+    except OSError as e:
+        logging.error(f"Spool write failed: {e}")
+
+def read_spool(path):
+    points = []
+    with open(path, "r") as f:
+        for line in f:
+            try:
+                points.append(json.loads(line))
+            except ValueError:
+                # Недописанная строка (нода упала посреди записи)
+                continue
+    return points
+
+async def send_backfill(points):
+    url = f"{AGENT_BASE_URL}/api/node/backfill"
+    body = gzip.compress(json.dumps({"token": AGENT_TOKEN, "points": points}, separators=(",", ":")).encode())
+    try:
+        async with SESSION.post(url, data=body, timeout=aiohttp.ClientTimeout(total=15),
+                                headers={"Content-Type": "application/json", "Content-Encoding": "gzip"}) as response:
+            if response.status == 200:
+                return True
+            logging.warning(f"Spool replay rejected: {response.status}")
     except Exception as e:
-        logging.error(f"Connection error: {e}")
+        logging.error(f"Spool replay error: {e!r}")
+    return False
+
+def maybe_replay_spool():
+    global SPOOL_TASK
+    if not SPOOL_PENDING or time.time() < SPOOL_NEXT_TRY:
+        return
+    if SPOOL_TASK is not None and not SPOOL_TASK.done():
+        return
+    SPOOL_TASK = asyncio.create_task(replay_spool())
+
+async def replay_spool():
+    """
+    Выгружает спул сжатыми пачками. Файл удаляется только после подтверждения всех пачек;
+    при сбое он выгрузится заново целиком — агент отбрасывает уже записанные точки.
+    """
+    global SPOOL_PENDING, SPOOL_NEXT_TRY
+    older = SPOOL_FILE + ".1"
+    sent = 0
+    try:
+        while True:
+            if not os.path.exists(older):
+                if not os.path.exists(SPOOL_FILE):
+                    break
+                os.replace(SPOOL_FILE, older)
+            points = read_spool(older)
+            for pos in range(0, len(points), SPOOL_BATCH):
+                if not await send_backfill(points[pos:pos + SPOOL_BATCH]):
+                    SPOOL_NEXT_TRY = time.time() + SPOOL_RETRY_DELAY
+                    return
+            sent += len(points)
+            os.remove(older)
+        SPOOL_PENDING = False
+    except OSError as e:
+        logging.error(f"Spool replay failed: {e}")
+        SPOOL_NEXT_TRY = time.time() + SPOOL_RETRY_DELAY
+    finally:
+        if sent:
+            logging.info(f"Spool replayed: {sent} points.")
+
+async def wait_event(event, timeout):
+    """
+    Ждёт событие не дольше timeout. В отличие от asyncio.wait_for (до Python 3.12)
+    не "проглатывает" отмену, если событие выставлено в тот же момент.
+    """
+    waiter = asyncio.ensure_future(event.wait())
+    try:
+        await asyncio.wait({waiter}, timeout=timeout)
+    finally:
+        waiter.cancel()
+
+async def wait_results(timeout):
+    # Готовый результат команды отправляется сразу, не дожидаясь конца интервала
+    await wait_event(RESULTS_READY, timeout)
+
+async def send_results_while_parked():
+    """
+    Пока long-poll запрос припаркован у агента, готовые результаты команд
+    уходят отдельным heartbeat без ожидания, а не по возвращении парковки.
+    """
+    while True:
+        await RESULTS_READY.wait()
+        # shield: отмена между забором результатов и ответом агента их бы потеряла
+        await asyncio.shield(send_heartbeat())
+
+async def http_heartbeat_cycle():
+    if LONGPOLL:
+        sender = asyncio.create_task(send_results_while_parked())
+        try:
+            held = await send_heartbeat(wait=NEXT_INTERVAL)
+        finally:
+            sender.cancel()
+            await asyncio.gather(sender, return_exceptions=True)
+        if not held:
+            await wait_results(NEXT_INTERVAL)
+    else:
+        await send_heartbeat()
+        await wait_results(NEXT_INTERVAL)
+
+# --- WEBSOCKET-КАНАЛ ---
+def get_ws_url():
+    base = AGENT_BASE_URL.rstrip("/")
+    if base.startswith("https://"):
+        base = "wss://" + base[len("https://"):]
+    elif base.startswith("http://"):
+        base = "ws://" + base[len("http://"):]
+    return f"{base}/api/node/ws"
+
+async def ws_send_results(ws):
+    global PENDING_RESULTS
+    results, PENDING_RESULTS = PENDING_RESULTS, []
+    try:
+        while results:
+            res = results[0]
+            text = res.get("result") or ""
+            if len(text) <= RESULT_CHUNK_SIZE:
+                await ws.send_json({"type": "result", **res})
+            else:
+                # Длинный вывод уходит частями, агент собирает его по id
+                result_id = secrets.token_hex(8)
+                for pos in range(0, len(text), RESULT_CHUNK_SIZE):
+                    await ws.send_json({
+                        "type": "result_chunk", "id": result_id,
+                        "command": res.get("command"), "user_id": res.get("user_id"),
+                        "data": text[pos:pos + RESULT_CHUNK_SIZE],
+                        "final": pos + RESULT_CHUNK_SIZE >= len(text)
+                    })
+            results.pop(0)
+    finally:
+        # Неотправленное уйдёт со следующим heartbeat (в т.ч. HTTP)
+        PENDING_RESULTS = results + PENDING_RESULTS
+
+async def ws_stats_loop(ws):
+    while not ws.closed:
+        await ws.send_json({"type": "stats", "stats": get_heartbeat_stats()})
+        # Переход в быстрый режим обрывает ожидание, следующий stats уходит сразу
+        INTERVAL_CHANGED.clear()
+        await wait_event(INTERVAL_CHANGED, NEXT_INTERVAL)
 
-def main():
-    logging.info(f"Node Agent started. Target: {AGENT_BASE_URL}")
-    psutil.cpu_percent(interval=None)
+async def ws_results_loop(ws):
+    while not ws.closed:
+        RESULTS_READY.clear()
+        await ws_send_results(ws)
+        await RESULTS_READY.wait()
 
+async def ws_session():
+    async with SESSION.ws_connect(get_ws_url(), heartbeat=30, timeout=10) as ws:
+        await ws.send_json({"type": "hello", "token": AGENT_TOKEN, "interval": UPDATE_INTERVAL})
+        logging.info("WebSocket channel established.")
+        maybe_replay_spool()
+        workers = [asyncio.create_task(ws_stats_loop(ws)), asyncio.create_task(ws_results_loop(ws))]
+        try:
+            async for msg in ws:
+                if msg.type != aiohttp.WSMsgType.TEXT:
+                    continue
+                data = json.loads(msg.data)
+                if data.get("type") == "tasks":
+                    for task in data.get("tasks", []):
+                        schedule_task(task)
+                elif data.get("type") == "interval":
+                    set_next_interval(data.get("interval"))
+        finally:
+            for worker in workers:
+                worker.cancel()
+            await asyncio.gather(*workers, return_exceptions=True)
+            set_next_interval(None)
+        logging.warning(f"WebSocket channel closed: {ws.close_code}")
+
+async def run_ws_transport():
+    backoff = 1
     while True:
-        send_heartbeat()
-        time.sleep(UPDATE_INTERVAL)
+        started = time.time()
+        fallback = backoff
+        try:
+            await ws_session()
+        except aiohttp.WSServerHandshakeError as e:
+            logging.error(f"WebSocket handshake failed ({e.status}), using HTTP heartbeat.")
+            if e.status in (404, 405):
+                fallback = WS_UNSUPPORTED_RETRY
+        except Exception as e:
+            logging.error(f"WebSocket error: {e}")
+
+        # Канал продержался долго — считаем сбой разовым
+        if time.time() - started > WS_MAX_BACKOFF:
+            backoff = 1
+            fallback = min(fallback, 1)
+        else:
+            backoff = min(backoff * 2, WS_MAX_BACKOFF)
+
+        # Пока канала нет, нода остаётся на связи через HTTP heartbeat
+        deadline = time.time() + fallback
+        while True:
+            await http_heartbeat_cycle()
+            if time.time() >= deadline:
+                break
+
+async def main():
+    global SESSION, TASK_SEMAPHORE, RESULTS_READY, INTERVAL_CHANGED
+    logging.info(f"Node Agent started. Target: {AGENT_BASE_URL} (transport: {TRANSPORT}, "
+                 f"long-poll: {'on' if LONGPOLL else 'off'}, max tasks: {MAX_CONCURRENT_TASKS}, "
+                 f"sampling: {f'{SAMPLE_INTERVAL:g}s' if SAMPLES is not None else 'off'})")
+    CPU_METER.measure()
+
+    TASK_SEMAPHORE = asyncio.Semaphore(MAX_CONCURRENT_TASKS)
+    RESULTS_READY = asyncio.Event()
+    INTERVAL_CHANGED = asyncio.Event()
+    # systemd останавливает сервис через SIGTERM — отменяем команды вместе с их процессами
+    asyncio.get_running_loop().add_signal_handler(signal.SIGTERM, asyncio.current_task().cancel)
+
+    sampler = asyncio.create_task(sampler_loop()) if SAMPLES is not None else None
+
+    async with aiohttp.ClientSession() as session:
+        SESSION = session
+        try:
+            if TRANSPORT == "ws":
+                await run_ws_transport()
+            while True:
+                await http_heartbeat_cycle()
+        finally:
+            if sampler:
+                sampler.cancel()
+            if SPOOL_TASK is not None:
+                SPOOL_TASK.cancel()
+            for job in list(RUNNING_TASKS):
+                job.cancel()
+            await asyncio.gather(*RUNNING_TASKS, return_exceptions=True)
 
 if __name__ == "__main__":
-    main()
+    try:
+        asyncio.run(main())
+    except (KeyboardInterrupt, asyncio.CancelledError):
+        logging.info("Node Agent stopped.")
@@ -0,0 +1,207 @@
+"""
+Лёгкий сборщик системных метрик напрямую из /proc (только Linux).
+Общий для агента и ноды, поэтому без зависимостей от core/ и сторонних пакетов.
+
+Файлы /proc держатся открытыми и перечитываются через preadv с нулевого смещения
+в переиспользуемый буфер — без open/close и без объектов psutil на каждый замер.
+
+Бенчмарк против psutil: python procstat.py [итераций]
+"""
+import os
+import threading
+
+# Агент в Docker подставляет utils.get_host_path (/proc -> /proc_host или /host/proc)
+_path_resolver = None
+_FILES = {}
+_FILES_LOCK = threading.Lock()
+_BOOT_TIME = None
+
+# user nice system idle iowait irq softirq steal; guest уже входит в user/nice
+_CPU_FIELDS = 8
+_MEMINFO_KEYS = (b"MemTotal", b"MemFree", b"MemAvailable", b"Buffers", b"Cached")
+SECTOR_SIZE = 512
+
+
+def set_path_resolver(resolver):
+    """resolver(path) -> реальный путь; уже открытые файлы переоткрываются по новым путям."""
+    global _path_resolver
+    _path_resolver = resolver
+    close_all()
+
+
+def resolve_path(path):
+    if _path_resolver is not None:
+        return _path_resolver(path)
+    return path
+
+
+class ProcFile:
+    """Открытый файл /proc и буфер под его содержимое (растёт, если файл не поместился)."""
+
+    def __init__(self, path, bufsize=8192):
+        self.path = path
+        self.fd = os.open(path, os.O_RDONLY)
+        self.buf = bytearray(bufsize)
+        self.lock = threading.Lock()
+
+    def read(self):
+        with self.lock:
+            while True:
+                n = os.preadv(self.fd, [self.buf], 0)
+                if n < len(self.buf):
+                    return bytes(memoryview(self.buf)[:n])
+                self.buf = bytearray(len(self.buf) * 2)
+
+    def close(self):
+        try:
+            os.close(self.fd)
+        except OSError:
+            pass
+
+
+def _read(path):
+    f = _FILES.get(path)
+    if f is None:
+        with _FILES_LOCK:
+            f = _FILES.get(path)
+            if f is None:
+                f = _FILES[path] = ProcFile(resolve_path(path))
+    try:
+        return f.read()
+    except OSError:
+        # Файл пропал (перемонтирование и т.п.) — в следующий раз откроем заново
+        with _FILES_LOCK:
+            if _FILES.get(path) is f:
+                del _FILES[path]
+        f.close()
+        raise
+
+
+def close_all():
+    with _FILES_LOCK:
+        files = list(_FILES.values())
+        _FILES.clear()
+    for f in files:
+        f.close()
+
+
+def cpu_times():
+    """[(busy, total), ...] в тиках с момента загрузки: [0] — весь CPU, дальше по ядрам."""
+    result = []
+    for line in _read("/proc/stat").split(b"\n"):
+        # Строки cpu идут в начале файла
+        if not line.startswith(b"cpu"):
+            break
+        values = [int(v) for v in line.split()[1:_CPU_FIELDS + 1]]
+        total = sum(values)
+        idle = values[3] + (values[4] if len(values) > 4 else 0)
+        result.append((total - idle, total))
+    return result
+
+
+def _percent(busy, total):
+    if total <= 0:
+        return 0.0
+    return round(min(max(100.0 * busy / total, 0.0), 100.0), 1)
+
+
+class CpuMeter:
+    """
+    Загрузка CPU между вызовами, как psutil.cpu_percent(interval=None),
+    но у каждого потребителя свой предыдущий замер. Первый вызов — среднее с загрузки.
+    """
+
+    def __init__(self):
+        self.prev = None
+
+    def measure(self):
+        """(общая загрузка, [загрузка по ядрам]) в процентах."""
+        now = cpu_times()
+        prev = self.prev or [(0, 0)] * len(now)
+        self.prev = now
+        values = [_percent(b - pb, t - pt) for (b, t), (pb, pt) in zip(now, prev)]
+        return values[0], values[1:]
+
+    def percent(self):
+        return self.measure()[0]
+
+
+def boot_time():
+    global _BOOT_TIME
+    if _BOOT_TIME is None:
+        for line in _read("/proc/stat").split(b"\n"):
+            if line.startswith(b"btime"):
+                _BOOT_TIME = float(line.split()[1])
+                break
+    return _BOOT_TIME
+
+
+def uptime():
+    return float(_read("/proc/uptime").split()[0])
+
+
+def memory():
+    """{"total", "available", "percent"} — байты и процент, как у psutil.virtual_memory()."""
+    info = {}
+    for line in _read("/proc/meminfo").split(b"\n"):
+        key, _sep, rest = line.partition(b":")
+        if key in _MEMINFO_KEYS:
+            info[key] = int(rest.split()[0]) * 1024
+            if len(info) == len(_MEMINFO_KEYS):
+                break
+    total = info.get(b"MemTotal", 0)
+    available = info.get(b"MemAvailable")
+    if available is None:
+        # Ядра < 3.14 без MemAvailable
+        available = info.get(b"MemFree", 0) + info.get(b"Buffers", 0) + info.get(b"Cached", 0)
+    percent = round(100.0 * (total - available) / total, 1) if total else 0.0
+    return {"total": total, "available": available, "percent": percent}
+
+
+def net_io():
+    """{интерфейс: (rx_bytes, tx_bytes, rx_packets, tx_packets)}."""
+    result = {}
+    # Первые две строки — заголовок
+    for line in _read("/proc/net/dev").split(b"\n")[2:]:
+        name, sep, rest = line.partition(b":")
+        if not sep:
+            continue
+        v = rest.split()
+        result[name.strip().decode()] = (int(v[0]), int(v[8]), int(v[1]), int(v[9]))
+    return result
+
+
+def net_totals():
+    """(rx_bytes, tx_bytes) по всем интерфейсам, как psutil.net_io_counters()."""
+    rx = tx = 0
+    for counters in net_io().values():
+        rx += counters[0]
+        tx += counters[1]
+    return rx, tx
+
+
+def disk_io():
+    """{устройство: (reads, writes, read_bytes, write_bytes)}; неиспользуемые loop/ram пропускаются."""
+    result = {}
+    for line in _read("/proc/diskstats").split(b"\n"):
+        v = line.split()
+        if len(v) < 10:
+            continue
+        reads, writes = int(v[3]), int(v[7])
+        if not reads and not writes:
+            continue
+        result[v[2].decode()] = (reads, writes, int(v[5]) * SECTOR_SIZE, int(v[9]) * SECTOR_SIZE)
+    return result
+
+
+def load_avg():
+    # Те же значения, что в /proc/loadavg (не зависят от namespace), но без чтения файла
+    return os.getloadavg()
+
+
+def disk_usage(path="/"):
+    """Процент занятого места, как psutil.disk_usage(path).percent."""
+    st = os.statvfs(resolve_path(path))
+    used = (st.f_blocks - st.f_bfree) * st.f_frsize
+    avail = st.f_bavail * st.f_frsize
+    return round(100.0 * used / (used + avail), 1) if used + avail else 0.0
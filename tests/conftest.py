@@ -0,0 +1,62 @@
+import asyncio
+import importlib.util
+import logging
+import os
+import shutil
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+# core.config требует токен и админа при импорте
+os.environ.setdefault("TG_BOT_TOKEN", "1:test")
+os.environ.setdefault("TG_ADMIN_ID", "1")
+
+
+@pytest.fixture
+def run_db(tmp_path):
+    """
+    Запускает корутину-сценарий с пустой nodes.db во временном каталоге.
+    БД открывается и закрывается в том же event loop, что и сценарий.
+    """
+    from core import nodes_db
+
+    def run(scenario):
+        nodes_db.DB_PATH = str(tmp_path / "nodes.db")
+        nodes_db._REGISTRY.clear()
+        nodes_db._REGISTRY_LOADED = False
+        nodes_db._TASK_TOKENS.clear()
+        nodes_db._PENDING_HEARTBEATS.clear()
+        nodes_db._PENDING_METRICS.clear()
+
+        async def wrapper():
+            await nodes_db.init_db()
+            try:
+                return await scenario()
+            finally:
+                await nodes_db.close_db()
+        return asyncio.run(wrapper())
+    return run
+
+
+@pytest.fixture
+def node_agent(tmp_path, monkeypatch):
+    """
+    node/node.py, развёрнутый как на ноде: node/node.py + procstat.py + .env во временном каталоге.
+    Лог-файл ноды (/opt/tg-bot/...) подменяется выводом в stderr.
+    """
+    install = tmp_path / "node_install"
+    (install / "node").mkdir(parents=True)
+    shutil.copy(os.path.join(ROOT, "node", "node.py"), install / "node" / "node.py")
+    shutil.copy(os.path.join(ROOT, "procstat.py"), install / "procstat.py")
+    (install / ".env").write_text(
+        "AGENT_BASE_URL=http://127.0.0.1:1\n"
+        "AGENT_TOKEN=test\n"
+        f"NODE_SPOOL_FILE={install / 'node_spool.jsonl'}\n")
+    monkeypatch.setattr(logging, "FileHandler", lambda *args, **kwargs: logging.StreamHandler())
+    monkeypatch.setattr(sys, "path", list(sys.path))
+    spec = importlib.util.spec_from_file_location("node_agent", install / "node" / "node.py")
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
@@ -0,0 +1,36 @@
+import time
+
+from core import alert_rules, nodes_db
+
+
+def test_below_threshold_rules_do_not_use_exceeded_texts():
+    low = alert_rules.parse_rule("cpu < 5 for 1m clear 10")
+    high = alert_rules.parse_rule("cpu > 90")
+    node = ("token", "web-1")
+
+    text = alert_rules.render_event("en", ("fired", low, node, 2.0))
+    assert "rule triggered" in text
+    assert "cpu &lt; 5 for 60s clear 10" in text
+    assert "High CPU" in alert_rules.render_event("en", ("fired", high, node, 95.0))
+    assert "rule triggered" in alert_rules.render_event(
+        "en", ("fired", alert_rules.parse_rule("disk <= 1"), (alert_rules.AGENT_TARGET, None), 0.5))
+
+
+def test_restored_pending_state_older_than_eval_interval_is_dropped(run_db, monkeypatch):
+    monkeypatch.setattr(alert_rules, "_STATES", {})
+    monkeypatch.setattr(alert_rules, "_STATES_LOADED", False)
+    rule = alert_rules.parse_rule("cpu > 90 for 5m")
+    now = time.time()
+
+    async def scenario():
+        await nodes_db.save_alert_states([
+            (rule.id, "stale", 0, now - 3600, None, None),
+            (rule.id, "fresh", 0, now - 1, None, None),
+            (rule.id, "firing", 1, now - 3600, now - 3000, now - 3000)])
+        await alert_rules._load_states([rule])
+        return sorted(row["target"] for row in await nodes_db.load_alert_states())
+
+    assert run_db(scenario) == ["firing", "fresh"]
+    # Отсчёт for после долгого простоя начнётся заново, активный алерт сохраняется
+    assert set(alert_rules._STATES[rule.id]) == {"fresh", "firing"}
+    assert alert_rules._STATES[rule.id]["firing"][0] is True
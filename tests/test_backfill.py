@@ -0,0 +1,119 @@
+import asyncio
+import os
+import time
+
+import aiohttp
+from aiohttp import web
+from aiohttp.test_utils import TestServer
+
+from core import nodes_db, rollups, server
+
+STEP = 10
+
+
+def _stats(cpu):
+    return {"cpu": cpu, "ram": 50.0, "disk": 40.0, "net_rx": 1000, "net_tx": 2000}
+
+
+async def _minute_buckets(token):
+    async with nodes_db.read_db() as db:
+        async with db.execute(
+                "SELECT t, n, cpu_avg FROM node_metrics_1m WHERE token = ? ORDER BY t", (token,)) as cursor:
+            return {row["t"]: (row["n"], row["cpu_avg"]) for row in await cursor.fetchall()}
+
+
+async def _start_stand_in_agent(state):
+    """Агент-заглушка на настоящих обработчиках сервера; state["down"] имитирует недоступность."""
+    async def heartbeat(request):
+        if state["down"]:
+            return web.json_response({"error": "down"}, status=503)
+        return await server.handle_heartbeat(request)
+
+    app = web.Application()
+    app.router.add_post("/api/heartbeat", heartbeat)
+    app.router.add_post("/api/node/backfill", server.handle_node_backfill)
+    test_server = TestServer(app)
+    await test_server.start_server()
+    return test_server
+
+
+def test_spool_replay_backfills_without_duplicates_or_partial_rollups(run_db, node_agent):
+    async def scenario():
+        token = await nodes_db.create_node("stand-in")
+        now = time.time()
+        # Интервал base..base+60: первая половина пришла до сбоя, вторая — из спула
+        base = int(now // 60) * 60 - 600
+        before = range(base - 60, base + 30, STEP)
+        spooled = range(base + 30, base + 60, STEP)
+        for t in before:
+            nodes_db.queue_metric(token, _stats(10.0), t)
+        await nodes_db.flush_heartbeats()
+        await rollups.rollup_once(now)
+        assert (await _minute_buckets(token))[base - 60] == (6, 10.0)
+        assert (await _minute_buckets(token))[base][0] == 3
+
+        state = {"down": True}
+        agent = await _start_stand_in_agent(state)
+        node_agent.AGENT_BASE_URL = str(agent.make_url("")).rstrip("/")
+        node_agent.AGENT_TOKEN = token
+        node_agent.RESULTS_READY = asyncio.Event()
+        node_agent.INTERVAL_CHANGED = asyncio.Event()
+        node_agent.SPOOL_NEXT_TRY = 0
+        try:
+            async with aiohttp.ClientSession() as session:
+                node_agent.SESSION = session
+                # Агент лежит: heartbeat не проходит, точка уходит в спул
+                assert await node_agent.send_heartbeat() is False
+                assert node_agent.SPOOL_PENDING
+                with open(node_agent.SPOOL_FILE) as f:
+                    assert len(f.readlines()) == 1
+                # Точки интервала base..base+60, накопленные за время сбоя
+                os.remove(node_agent.SPOOL_FILE)
+                for t in spooled:
+                    node_agent.spool_stats(_stats(30.0), t)
+
+                state["down"] = False
+                await node_agent.send_heartbeat()
+                await node_agent.SPOOL_TASK
+                assert not node_agent.SPOOL_PENDING
+                assert not os.path.exists(node_agent.SPOOL_FILE)
+
+                # Повторная выгрузка того же спула не создаёт дублей
+                for t in spooled:
+                    node_agent.spool_stats(_stats(30.0), t)
+                node_agent.maybe_replay_spool()
+                await node_agent.SPOOL_TASK
+        finally:
+            await agent.close()
+
+        await nodes_db.flush_heartbeats()
+        async with nodes_db.read_db() as db:
+            async with db.execute(
+                    "SELECT COUNT(*) AS n FROM node_metrics WHERE token = ? AND t >= ? AND t < ?",
+                    (token, base - 60, base + 60)) as cursor:
+                assert (await cursor.fetchone())["n"] == 12
+
+        await rollups.rollup_once(now)
+        buckets = await _minute_buckets(token)
+        # Соседний интервал не пересчитан по половине точек, а дополненный — целиком
+        assert buckets[base - 60] == (6, 10.0)
+        assert buckets[base] == (6, 20.0)
+
+    run_db(scenario)
+
+
+def test_invalidate_watermark_aligns_to_each_tier(run_db):
+    async def scenario():
+        async with nodes_db.write_db() as db:
+            for name in ("1m", "1h", "1d"):
+                await db.execute(
+                    "INSERT INTO rollup_state (tier, done_until) VALUES (?, ?)", (name, 10 * 86400))
+        since = 3 * 86400 + 2 * 3600 + 5 * 60 + 17
+        await rollups.invalidate_watermark(since)
+        marks = {name: await rollups._get_watermark(name) for name in ("1m", "1h", "1d")}
+        assert marks == {
+            "1m": since // 60 * 60,
+            "1h": since // 3600 * 3600,
+            "1d": since // 86400 * 86400}
+
+    run_db(scenario)
@@ -0,0 +1,46 @@
+import asyncio
+
+from core import config, digest
+
+
+def _event(n):
+    return lambda lang: f"event {n}"
+
+
+def _digest_text(lang, params, seconds):
+    return f"{len(params)} events in {seconds}s"
+
+
+def test_digest_window_extends_while_events_arrive_up_to_cap(monkeypatch):
+    clock = [1000.0]
+    monkeypatch.setattr(digest.time, "monotonic", lambda: clock[0])
+    monkeypatch.setattr(config, "ALERT_DIGEST_WINDOW", 60)
+    monkeypatch.setattr(config, "ALERT_HOURLY_CAP", 0)
+    monkeypatch.setattr(digest, "_PENDING", {})
+    sent = []
+
+    async def fake_send(bot, message, alert_type):
+        sent.append(message("en"))
+    monkeypatch.setattr(digest, "send_alert", fake_send)
+
+    async def scenario():
+        await digest.add_event(None, "bans", "bans", _event(0), 0, _digest_text)
+        assert sent == ["event 0"]
+        # Событие каждые 30 с: окно продлевается, пока не упрётся в MAX_WINDOWS окон
+        for n in range(1, 20):
+            clock[0] += 30
+            await digest.add_event(None, "bans", "bans", _event(n), n, _digest_text)
+            await digest._flush_due()
+            if len(sent) > 1:
+                break
+        return n
+
+    n = asyncio.run(scenario())
+    cap = 60 * digest.MAX_WINDOWS
+    assert sent[1] == f"{n} events in {cap}s"
+    assert clock[0] - 1000.0 == cap
+
+    # После дайджеста окно начинается заново, без событий — закрывается
+    clock[0] += 61
+    asyncio.run(digest._flush_due())
+    assert digest._PENDING == {}
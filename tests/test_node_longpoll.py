@@ -0,0 +1,55 @@
+import asyncio
+import time
+
+import aiohttp
+from aiohttp import web
+from aiohttp.test_utils import TestServer
+
+PARK = 3
+
+
+async def _start_parking_agent(received):
+    """Агент-заглушка: держит long-poll запрос PARK секунд, запоминает время прихода результатов."""
+    async def heartbeat(request):
+        data = await request.json()
+        for result in data.get("results", []):
+            received.append((result, time.monotonic()))
+        if data.get("wait"):
+            await asyncio.sleep(PARK)
+            return web.json_response({"tasks": [], "interval": PARK, "wait": PARK})
+        return web.json_response({"tasks": [], "interval": PARK})
+
+    app = web.Application()
+    app.router.add_post("/api/heartbeat", heartbeat)
+    test_server = TestServer(app)
+    await test_server.start_server()
+    return test_server
+
+
+def test_results_ready_during_parked_longpoll_are_sent_immediately(node_agent):
+    async def scenario():
+        received = []
+        agent = await _start_parking_agent(received)
+        node_agent.AGENT_BASE_URL = str(agent.make_url("")).rstrip("/")
+        node_agent.LONGPOLL = True
+        node_agent.NEXT_INTERVAL = PARK
+        node_agent.RESULTS_READY = asyncio.Event()
+        node_agent.INTERVAL_CHANGED = asyncio.Event()
+        try:
+            async with aiohttp.ClientSession() as session:
+                node_agent.SESSION = session
+                cycle = asyncio.create_task(node_agent.http_heartbeat_cycle())
+                await asyncio.sleep(0.5)
+                # Результат команды готов, пока запрос припаркован у агента
+                ready_at = time.monotonic()
+                node_agent.PENDING_RESULTS.append({"id": 1, "output": "ok"})
+                node_agent.RESULTS_READY.set()
+                await cycle
+        finally:
+            await agent.close()
+
+        assert [result for result, _t in received] == [{"id": 1, "output": "ok"}]
+        assert received[0][1] - ready_at < 1
+        assert node_agent.PENDING_RESULTS == []
+
+    asyncio.run(scenario())
@@ -0,0 +1,44 @@
+from core import nodes_db, server
+
+
+class _BrokenSocket:
+    """WebSocket, оборвавшийся в момент отправки задач."""
+    closed = False
+
+    def __init__(self):
+        self.sent = []
+
+    async def send_json(self, data):
+        self.sent.append(data)
+        if data.get("type") == "tasks":
+            self.closed = True
+            raise ConnectionResetError("Cannot write to closing transport")
+
+
+async def _task_rows(token):
+    async with nodes_db.read_db() as db:
+        async with db.execute(
+                "SELECT id, command, user_id, created_at, priority, expires_at FROM node_tasks "
+                "WHERE token = ? ORDER BY id", (token,)) as cursor:
+            return [dict(r) for r in await cursor.fetchall()]
+
+
+def test_failed_ws_push_requeues_tasks_with_all_columns(run_db):
+    async def scenario():
+        token = await nodes_db.create_node("ws")
+        await nodes_db.update_node_task(token, {"command": "uptime", "user_id": 7}, priority=1, ttl=600)
+        await nodes_db.update_node_task(token, {"command": "top", "user_id": 8})
+        before = await _task_rows(token)
+
+        ws = _BrokenSocket()
+        try:
+            await server._node_ws_push_tasks(ws, token, {"requested": None, "sent": None})
+        except ConnectionResetError:
+            pass
+        assert ws.sent[-1]["tasks"] == [
+            {"command": "uptime", "user_id": 7}, {"command": "top", "user_id": 8}]
+        # Задачи вернулись как были: приоритет, срок жизни, время создания и порядок
+        assert await _task_rows(token) == before
+        assert await nodes_db.claim_node_tasks(token) == ws.sent[-1]["tasks"]
+
+    run_db(scenario)
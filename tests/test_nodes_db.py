@@ -0,0 +1,91 @@
+import asyncio
+
+from core import nodes_db
+
+
+async def _count_nodes():
+    async with nodes_db.read_db() as db:
+        async with db.execute("SELECT COUNT(*) AS n FROM nodes") as cursor:
+            return (await cursor.fetchone())["n"]
+
+
+def test_cancelled_write_does_not_leak_into_next_commit(run_db):
+    async def scenario():
+        started = asyncio.Event()
+
+        async def interrupted():
+            async with nodes_db.write_db() as db:
+                await db.execute("INSERT INTO nodes (token, name) VALUES ('leak', 'leak')")
+                started.set()
+                await asyncio.sleep(3600)
+
+        task = asyncio.create_task(interrupted())
+        await started.wait()
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+        # Следующая транзакция писателя не должна закоммитить чужой INSERT
+        await nodes_db.update_nodes_extra([])
+        async with nodes_db.write_db() as db:
+            await db.execute("UPDATE nodes SET name = name")
+        assert await _count_nodes() == 0
+
+    run_db(scenario)
+
+
+def _without_version(nodes):
+    return {token: {k: v for k, v in node.items() if k != "version"} for token, node in nodes.items()}
+
+
+async def _registry_from_db():
+    """Текущий реестр и реестр, заново прочитанный из БД, без служебного поля version."""
+    cached = await nodes_db.get_all_nodes()
+    nodes_db._REGISTRY_LOADED = False
+    loaded = await nodes_db.get_all_nodes()
+    return _without_version(cached), _without_version(loaded)
+
+
+def test_registry_matches_db_after_create_heartbeat_delete(run_db):
+    async def scenario():
+        alive = await nodes_db.create_node("alive")
+        idle = await nodes_db.create_node("idle")
+        doomed = await nodes_db.create_node("doomed")
+
+        nodes_db.queue_heartbeat(alive, "10.0.0.1", {"cpu": 12.5, "ram": 40.0})
+        await nodes_db.update_node_heartbeat(doomed, "10.0.0.3", {"cpu": 1.0})
+        await nodes_db.update_node_extra(alive, "interval", 30)
+        # Heartbeat удалённой ноды, ещё лежащий в буфере, не должен её воскресить
+        nodes_db.queue_heartbeat(doomed, "10.0.0.3", {"cpu": 2.0})
+        version = nodes_db.get_registry_version()
+        await nodes_db.delete_node(doomed)
+        assert nodes_db.get_registry_version() > version
+        await nodes_db.flush_heartbeats()
+
+        cached, loaded = await _registry_from_db()
+        assert cached == loaded
+        assert set(loaded) == {alive, idle}
+        assert loaded[alive]["ip"] == "10.0.0.1"
+        assert loaded[alive]["stats"] == {"cpu": 12.5, "ram": 40.0}
+        assert loaded[alive]["interval"] == 30
+        assert loaded[idle]["last_seen"] == 0
+        async with nodes_db.read_db() as db:
+            async with db.execute("SELECT COUNT(*) AS n FROM node_metrics WHERE token = ?", (doomed,)) as cursor:
+                assert (await cursor.fetchone())["n"] == 0
+
+    run_db(scenario)
+
+
+def test_heartbeat_bumps_only_its_node_version(run_db):
+    async def scenario():
+        first = await nodes_db.create_node("first")
+        second = await nodes_db.create_node("second")
+        before = {t: nodes_db.get_node_version(t) for t in (first, second)}
+        nodes_db.queue_heartbeat(first, "10.0.0.1", {"cpu": 3.0})
+        # Реестр обновлён сразу, до записи буфера в БД
+        assert (await nodes_db.get_node_by_token(first))["stats"] == {"cpu": 3.0}
+        assert nodes_db.get_node_version(first) > before[first]
+        assert nodes_db.get_node_version(second) == before[second]
+        await nodes_db.flush_heartbeats()
+        cached, loaded = await _registry_from_db()
+        assert cached == loaded
+
+    run_db(scenario)
@@ -0,0 +1,23 @@
+import asyncio
+import time
+
+from core import nodes_db, sampler
+
+
+def test_get_or_sample_measures_when_no_fresh_snapshot(monkeypatch):
+    monkeypatch.setattr(sampler, "AGENT_HISTORY", [])
+    monkeypatch.setattr(nodes_db, "_PENDING_METRICS", [])
+    # Сэмплер ещё не стартовал
+    monkeypatch.setattr(sampler, "SNAPSHOT", None)
+    snap = asyncio.run(sampler.get_or_sample())
+    assert snap is sampler.SNAPSHOT
+    assert abs(snap.t - time.time()) < 5
+    assert len(sampler.AGENT_HISTORY) == 1
+
+    # Снимок устарел (поток завис) — тоже разовый замер, а не ошибка
+    stale = snap._replace(t=snap.t - 10 * sampler.MAX_SNAPSHOT_AGE)
+    monkeypatch.setattr(sampler, "SNAPSHOT", stale)
+    assert asyncio.run(sampler.get_or_sample()).t > stale.t
+
+    # Свежий снимок отдаётся как есть
+    assert asyncio.run(sampler.get_or_sample()) is sampler.SNAPSHOT
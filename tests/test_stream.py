@@ -0,0 +1,55 @@
+import asyncio
+
+from core import nodes_db, server
+
+
+def test_node_updates_are_batched_into_one_message_per_tick(run_db):
+    async def scenario():
+        tokens = [await nodes_db.create_node(f"n{i}") for i in range(server.STREAM_QUEUE_SIZE + 10)]
+        for token in tokens:
+            await nodes_db.update_node_heartbeat(token, "127.0.0.1", {"cpu": 5.0, "ram": 10.0})
+        queue = asyncio.Queue(maxsize=server.STREAM_QUEUE_SIZE)
+        server.STREAM_CLIENTS.add(queue)
+        broadcaster = asyncio.create_task(server.stream_broadcaster())
+        try:
+            await asyncio.sleep(server.STREAM_TICK / 2)
+        finally:
+            broadcaster.cancel()
+            await asyncio.gather(broadcaster, return_exceptions=True)
+            server.STREAM_CLIENTS.discard(queue)
+
+        messages = [queue.get_nowait() for _ in range(queue.qsize())]
+        # Сотни изменившихся нод за тик не переполняют очередь клиента
+        assert None not in messages
+        assert len(messages) <= server.STREAM_EVENTS_PER_TICK
+        delta = [m for m in messages if m.startswith(b"event: nodes_delta\n")]
+        assert len(delta) == 1
+        assert delta[0].count(b'"token"') == len(tokens)
+
+    run_db(scenario)
+
+
+def test_agent_stream_sends_full_history_once_then_only_new_points(run_db, monkeypatch):
+    history = [{"t": 1000 + i, "c": 1.0, "r": 2.0, "rx": 0, "tx": 0} for i in range(60)]
+    monkeypatch.setattr(server, "AGENT_HISTORY", history)
+    monkeypatch.setattr(server, "STREAM_TICK", 0.05)
+
+    async def scenario():
+        queue = asyncio.Queue(maxsize=server.STREAM_QUEUE_SIZE)
+        server.STREAM_CLIENTS.add(queue)
+        broadcaster = asyncio.create_task(server.stream_broadcaster())
+        try:
+            await asyncio.sleep(0.02)
+            history.append({"t": 1060, "c": 3.0, "r": 4.0, "rx": 0, "tx": 0})
+            await asyncio.sleep(0.1)
+        finally:
+            broadcaster.cancel()
+            await asyncio.gather(broadcaster, return_exceptions=True)
+            server.STREAM_CLIENTS.discard(queue)
+        return [queue.get_nowait() for _ in range(queue.qsize())]
+
+    deltas = [m for m in run_db(scenario) if m.startswith(b"event: agent_delta\n")]
+    assert len(deltas) == 2
+    # Каждое событие — только новые точки, а не вся история
+    assert all(m.count(b'"t":') == 1 for m in deltas)
+    assert b'"t":1060' in deltas[1]
@@ -30,6 +30,7 @@ try:
     from core import config
     from core.i18n import get_text
     from core.utils import escape_html
+    from core.logfollow import read_last_lines
 except ImportError as e:
     print(f"FATAL: Could not import core modules: {e}")
     print("Ensure watchdog.py is run from the correct directory (/opt-tg-bot) and venv.")
@@ -239,18 +240,14 @@ def check_bot_log_for_errors():
                     f"Лог-файл бота {os.path.basename(current_bot_log_file)} (и вчерашний) не найден. Не могу проверить на ошибки.")
                 return None, {}
 
-        result = subprocess.run(
-            ['tail', '-n', '20', current_bot_log_file],
-            capture_output=True, text=True, check=False, encoding='utf-8', errors='ignore'
-        )
-
-        if result.returncode != 0:
+        try:
+            log_content = "\n".join(read_last_lines(current_bot_log_file, 20))
+        except OSError as e:
             logging.error(
-                f"Не удалось прочитать {os.path.basename(current_bot_log_file)} через tail: {result.stderr}")
+                f"Не удалось прочитать {os.path.basename(current_bot_log_file)}: {e}")
             return "watchdog_log_read_error", {
-                "error": result.stderr or "Unknown error"}
+                "error": escape_html(str(e))}
 
-        log_content = result.stdout
         log_content_lower = log_content.lower()
 
         if "critical" in log_content_lower or "error" in log_content_lower: